@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Asyncio TCP broadcast server
+#  runs in a thread of the acquisition process, so messages are handed over
+#  without pickling. Each client has its own bounded queue and writer, all
+#  the queued messages go out in a single writelines call. A client may send
+#  a subscribe line to get only part of the packages (subscription.py).
+########################################################
+
+import socket
+import asyncio
+import threading
+from time import monotonic_ns
+from collections import deque
+
+from subscription import Subscription, select_messages, PREFIX
+
+# what to do with a client whose queue is full
+POLICIES = ('drop', 'disconnect')
+
+
+################# Classe Client ########################################
+class Client:
+  def __init__(self, writer, max_pending):
+    self.writer = writer
+    self.pending = deque()
+    self.max_pending = max_pending
+    self.ready = asyncio.Event()
+    self.drops = 0
+    self.sent = 0
+    self.closed = False
+    self.subscription = None
+    # receive time of the oldest message waiting, when the latency is traced
+    self.oldest = None
+
+  # returns False when the client must be disconnected
+  def push(self, msgs, policy, stamp=None):
+    pending = self.pending
+    excess = len(pending) + len(msgs) - self.max_pending
+    if excess > 0:
+      if policy == 'disconnect':
+        return False
+      # drop the oldest messages, queued ones first
+      self.drops += excess
+      queued = min(excess, len(pending))
+      for _ in range(queued):
+        pending.popleft()
+      if excess > queued:
+        msgs = msgs[excess - queued:]
+    pending.extend(msgs)
+    if stamp is not None and self.oldest is None:
+      self.oldest = stamp
+    self.ready.set()
+    return True
+
+################## Fim da classe Client ################################
+
+
+################# Classe AsyncTCPServer ########################################
+# max_pending: messages queued per client before the slow client policy
+# policy: 'drop' discards the oldest messages, 'disconnect' closes the client
+# buffer_size: bytes the socket transport holds before the writer waits
+# latency: a metrics.Histogram of the time from the receive time of the
+#          oldest message a client waits for to its write to the socket
+class AsyncTCPServer (threading.Thread):
+  def __init__(self, port, max_pending=4096, policy='drop', buffer_size=1 << 16, verbose=False, latency=None):
+    threading.Thread.__init__(self)
+    if policy not in POLICIES:
+      raise ValueError('unknown slow client policy: %s' % (policy))
+    self.daemon = True
+    self.port = port
+    self.max_pending = max_pending
+    self.policy = policy
+    self.buffer_size = buffer_size
+    self.verbose = verbose
+    self.latency = latency
+    self.clients = set()
+    # messages sent to and dropped for the clients that left, the totals keep
+    # growing when a client disconnects, the lock keeps stats from seeing a
+    # client in both or in neither
+    self.sent = 0
+    self.drops = 0
+    self.clients_lock = threading.Lock()
+    self.incoming = deque()
+    # receive time of the oldest message in incoming
+    self.incoming_stamp = None
+    self.scheduled = False
+    self.loop = None
+    self.server = None
+    self.started = threading.Event()
+
+  def run(self):
+    self.loop = asyncio.new_event_loop()
+    try:
+      self.loop.run_until_complete(self.serve())
+    except Exception as er:
+      print(str(er))
+    finally:
+      self.started.set()
+      self.loop.close()
+
+  async def serve(self):
+    self.server = await asyncio.start_server(self.handle, '', self.port)
+    print("TCP server running")
+    self.started.set()
+    async with self.server:
+      try:
+        await self.server.serve_forever()
+      except asyncio.CancelledError:
+        pass
+    # let the client tasks finish before the loop is closed
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    for task in tasks:
+      task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+  async def handle(self, reader, writer):
+    address = writer.get_extra_info('peername')
+    print('new connection from', address)
+    sock = writer.get_extra_info('socket')
+    if sock is not None:
+      sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    writer.transport.set_write_buffer_limits(high=self.buffer_size)
+    client = Client(writer, self.max_pending)
+    self.clients.add(client)
+    sender = asyncio.ensure_future(self.send(client))
+    try:
+      # only subscribe lines are expected from the clients, until the end of
+      # the connection
+      while True:
+        line = await reader.readline()
+        if not line:
+          break
+        if line.startswith(PREFIX):
+          self.subscribe(client, line, address)
+    except (OSError, ValueError, asyncio.CancelledError):
+      pass
+    print('closing', address)
+    self.remove(client)
+    sender.cancel()
+
+  async def send(self, client):
+    writer = client.writer
+    try:
+      while True:
+        await client.ready.wait()
+        client.ready.clear()
+        batch = list(client.pending)
+        client.pending.clear()
+        writer.writelines(batch)
+        client.sent += len(batch)
+        if client.oldest is not None:
+          self.latency.add(monotonic_ns() - client.oldest)
+          client.oldest = None
+        await writer.drain()
+    except (OSError, asyncio.CancelledError):
+      self.remove(client)
+
+  def subscribe(self, client, line, address):
+    try:
+      client.subscription = Subscription.parse(line)
+    except ValueError as er:
+      print('invalid subscription from', address, str(er))
+    else:
+      if self.verbose:
+        print('subscription "%s" from %s' % (line.decode('ascii', 'replace').strip(), address))
+
+  def remove(self, client):
+    if client.closed:
+      return
+    client.closed = True
+    with self.clients_lock:
+      self.sent += client.sent
+      self.drops += client.drops
+      self.clients.discard(client)
+    client.writer.close()
+
+  # runs in the loop, moves the messages from the acquisition thread to the
+  # clients queues
+  def dispatch(self):
+    stamp = self.incoming_stamp
+    self.scheduled = False
+    incoming = self.incoming
+    msgs = []
+    while incoming:
+      msgs.append(incoming.popleft())
+    if not msgs:
+      return
+    selected = select_messages(msgs, {client: client.subscription for client in self.clients})
+    for client, client_msgs in selected.items():
+      if client_msgs and not client.push(client_msgs, self.policy, stamp):
+        if self.verbose:
+          print('disconnecting slow client', client.writer.get_extra_info('peername'))
+        self.remove(client)
+
+  # called from the acquisition thread, the loop is woken once per batch.
+  # stamp: receive time of the message (monotonic ns), taken now when the
+  # latency is traced and there is none
+  def add_message(self, msg, stamp=None):
+    if msg and self.loop is not None:
+      self.incoming.append(msg)
+      if not self.scheduled:
+        self.scheduled = True
+        if self.latency is not None:
+          self.incoming_stamp = stamp or monotonic_ns()
+        try:
+          self.loop.call_soon_threadsafe(self.dispatch)
+        except RuntimeError:
+          # the loop is closed
+          pass
+
+  # counters for metrics.Metrics, read from the acquisition thread
+  # sent and drops count every client since the start
+  def stats(self):
+    with self.clients_lock:
+      clients = list(self.clients)
+      sent = self.sent + sum(c.sent for c in clients)
+      drops = self.drops + sum(c.drops for c in clients)
+    backlog = [len(c.pending) for c in clients]
+    return {'clients': len(clients), 'incoming': len(self.incoming),
+            'sent': sent, 'drops': drops,
+            'backlog': sum(backlog), 'backlog_max': max(backlog, default=0)}
+
+  # runs in the loop, stops accepting and closes every client
+  def shutdown(self):
+    self.server.close()
+    for client in list(self.clients):
+      self.remove(client)
+
+  def terminate(self):
+    if self.loop is not None and self.server is not None:
+      try:
+        self.loop.call_soon_threadsafe(self.shutdown)
+      except RuntimeError:
+        pass
+
+################## Fim da classe AsyncTCPServer ################################
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Batch validation of many frames at once with NumPy
+#  a frame here is the same buffer given to pslog.check_package: the length
+#  byte, the data and the two checksum bytes, without the 0xFFFF header.
+########################################################
+
+import numpy as np
+
+
+#checksums of every row of a (frames x bytes) uint8 matrix
+def checksums(matrix):
+  cksum1 = np.bitwise_xor.reduce(matrix[:, :-2], axis=1) & 0xFE
+  cksum2 = ~cksum1 & 0xFE
+  return cksum1, cksum2
+
+
+#validate a matrix where every row is one frame of the same size
+def check_matrix(matrix):
+  matrix = np.asarray(matrix, dtype=np.uint8)
+  if matrix.ndim != 2:
+    raise ValueError('frame matrix must have 2 dimensions')
+  if matrix.shape[1] <= 2:
+    return np.zeros(matrix.shape[0], dtype=bool)
+  cksum1, cksum2 = checksums(matrix)
+  return (cksum1 == matrix[:, -2]) & (cksum2 == matrix[:, -1])
+
+
+#validate a list of frames of any size (bytes, bytearray or memoryview)
+#the xor of each frame is taken from a running xor over all the frames
+#concatenated, so frames of different sizes are checked in the same pass
+def check_frames(frames):
+  lengths = np.fromiter(map(len, frames), dtype=np.int64, count=len(frames))
+  mask = lengths > 2
+  if not mask.any():
+    return mask
+  data = np.frombuffer(b''.join(frames), dtype=np.uint8)
+  ends = np.cumsum(lengths)
+  starts = ends - lengths
+  running = np.bitwise_xor.accumulate(data)
+
+  ends = ends[mask]
+  starts = starts[mask]
+  cksum1 = running[ends - 3]
+  first = starts > 0
+  cksum1[first] ^= running[starts[first] - 1]
+  cksum1 &= 0xFE
+  cksum2 = ~cksum1 & 0xFE
+  mask[mask] = (cksum1 == data[ends - 2]) & (cksum2 == data[ends - 1])
+  return mask
+
+
+#validate the frames that would start at each header position of data (uint8
+#array, 0xFFFF at data[p]), over the running xor of data
+#returns the positions that have a length byte in data, their length bytes,
+#a mask of the valid frames and a mask of the frames that end inside data
+#(the others can not be checked yet)
+def check_candidates(data, positions, running=None):
+  if running is None:
+    running = np.bitwise_xor.accumulate(data)
+  size = len(data)
+  positions = positions[positions + 2 < size]
+  lengths = data[positions + 2]
+  stops = positions + 2 + lengths
+  complete = stops <= size
+  valid = complete & (lengths >= 3)
+  checked = positions[valid]
+  last = stops[valid] - 1
+  # xor of the length byte and the data: data[p+2 .. stop-3]
+  cksum1 = (running[last - 2] ^ running[checked + 1]) & 0xFE
+  cksum2 = ~cksum1 & 0xFE
+  valid[valid] = (cksum1 == data[last - 1]) & (cksum2 == data[last])
+  return positions, lengths, valid, complete
+
+
+#validate frames given as a matrix or as a sequence of buffers
+#returns a boolean mask with True for each valid frame
+def check_packages(frames):
+  if isinstance(frames, np.ndarray):
+    return check_matrix(frames)
+  return check_frames(frames)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Loopback benchmark of the asyncio broadcast server
+#  the producer sends frames carrying their send time (monotonic ns), the
+#  N client connections are spread over a few processes that measure the
+#  delay of every frame, the latency percentiles of all clients are printed
+########################################################
+
+import os
+import sys
+import time
+import struct
+import asyncio
+import argparse
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from frame import encode_frame
+from aio_server import AsyncTCPServer
+
+
+def percentile(values, p):
+  if not values:
+    return float('nan')
+  return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+# all frames have the same size, so the send time is taken from every
+# complete frame of the chunk at once, the header is skipped by the format
+async def client(port, payload_size, latencies, connected):
+  reader, writer = await asyncio.open_connection('127.0.0.1', port)
+  connected.append(1)
+  record = struct.Struct('<3xQ%dx' % (payload_size - 8 + 2))
+  pending = b''
+  while True:
+    chunk = await reader.read(1 << 16)
+    if not chunk:
+      break
+    now = time.monotonic_ns()
+    pending += chunk
+    usable = len(pending) - len(pending) % record.size
+    latencies.extend(now - sent for sent, in record.iter_unpack(pending[:usable]))
+    pending = pending[usable:]
+  writer.close()
+
+
+def clients_process(port, nclients, payload_size, duration, results, ready):
+  async def main():
+    latencies = []
+    connected = []
+    tasks = [asyncio.ensure_future(client(port, payload_size, latencies, connected)) for _ in range(nclients)]
+    while len(connected) < nclients:
+      await asyncio.sleep(0.01)
+    ready.release()
+    await asyncio.wait(tasks, timeout=duration + 2)
+    results.put(latencies)
+  asyncio.run(main())
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='asyncio broadcast server latency with N clients')
+  parser.add_argument('-c', '--clients', type=int, default=8)
+  parser.add_argument('-r', '--rate', type=float, default=10000, help='frames per second')
+  parser.add_argument('-t', '--duration', type=float, default=3)
+  parser.add_argument('-s', '--payload_size', type=int, default=16)
+  parser.add_argument('-P', '--port', type=int, default=5399)
+  parser.add_argument('-j', '--processes', type=int, default=min(4, os.cpu_count()), help='client processes')
+  args = parser.parse_args()
+  args.payload_size = max(8, args.payload_size)
+
+  server = AsyncTCPServer(args.port)
+  server.start()
+  server.started.wait()
+  results = mp.Queue()
+  ready = mp.Semaphore(0)
+  processes = []
+  for n in range(args.processes):
+    nclients = args.clients // args.processes + (n < args.clients % args.processes)
+    if nclients:
+      processes.append(mp.Process(target=clients_process, args=(args.port, nclients, args.payload_size, args.duration, results, ready)))
+  for p in processes:
+    p.start()
+  for p in processes:
+    ready.acquire()
+  time.sleep(0.2)
+
+  padding = bytes(args.payload_size - 8)
+  period = 1.0 / args.rate
+  sent = 0
+  start = time.monotonic()
+  next_send = start
+  while time.monotonic() - start < args.duration:
+    server.add_message(encode_frame(struct.pack('<Q', time.monotonic_ns()) + padding))
+    sent += 1
+    next_send += period
+    delay = next_send - time.monotonic()
+    if delay > 0:
+      time.sleep(delay)
+  elapsed = time.monotonic() - start
+  time.sleep(0.5)
+  server.terminate()
+  latencies = []
+  for p in processes:
+    latencies.extend(results.get())
+  for p in processes:
+    p.join()
+  latencies.sort()
+
+  received = len(latencies)
+  print('%d clients, %d frames sent at %.0f frames/s, %d received (%.1f%%)' %
+        (args.clients, sent, sent / elapsed, received, 100.0 * received / max(1, sent * args.clients)))
+  print('latency us: p50 %.0f p90 %.0f p99 %.0f p99.9 %.0f max %.0f' %
+        tuple(percentile(latencies, p) / 1e3 for p in (50, 90, 99, 99.9, 100)))
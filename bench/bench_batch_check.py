@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Batch checksum validation against the per frame check_package
+#  the masks of both paths are compared before timing them
+########################################################
+
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pslog
+from frame import encode_frame
+from batch_check import check_packages
+
+pslog.verbose = False
+
+
+# frames as given to check_package: header removed, some of them corrupted
+def make_frames(count, sizes, corruption, seed=0):
+  rnd = random.Random(seed)
+  frames = []
+  for _ in range(count):
+    frame = bytearray(encode_frame(os.urandom(rnd.choice(sizes)))[2:])
+    if rnd.random() < corruption:
+      frame[rnd.randrange(len(frame))] ^= 1 << rnd.randrange(8)
+    frames.append(bytes(frame))
+  return frames
+
+
+def timed(function, *args):
+  start = time.perf_counter()
+  result = function(*args)
+  return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='check_package versus check_packages')
+  parser.add_argument('-n', '--frames', type=int, default=200000)
+  parser.add_argument('-s', '--payload_size', type=int, default=16)
+  parser.add_argument('-c', '--corruption', type=float, default=0.05)
+  args = parser.parse_args()
+
+  for name, sizes in (('fixed', [args.payload_size]), ('variable', list(range(0, 2 * args.payload_size)))):
+    frames = make_frames(args.frames, sizes, args.corruption)
+    single, t_single = timed(lambda f: np.array([pslog.check_package(b) for b in f]), frames)
+    batch, t_batch = timed(check_packages, frames)
+    assert (single == batch).all(), 'batch and single frame checks disagree'
+    print('%-8s list  : single %8.0f frames/s, batch %10.0f frames/s, %d invalid' %
+          (name, len(frames) / t_single, len(frames) / t_batch, (~batch).sum()))
+    if name == 'fixed':
+      matrix = np.frombuffer(b''.join(frames), dtype=np.uint8).reshape(len(frames), -1)
+      batch, t_batch = timed(check_packages, matrix)
+      assert (single == batch).all(), 'matrix and single frame checks disagree'
+      print('%-8s matrix: %35.0f frames/s' % (name, len(frames) / t_batch))
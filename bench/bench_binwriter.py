@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Sustained write throughput of the streaming binary writer
+########################################################
+
+import os
+import sys
+import time
+import struct
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from binwriter import BinaryWriter
+
+
+def run(directory, frames, payload, flush_frames, flush_ms):
+  filename = os.path.join(directory, 'bench.bin')
+  start = time.perf_counter()
+  with BinaryWriter(filename, flush_frames, flush_ms) as writer:
+    for _ in range(frames):
+      writer.write(payload)
+  elapsed = time.perf_counter() - start
+  with open(filename, 'rb') as f:
+    count, = struct.unpack('i', f.read(4))
+  assert count == frames and os.path.getsize(filename) == 4 + frames * len(payload)
+  os.remove(filename)
+  return elapsed
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='BinaryWriter sustained throughput')
+  parser.add_argument('-n', '--frames', type=int, default=1000000)
+  parser.add_argument('-s', '--payload_size', type=int, default=16)
+  parser.add_argument('-D', '--directory', type=str, default=None, help='where to write (default: a temporary directory)')
+  args = parser.parse_args()
+
+  payload = os.urandom(args.payload_size)
+  mb = args.frames * args.payload_size / 1e6
+  with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+    for flush_frames, flush_ms in ((0, 0), (0, 1000), (0, 100), (100000, 0), (10000, 0)):
+      elapsed = run(directory, args.frames, payload, flush_frames, flush_ms)
+      print('flush_frames %6d flush_ms %5d: %8.1f MB/s %10.0f frames/s' %
+            (flush_frames, flush_ms, mb / elapsed, args.frames / elapsed))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Console output: the old print per byte against the display modes
+#  the output goes to a pty, drained by a child process as a terminal would,
+#  or to a file with --output. Only the printing of the packages is timed.
+########################################################
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from console import Console, MODES
+from simulator import open_pty
+
+
+# the output of receive_data before the console
+def old_path(chunks, out):
+  stdout = sys.stdout
+  sys.stdout = out
+  i = 0
+  for chunk in chunks:
+    for data in chunk:
+      log_print = '%d-' % (i)
+      print(log_print, end=' ')
+      i += 1
+      print('Data:', end=' ')
+      for byte in data:
+        print(byte, end=' ')
+      print(' ')
+  sys.stdout = stdout
+
+
+def console_path(mode, refresh_hz):
+  def run(chunks, out):
+    console = Console(mode, refresh_hz, out)
+    i = 0
+    nbytes = 0
+    for chunk in chunks:
+      for data in chunk:
+        console.frame(i, data)
+        i += 1
+        nbytes += len(data) + 5
+      console.update(nbytes)
+    console.close()
+  return run
+
+
+def drain(master, slave):
+  os.close(slave)
+  try:
+    while os.read(master, 1 << 16):
+      pass
+  except OSError:
+    pass
+
+
+def timed(function, chunks, output):
+  if output:
+    out = open(output, 'w')
+  else:
+    master, slave, _ = open_pty()
+    child = mp.Process(target=drain, args=(master, slave))
+    child.start()
+    os.close(master)
+    # line buffered, as the stdout of a terminal
+    out = open(slave, 'w', buffering=1)
+  start = time.perf_counter()
+  function(chunks, out)
+  out.flush()
+  elapsed = time.perf_counter() - start
+  out.close()
+  if not output:
+    child.join()
+  return elapsed
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='printing speed of the display modes')
+  parser.add_argument('-n', '--frames', type=int, default=200000)
+  parser.add_argument('-s', '--payload_size', type=int, default=16)
+  parser.add_argument('-c', '--chunk_frames', type=int, default=64, help='packages per serial read')
+  parser.add_argument('--refresh_hz', type=int, default=10)
+  parser.add_argument('-o', '--output', type=str, default=None, help='write to this file instead of a pty')
+  args = parser.parse_args()
+
+  frames = [bytes([n % 256]) * args.payload_size for n in range(args.frames)]
+  chunks = [frames[i:i + args.chunk_frames] for i in range(0, len(frames), args.chunk_frames)]
+  paths = [('old print', old_path)] + [(mode, console_path(mode, args.refresh_hz)) for mode in MODES]
+  base = None
+  for name, function in paths:
+    elapsed = timed(function, chunks, args.output)
+    base = base or elapsed
+    print('%-10s %9.0f frames/s  x%.1f' % (name, args.frames / elapsed, base / elapsed))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Benchmark of the columnar export
+#  writes a legacy capture of the given size and converts it with export.py
+#  to every format whose module is installed, each run in its own process to
+#  measure its peak memory. The decode line is the numpy decoding alone.
+#  rss_max_kb counts the pages of the mapped capture, anon_max_kb is the
+#  memory the export really holds.
+#    $ bench/bench_export.py --mb 1024
+########################################################
+
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import resource
+import tempfile
+import threading
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import export
+from schema import Schema
+
+SCHEMA = '<IIffff time sequence x y z w'
+
+
+# a legacy capture of about mb megabytes, written a block at a time
+def make_capture(filename, schema, mb):
+  count = mb * 1000000 // schema.size
+  block = 1 << 20
+  with open(filename, 'wb') as f:
+    f.write(struct.pack('i', count))
+    for first in range(0, count, block):
+      n = min(block, count - first)
+      records = export.np.zeros(n, schema.dtype)
+      for k, name in enumerate(schema.names):
+        records[name] = export.np.arange(first, first + n) * (k + 1)
+      f.write(records.tobytes())
+  return count
+
+
+def decode(source, schema, rows):
+  total = 0.0
+  for data in export.record_chunks(source, schema, rows):
+    total += float(data[schema.names[-1]][-1])
+  return total
+
+
+# anonymous memory of this process in kB
+def rss_anon():
+  with open('/proc/self/status') as f:
+    for line in f:
+      if line.startswith('RssAnon:'):
+        return int(line.split()[1])
+  return 0
+
+
+def job(target, source, schema, rows, compression, conn):
+  peak = [rss_anon()]
+  done = threading.Event()
+  def sample():
+    while not done.wait(0.01):
+      peak[0] = max(peak[0], rss_anon())
+  sampler = threading.Thread(target=sample, daemon=True)
+  sampler.start()
+  start = time.perf_counter()
+  if target is None:
+    decode(source, schema, rows)
+  else:
+    export.export(source, target, schema, rows, compression)
+  elapsed = time.perf_counter() - start
+  done.set()
+  sampler.join()
+  conn.send({'seconds': elapsed, 'rss_max_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+             'anon_max_kb': peak[0]})
+
+
+def run(name, target, source, schema, args):
+  conn, child_conn = mp.Pipe(False)
+  process = mp.Process(target=job, args=(target, source, schema, args.rows, args.compression, child_conn))
+  process.start()
+  result = conn.recv()
+  process.join()
+  size = os.path.getsize(source)
+  result.update({'format': name, 'mb_per_s': size / result['seconds'] / 1e6,
+                 'output_mb': os.path.getsize(target) / 1e6 if target else None})
+  return result
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='columnar export benchmark')
+  parser.add_argument('--mb', type=int, default=256, help='size of the capture in MB')
+  parser.add_argument('--rows', type=int, default=export.CHUNK_ROWS)
+  parser.add_argument('-c', '--compression', type=str, default=None)
+  parser.add_argument('-o', '--output', type=str, default=None, help='JSON file for the results (default=stdout)')
+  args = parser.parse_args()
+
+  schema = Schema.parse(SCHEMA)
+  formats = [('decode', None)]
+  if export.h5py is not None:
+    formats.append(('hdf5', '.h5'))
+  if export.pyarrow is not None:
+    formats += [('parquet', '.parquet'), ('arrow', '.arrow')]
+
+  results = []
+  with tempfile.TemporaryDirectory() as directory:
+    source = os.path.join(directory, 'capture.bin')
+    count = make_capture(source, schema, args.mb)
+    for name, extension in formats:
+      target = os.path.join(directory, 'capture' + extension) if extension else None
+      result = run(name, target, source, schema, args)
+      results.append(result)
+      print('%-8s %6.2f s %8.1f MB/s rss max %d kB anon max %d kB' % (name, result['seconds'], result['mb_per_s'],
+            result['rss_max_kb'], result['anon_max_kb']), file=sys.stderr)
+      if target:
+        os.remove(target)
+
+  report = {'schema': SCHEMA, 'packages': count, 'mb': args.mb, 'rows': args.rows, 'results': results}
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2)
+  else:
+    print(json.dumps(report, indent=2))
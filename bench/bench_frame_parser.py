@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Throughput of the frame decoder on synthetic streams
+#  FrameParser on chunks of several sizes, and with --legacy the same stream
+#  read from a pty by the old receive_data loop (inWaiting and read(1) for
+#  each byte out of a frame) and by FrameParser on what each read returns
+#    $ bench/bench_frame_parser.py --legacy --legacy_mb 1
+########################################################
+
+import os
+import sys
+import time
+import random
+import argparse
+import multiprocessing as mp
+
+import serial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from frame import FrameParser, encode_frame, checksum
+from simulator import open_pty
+
+
+# build a stream of frames with random payloads, corrupting some of them
+def synthetic_stream(nbytes, payload_size, corruption, seed=0):
+  rnd = random.Random(seed)
+  frames = []
+  size = 0
+  while size < nbytes:
+    frame = bytearray(encode_frame(os.urandom(payload_size)))
+    if rnd.random() < corruption:
+      frame[rnd.randrange(3, len(frame))] ^= 0x5A
+    frames.append(bytes(frame))
+    size += len(frame)
+  return b''.join(frames)
+
+
+# writes the stream into the master side of a pty, blocking while the reader
+# has not taken what the pty holds
+def feed_pty(fd, stream):
+  view = memoryview(stream)
+  while view:
+    view = view[os.write(fd, view[:4096]):]
+
+
+# the old receive_data loop: wait for a byte with inWaiting, read(1) until
+# two 0xFF, then the length byte and the rest of the frame
+def legacy_read(ser, nbytes):
+  frames = 0
+  last = b'\x00'
+  consumed = 0
+  while consumed < nbytes:
+    num_bytes = 0
+    while not num_bytes:
+      num_bytes = ser.inWaiting()
+    buffer = ser.read(1)
+    consumed += 1
+    if buffer[0] == 0xFF and last[0] == 0xFF:
+      pack_size = ser.read(1)[0]
+      if num_bytes < 2 + pack_size:
+        num_bytes = 0
+        while num_bytes < pack_size - 1:
+          num_bytes = ser.inWaiting()
+      buffer = bytes([pack_size]) + (ser.read(pack_size - 1) if pack_size > 1 else b'')
+      consumed += len(buffer)
+      last = b'\x00'
+      if len(buffer) > 2 and checksum(buffer) == (buffer[-2], buffer[-1]):
+        frames += 1
+    else:
+      last = buffer
+  return frames
+
+
+# receive_data now: everything the port holds in one read, to FrameParser
+def parser_read(ser, nbytes):
+  parser = FrameParser()
+  while parser.bytes < nbytes:
+    for _ in parser.feed(ser.read(max(1, ser.in_waiting))):
+      pass
+  return parser.frames
+
+
+# frames and seconds of read (legacy_read or parser_read) on the stream
+# written to a pty by another process
+def run_serial(read, stream):
+  master, slave, device = open_pty()
+  ser = serial.Serial(device, timeout=None)
+  writer = mp.Process(target=feed_pty, args=(master, stream))
+  start = time.perf_counter()
+  writer.start()
+  frames = read(ser, len(stream))
+  elapsed = time.perf_counter() - start
+  writer.join()
+  ser.close()
+  os.close(master)
+  os.close(slave)
+  return frames, elapsed
+
+
+def run(stream, chunk):
+  parser = FrameParser()
+  start = time.perf_counter()
+  for pos in range(0, len(stream), chunk):
+    for _ in parser.feed(stream[pos:pos + chunk]):
+      pass
+  elapsed = time.perf_counter() - start
+  return parser.frames, elapsed
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='FrameParser throughput in MB/s')
+  parser.add_argument('-m', '--megabytes', type=float, default=16)
+  parser.add_argument('-s', '--payload_size', type=int, default=16)
+  parser.add_argument('-c', '--corruption', type=float, default=0.01)
+  parser.add_argument('--legacy', help='also read the stream from a pty with the old byte at a time loop and with FrameParser', action='store_true')
+  parser.add_argument('--legacy_mb', type=float, default=1, help='megabytes read from the pty with --legacy (default=1)')
+  args = parser.parse_args()
+
+  stream = synthetic_stream(int(args.megabytes * 1e6), args.payload_size, args.corruption)
+  mb = len(stream) / 1e6
+  print('stream: %.1f MB, payload %d bytes, corruption %.3f' % (mb, args.payload_size, args.corruption))
+  for chunk in (64, 1024, 4096, 65536):
+    frames, elapsed = run(stream, chunk)
+    print('chunk %6d: %8.1f MB/s %10.0f frames/s (%d frames)' % (chunk, mb / elapsed, frames / elapsed, frames))
+  if args.legacy:
+    stream = stream[:int(args.legacy_mb * 1e6)]
+    mb = len(stream) / 1e6
+    for name, read in (('pty legacy', legacy_read), ('pty parser', parser_read)):
+      frames, elapsed = run_serial(read, stream)
+      print('%-11s: %8.1f MB/s %10.0f frames/s (%d frames)' % (name, mb / elapsed, frames / elapsed, frames))
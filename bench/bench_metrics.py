@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Cost of the metrics on the acquisition hot path
+#  the loop of receive_data (parse, save, publish to nobody) over the same
+#  chunks with and without a Metrics object, plus the cost of a snapshot.
+#  bench_pslog.py -s receive,metrics measures the same end to end.
+########################################################
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from time import monotonic_ns
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from frame import FrameParser, encode_frame
+from binwriter import BinaryWriter
+from metrics import Metrics
+
+
+def receive(chunks, filename, metrics):
+  decoder = FrameParser()
+  writer = BinaryWriter(filename, metrics=metrics)
+  if metrics:
+    metrics.register('parser', lambda: {'bytes': decoder.bytes, 'frames': decoder.frames, 'errors': decoder.errors},
+                     ('bytes', 'frames', 'errors'))
+    latency = metrics.histogram('receive_to_write')
+  start = time.perf_counter()
+  for chunk in chunks:
+    stamp = monotonic_ns()
+    for data in decoder.feed(chunk):
+      writer.write(data, stamp)
+    if metrics:
+      latency.add(monotonic_ns() - stamp)
+  writer.close()
+  return time.perf_counter() - start, decoder.frames
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='overhead of the metrics in the receive loop')
+  parser.add_argument('-n', '--frames', type=int, default=1000000)
+  parser.add_argument('-s', '--payload_size', type=int, default=16)
+  parser.add_argument('-c', '--chunk', type=int, default=4096)
+  parser.add_argument('-k', '--repeat', type=int, default=3)
+  args = parser.parse_args()
+
+  stream = b''.join(encode_frame(bytes([n % 251]) * args.payload_size) for n in range(args.frames))
+  chunks = [stream[i:i + args.chunk] for i in range(0, len(stream), args.chunk)]
+  with tempfile.TemporaryDirectory() as directory:
+    filename = os.path.join(directory, 'bench.bin')
+    best = {}
+    for _ in range(args.repeat):
+      for name, metrics in (('off', None), ('on', Metrics())):
+        elapsed, frames = receive(chunks, filename, metrics)
+        best[name] = min(best.get(name, elapsed), elapsed)
+    for name in ('off', 'on'):
+      print('metrics %-3s %8.0f frames/s, %6.0f ns/frame' % (name, frames / best[name], 1e9 * best[name] / frames))
+    print('overhead %.1f%%' % (100 * (best['on'] - best['off']) / best['off']))
+    start = time.perf_counter()
+    for _ in range(1000):
+      metrics.line()
+    print('stats line %.0f us' % ((time.perf_counter() - start) * 1e3))
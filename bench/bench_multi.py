@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## CPU used by MultiReader as the number of devices grows
+#  each device is a pty fed by a child process at a fixed frame rate, the CPU
+#  time of this process is reported per device count
+########################################################
+
+import os
+import sys
+import pty
+import tty
+import time
+import argparse
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from frame import encode_frame
+from multi import MultiReader
+
+
+def feeder(masters, rate, duration, payload_size):
+  frame = encode_frame(bytes(payload_size))
+  # frames are written in bursts of 1 ms
+  burst = frame * max(1, int(rate / 1000))
+  period = len(burst) // len(frame) / rate
+  start = time.monotonic()
+  next_write = start
+  while time.monotonic() - start < duration:
+    for m in masters:
+      os.write(m, burst)
+    next_write += period
+    delay = next_write - time.monotonic()
+    if delay > 0:
+      time.sleep(delay)
+  for m in masters:
+    os.close(m)
+
+
+def run(ndevices, rate, duration, payload_size):
+  masters = []
+  slaves = []
+  names = []
+  for _ in range(ndevices):
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    masters.append(master)
+    slaves.append(slave)
+    names.append((os.ttyname(slave), 921600))
+  reader = MultiReader(names)
+  reader.open()
+  for s in slaves:
+    os.close(s)
+  child = mp.Process(target=feeder, args=(masters, rate, duration, payload_size))
+  cpu = time.process_time()
+  child.start()
+  # only the feeder keeps the masters, the ports close when it ends
+  for m in masters:
+    os.close(m)
+  frames = 0
+  for _ in reader.frames():
+    frames += 1
+  cpu = time.process_time() - cpu
+  child.join()
+  reader.close()
+  return frames, cpu
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='MultiReader CPU time versus device count')
+  parser.add_argument('-r', '--rate', type=float, default=2000, help='frames per second per device')
+  parser.add_argument('-t', '--duration', type=float, default=3)
+  parser.add_argument('-s', '--payload_size', type=int, default=16)
+  parser.add_argument('-d', '--devices', type=str, default='1,2,4,8')
+  args = parser.parse_args()
+
+  for n in [int(d) for d in args.devices.split(',')]:
+    frames, cpu = run(n, args.rate, args.duration, args.payload_size)
+    print('%d devices: %8d frames, cpu %.2f s, %.2f us/frame, %.1f%% of one core' %
+          (n, frames, cpu, 1e6 * cpu / max(1, frames), 100 * cpu / args.duration))
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## End to end benchmark of pslog on a simulated serial device
+#  every scenario starts pslog.py on the slave side of a pty, feeds it with
+#  the frames of bench/simulator.py and measures, for pslog and its server
+#  processes: frames/s, bytes/s, CPU%, RSS growth, how many frames survived
+#  the checksum resync and the latency to TCP and UDP clients. With
+#  --low_latency the latency of each stage inside pslog is read from its
+#  metrics socket.
+#  The results are written as JSON, compare two runs with --baseline:
+#    $ bench/bench_pslog.py -o before.json
+#    $ bench/bench_pslog.py -o after.json --baseline before.json
+########################################################
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import tempfile
+import subprocess
+import multiprocessing as mp
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simulator import FrameGenerator, open_pty, stream, stream_text, read_stamp
+from binreader import IndexedReader
+from metrics import read_metrics
+from net_process import unpack_numbered
+
+PSLOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pslog.py')
+TICKS = os.sysconf('SC_CLK_TCK')
+
+# name: (pslog arguments, client, corruption, noise, rate)
+# rate None uses --rate, 0 writes as fast as pslog reads
+SCENARIOS = {
+  'receive': ([], None, 0.0, 0.0, None),
+  'receive_max': ([], None, 0.0, 0.0, 0),
+  'metrics_max': (['--metrics'], None, 0.0, 0.0, 0),
+  'pipeline': (['--pipeline'], None, 0.0, 0.0, None),
+  'resync': ([], None, 0.05, 0.05, None),
+  'repeat': (['-r'], None, 0.0, 0.0, None),
+  'tcp': (['-t'], 'tcp', 0.0, 0.0, None),
+  'tcp_aio': (['-t', '--aio'], 'tcp', 0.0, 0.0, None),
+  'udp': (['-u'], 'udp', 0.0, 0.0, None),
+  'tcp_low_latency': (['-t', '--low_latency'], 'tcp', 0.0, 0.0, None),
+  'tcp_shm_low_latency': (['-t', '--shm', '--low_latency'], 'tcp', 0.0, 0.0, None),
+  'udp_low_latency': (['-u', '--low_latency'], 'udp', 0.0, 0.0, None),
+}
+
+
+# pid and the pids of all its live descendants
+def process_tree(pid):
+  pids = [pid]
+  for p in pids:
+    try:
+      for task in os.listdir('/proc/%d/task' % (p)):
+        with open('/proc/%d/task/%s/children' % (p, task)) as f:
+          pids += [int(c) for c in f.read().split()]
+    except OSError:
+      pass
+  return pids
+
+
+# CPU seconds of the tree of pid, the children that ended included
+def cpu_seconds(pid):
+  ticks = 0
+  for p in process_tree(pid):
+    try:
+      with open('/proc/%d/stat' % (p)) as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+      continue
+    ticks += int(fields[11]) + int(fields[12])
+    if p == pid:
+      ticks += int(fields[13]) + int(fields[14])
+  return ticks / TICKS
+
+
+# resident memory of the tree of pid in kB
+def rss_kb(pid):
+  total = 0
+  for p in process_tree(pid):
+    try:
+      with open('/proc/%d/status' % (p)) as f:
+        for line in f:
+          if line.startswith('VmRSS:'):
+            total += int(line.split()[1])
+    except OSError:
+      pass
+  return total
+
+
+def percentiles(values):
+  if not values:
+    return None
+  values = sorted(values)
+  pick = lambda p: values[min(len(values) - 1, int(p / 100.0 * len(values)))] / 1e3
+  return {'p50': pick(50), 'p90': pick(90), 'p99': pick(99), 'max': values[-1] / 1e3}
+
+
+def feeder(master, text, payload_size, corruption, noise, rate, duration, conn):
+  if text:
+    nbytes, elapsed = stream_text(master, rate, duration)
+    conn.send({'bytes': nbytes, 'elapsed': elapsed})
+    return
+  generator = FrameGenerator(payload_size, corruption, noise)
+  elapsed = stream(master, generator, rate, duration)
+  result = generator.stats()
+  result['bad'] = generator.bad
+  result['bytes'] = generator.sequence * (payload_size + 5) + generator.noise_bytes
+  result['elapsed'] = elapsed
+  conn.send(result)
+
+
+# subscribes to the pslog server and takes the latency of every package,
+# until no package arrives for idle seconds
+def client(kind, port, payload_size, idle, ready, conn):
+  now = time.monotonic_ns
+  latencies = []
+  if kind == 'tcp':
+    deadline = time.monotonic() + 10
+    while True:
+      try:
+        sock = socket.create_connection(('127.0.0.1', port))
+        break
+      except OSError:
+        if time.monotonic() > deadline:
+          ready.set()
+          conn.send({'error': 'could not connect'})
+          return
+        time.sleep(0.05)
+  else:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for _ in range(3):
+      sock.sendto(b'hello', ('127.0.0.1', port))
+      time.sleep(0.1)
+  time.sleep(0.2)
+  ready.set()
+  sock.settimeout(idle)
+  pending = b''
+  nbytes = 0
+  try:
+    while True:
+      data = sock.recv(1 << 16)
+      if not data:
+        break
+      t = now()
+      nbytes += len(data)
+      if kind == 'udp':
+        latencies.append(t - read_stamp(unpack_numbered(data)[1])[1])
+        continue
+      # the TCP stream has no boundaries, all the payloads have the same size
+      pending += data
+      end = len(pending) - len(pending) % payload_size
+      for offset in range(0, end, payload_size):
+        latencies.append(t - read_stamp(pending[offset:offset + payload_size])[1])
+      pending = pending[end:]
+  except socket.timeout:
+    pass
+  sock.close()
+  conn.send({'packages': len(latencies), 'bytes': nbytes, 'latency_us': percentiles(latencies)})
+
+
+# what pslog saved against what the simulator sent
+def check_file(filename, sent, payload_size):
+  bad = set(sent['bad'])
+  seen = set()
+  good = duplicated = false = 0
+  latencies = []
+  with IndexedReader(filename) as reader:
+    for stamp, data in reader.frames():
+      if len(data) != payload_size:
+        false += 1
+        continue
+      sequence, written = read_stamp(data)
+      if sequence >= sent['frames'] or sequence in bad:
+        false += 1
+      elif sequence in seen:
+        duplicated += 1
+      else:
+        seen.add(sequence)
+        good += 1
+        latencies.append(stamp - written)
+    saved = reader.count
+  return {'saved': saved, 'recovered': good, 'missed': sent['good'] - good,
+          'false': false, 'duplicated': duplicated,
+          'accuracy': good / sent['good'] if sent['good'] else None,
+          'read_latency_us': percentiles(latencies)}
+
+
+def run(name, args, port, directory):
+  options, kind, corruption, noise, rate = SCENARIOS[name]
+  rate = args.rate if rate is None else rate
+  text = '-r' in options
+  outfile = os.path.join(directory, name + ('.txt' if text else '.pslx'))
+  master, slave, device = open_pty()
+  command = [sys.executable, PSLOG, '-p', device, '-d', '-f', outfile, '-P', str(port)] + options
+  if not text:
+    command += ['--format', 'indexed']
+  metrics_socket = os.path.join(directory, name + '.sock')
+  if '--low_latency' in options:
+    command += ['--metrics_socket', metrics_socket]
+  # no .pslogrc in the working directory changes the options
+  pslog = subprocess.Popen(command, stdout=subprocess.DEVNULL, cwd=directory)
+  time.sleep(args.startup)
+
+  if kind:
+    ready = mp.Event()
+    client_conn, child_conn = mp.Pipe(False)
+    listener = mp.Process(target=client, args=(kind, port, args.payload_size, args.idle, ready, child_conn))
+    listener.start()
+    ready.wait()
+
+  cpu_start = cpu_seconds(pslog.pid)
+  rss_start = rss_max = rss_kb(pslog.pid)
+  feeder_conn, child_conn = mp.Pipe(False)
+  writer = mp.Process(target=feeder, args=(master, text, args.payload_size, corruption, noise, rate, args.duration, child_conn))
+  start = time.monotonic()
+  writer.start()
+  while writer.is_alive():
+    writer.join(0.1)
+    rss_max = max(rss_max, rss_kb(pslog.pid))
+  sent = feeder_conn.recv()
+
+  # pslog is done when it stops using CPU
+  cpu = cpu_seconds(pslog.pid)
+  end = time.monotonic()
+  while end - start < args.duration + 30:
+    time.sleep(0.1)
+    rss_max = max(rss_max, rss_kb(pslog.pid))
+    last, cpu = cpu, cpu_seconds(pslog.pid)
+    if cpu == last:
+      break
+    end = time.monotonic()
+  wall = end - start
+  cpu -= cpu_start
+  rss_end = rss_kb(pslog.pid)
+
+  result = {'scenario': name, 'options': options, 'rate': rate, 'payload_size': args.payload_size,
+            'corruption': corruption, 'noise': noise, 'seconds': wall, 'cpu_seconds': cpu,
+            'cpu_percent': 100 * cpu / wall, 'rss_start_kb': rss_start, 'rss_max_kb': rss_max,
+            'rss_end_kb': rss_end, 'rss_growth_kb': rss_end - rss_start}
+  if kind:
+    result[kind] = client_conn.recv()
+    listener.join()
+  if '--low_latency' in options:
+    try:
+      histograms = read_metrics(metrics_socket)['histograms']
+      result['stages_us'] = {name: {'p50': h['p50'] / 1e3, 'p99': h['p99'] / 1e3}
+                             for name, h in histograms.items() if name in ('read', 'validate', 'enqueue', 'send')}
+    except (OSError, ValueError, KeyError):
+      pass
+
+  pslog.send_signal(signal.SIGINT)
+  pslog.wait()
+  os.close(master)
+  os.close(slave)
+
+  if text:
+    saved = os.path.getsize(outfile) if os.path.exists(outfile) else 0
+    result.update({'bytes_sent': sent['bytes'], 'bytes_saved': saved, 'bytes_per_s': saved / wall})
+  else:
+    sent_frames = {k: sent[k] for k in ('frames', 'good', 'corrupted', 'noise_bytes')}
+    check = check_file(outfile, sent, args.payload_size) if os.path.exists(outfile) else {'saved': 0}
+    result.update({'sent': sent_frames, 'frames_per_s': check['saved'] / wall,
+                   'bytes_per_s': sent['bytes'] / wall, 'file': check})
+  return result
+
+
+def summary(result, baseline=None):
+  line = '%-19s %9.0f B/s' % (result['scenario'], result['bytes_per_s'])
+  if 'frames_per_s' in result:
+    line += ' %8.0f frames/s accuracy %s' % (result['frames_per_s'], result['file'].get('accuracy'))
+  line += ' cpu %5.1f%% rss +%d kB' % (result['cpu_percent'], result['rss_growth_kb'])
+  for kind in ('tcp', 'udp'):
+    if kind in result and result[kind].get('latency_us'):
+      line += ' %s %d pkgs p50 %.0f us p99 %.0f us' % (kind, result[kind]['packages'],
+              result[kind]['latency_us']['p50'], result[kind]['latency_us']['p99'])
+  for name, stage in result.get('stages_us', {}).items():
+    line += ' %s p50 %.0f p99 %.0f us' % (name, stage['p50'], stage['p99'])
+  if baseline:
+    line += ' | vs baseline: bytes/s x%.2f cpu x%.2f' % (result['bytes_per_s'] / max(baseline['bytes_per_s'], 1e-9),
+            result['cpu_percent'] / max(baseline['cpu_percent'], 1e-9))
+  return line
+
+
+def version():
+  try:
+    return subprocess.check_output(['git', 'describe', '--always', '--dirty'], stderr=subprocess.DEVNULL,
+                                   cwd=os.path.dirname(PSLOG)).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='pslog end to end benchmark on a simulated serial device')
+  parser.add_argument('-s', '--scenarios', type=str, default=','.join(SCENARIOS), help='comma separated, from: ' + ', '.join(SCENARIOS))
+  parser.add_argument('-r', '--rate', type=float, default=5000, help='frames per second (0: as fast as possible)')
+  parser.add_argument('-t', '--duration', type=float, default=5)
+  parser.add_argument('-b', '--payload_size', type=int, default=16)
+  parser.add_argument('-P', '--net_port', type=int, default=5390, help='first port of the TCP and UDP servers')
+  parser.add_argument('--startup', type=float, default=1.0, help='seconds given to pslog to start')
+  parser.add_argument('--idle', type=float, default=1.0, help='seconds without packages that end a client')
+  parser.add_argument('-o', '--output', type=str, default=None, help='JSON file for the results (default=stdout)')
+  parser.add_argument('--baseline', type=str, default=None, help='JSON results of an earlier run to compare with')
+  args = parser.parse_args()
+
+  baseline = {}
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = {r['scenario']: r for r in json.load(f)['results']}
+
+  results = []
+  with tempfile.TemporaryDirectory() as directory:
+    for n, name in enumerate(s.strip() for s in args.scenarios.split(',')):
+      result = run(name, args, args.net_port + n, directory)
+      results.append(result)
+      print(summary(result, baseline.get(name)), file=sys.stderr)
+
+  report = {'version': version(), 'python': sys.version.split()[0], 'date': datetime.now().isoformat(),
+            'settings': vars(args), 'results': results}
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2)
+  else:
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Benchmark of recover.py
+#  writes an indexed file of the given size as a killed pslog leaves it (no
+#  index, the header counting the packages of an old flush, some garbage at
+#  the end) and a legacy one, and times their recovery.
+#    $ bench/bench_recover.py --mb 1024
+########################################################
+
+import os
+import sys
+import time
+import struct
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from binwriter import HEADER_FORMAT, INDEXED_MAGIC, INDEXED_VERSION, INDEXED_HEADER_FORMAT, INDEXED_HEADER_SIZE
+from recover import recover, report
+
+BLOCK = 1 << 20
+
+
+def make_indexed(filename, mb, payload_size):
+  record = np.dtype([('length', '<u4'), ('timestamp', '<u8'), ('payload', 'V%d' % (payload_size))])
+  count = mb * 1000000 // record.itemsize
+  with open(filename, 'wb') as f:
+    # the header of a flush done at a tenth of the session
+    f.write(struct.pack(INDEXED_HEADER_FORMAT, INDEXED_MAGIC, INDEXED_VERSION, 0, count // 10, 0,
+                        INDEXED_HEADER_SIZE + count // 10 * record.itemsize))
+    for first in range(0, count, BLOCK):
+      n = min(BLOCK, count - first)
+      records = np.zeros(n, record)
+      records['length'] = payload_size
+      records['timestamp'] = 10 ** 12 + np.arange(first, first + n, dtype=np.uint64) * 1000
+      f.write(records.tobytes())
+    f.write(b'\x10\x00\x00')
+  return count
+
+
+def make_legacy(filename, mb, payload_size):
+  count = mb * 1000000 // payload_size
+  with open(filename, 'wb') as f:
+    f.write(struct.pack(HEADER_FORMAT, count // 10))
+    block = bytes(BLOCK * payload_size)
+    for first in range(0, count, BLOCK):
+      f.write(block[:min(BLOCK, count - first) * payload_size])
+    f.write(b'\x01')
+  return count
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='recover.py benchmark')
+  parser.add_argument('--mb', type=int, default=256, help='size of the files in MB')
+  parser.add_argument('-b', '--payload_size', type=int, default=16)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as directory:
+    for name, make, frame_size in (('indexed', make_indexed, None), ('legacy', make_legacy, args.payload_size)):
+      filename = os.path.join(directory, 'capture.' + name)
+      count = make(filename, args.mb, args.payload_size)
+      size = os.path.getsize(filename)
+      start = time.perf_counter()
+      result = recover(filename, frame_size)
+      elapsed = time.perf_counter() - start
+      print('%-8s %6.2f s %8.1f MB/s %s (%d written)' % (name, elapsed, size / elapsed / 1e6, report(result), count))
+      os.remove(filename)
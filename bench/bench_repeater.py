@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Repeater text path: old accumulate and convert at exit versus streaming
+#  the old path is quadratic, so it only runs over the first --old_megabytes
+########################################################
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from textwriter import TextWriter
+
+
+def chunks(nbytes, size):
+  block = (b'sensor 12.5 13.25 -0.5 \xb0C ok\n' * (size // 32 + 1))[:size]
+  for _ in range(nbytes // size):
+    yield block
+
+
+# the repeater before the streaming writer
+def old_path(nbytes, size, out, filename):
+  def byte2str(byte):
+    s = ''
+    for ch in byte:
+      s += chr(ch)
+    return s
+  data_list = b''
+  for chunk in chunks(nbytes, size):
+    out.write(byte2str(chunk))
+    data_list += chunk
+  with open(filename, 'w') as f:
+    f.write(byte2str(data_list))
+
+
+def new_path(nbytes, size, out, filename):
+  with TextWriter(filename) as writer:
+    for chunk in chunks(nbytes, size):
+      out.write(writer.write(chunk))
+
+
+def timed(function, nbytes, size, directory):
+  filename = os.path.join(directory, 'bench.txt')
+  with open(os.devnull, 'w') as out:
+    start = time.perf_counter()
+    function(nbytes, size, out, filename)
+    elapsed = time.perf_counter() - start
+  os.remove(filename)
+  return elapsed
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='repeater text output throughput')
+  parser.add_argument('-m', '--megabytes', type=float, default=1000)
+  parser.add_argument('--old_megabytes', type=float, default=8)
+  parser.add_argument('-c', '--chunk', type=int, default=4096)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as directory:
+    nbytes = int(args.old_megabytes * 1e6)
+    elapsed = timed(old_path, nbytes, args.chunk, directory)
+    print('old      %7.0f MB: %8.2f MB/s' % (nbytes / 1e6, nbytes / 1e6 / elapsed))
+    nbytes = int(args.megabytes * 1e6)
+    elapsed = timed(new_path, nbytes, args.chunk, directory)
+    print('stream   %7.0f MB: %8.2f MB/s' % (nbytes / 1e6, nbytes / 1e6 / elapsed))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Benchmark of resync.py against FrameParser
+#  writes a raw dump made of simulator frames with corrupted ones and noise,
+#  checks that resync.py takes the same frames as FrameParser and times both
+#  (FrameParser on the first MB only).
+#    $ bench/bench_resync.py --mb 512 -j 4
+########################################################
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simulator import FrameGenerator
+from frame import FrameParser
+from binreader import HEADER_SIZE
+import resync
+
+
+# a block of about 1 MB of frames, repeated to the size of the dump
+def make_dump(filename, mb, payload_size, corruption, noise):
+  generator = FrameGenerator(payload_size, corruption, noise)
+  block = b''
+  while len(block) < 1000000:
+    block += generator.burst(1000)
+  with open(filename, 'wb') as f:
+    for _ in range(max(1, mb * 1000000 // len(block))):
+      f.write(block)
+  return block
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='resync.py benchmark')
+  parser.add_argument('--mb', type=int, default=256, help='size of the dump in MB')
+  parser.add_argument('-b', '--payload_size', type=int, default=16)
+  parser.add_argument('--corruption', type=float, default=0.01)
+  parser.add_argument('--noise', type=float, default=0.01)
+  parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as directory:
+    dump = os.path.join(directory, 'dump.raw')
+    output = os.path.join(directory, 'dump.bin')
+    block = make_dump(dump, args.mb, args.payload_size, args.corruption, args.noise)
+
+    frame_parser = FrameParser()
+    start = time.perf_counter()
+    expected = b''.join(frame_parser.feed(block))
+    elapsed = time.perf_counter() - start
+    print('%-16s %8.1f MB/s' % ('FrameParser', len(block) / elapsed / 1e6))
+
+    for jobs in sorted(set((1, args.jobs))):
+      stats = resync.resync(dump, output, jobs).snapshot()
+      with open(output, 'rb') as f:
+        f.seek(HEADER_SIZE)
+        same = f.read(len(expected)) == expected
+      print('%-16s %8.1f MB/s %d frames, %d errors, same frames as FrameParser: %s' % (
+            'resync -j %d' % (jobs), stats['mb_per_s'], stats['frames'], stats['errors'], same))
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Segmented writer: write throughput and the longest stall of write()
+#  for each compression, the compression runs in a background thread and
+#  should not show in the stalls, only in the time close() waits for it
+########################################################
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from segments import SegmentWriter, SegmentReader, COMPRESSIONS
+from binwriter import IndexedWriter
+
+
+def run(writer, frames):
+  stalls = []
+  start = time.perf_counter()
+  for n, frame in enumerate(frames):
+    t = time.perf_counter_ns()
+    writer.write(frame, n)
+    stalls.append(time.perf_counter_ns() - t)
+  elapsed = time.perf_counter() - start
+  t = time.perf_counter()
+  writer.close()
+  closing = time.perf_counter() - t
+  stalls.sort()
+  return elapsed, closing, stalls[len(stalls) * 999 // 1000], stalls[-1]
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='segmented writer throughput and stalls')
+  parser.add_argument('-n', '--frames', type=int, default=2000000)
+  parser.add_argument('-s', '--payload_size', type=int, default=32)
+  parser.add_argument('-m', '--segment_mb', type=float, default=8)
+  args = parser.parse_args()
+
+  frames = [(n % 100000).to_bytes(4, 'little') * (args.payload_size // 4) for n in range(args.frames)]
+  nbytes = args.frames * args.payload_size
+  with tempfile.TemporaryDirectory() as directory:
+    cases = [('single file', lambda: IndexedWriter(os.path.join(directory, 'single.pslx'), fsync=False))]
+    for compression in COMPRESSIONS:
+      cases.append((compression, lambda c=compression: SegmentWriter(os.path.join(directory, c), 'indexed',
+                                                                     int(args.segment_mb * 1e6), 0, c)))
+    for name, make in cases:
+      try:
+        writer = make()
+      except ValueError as er:
+        print('%-12s skipped: %s' % (name, str(er)))
+        continue
+      elapsed, closing, p999, worst = run(writer, frames)
+      size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory) if f.startswith(name.split()[0]))
+      print('%-12s %7.1f MB/s write, p99.9 %6.1f us max %7.1f ms, close %.2f s, %6.1f MB on disk' %
+            (name, nbytes / 1e6 / elapsed, p999 / 1e3, worst / 1e6, closing, size / 1e6))
+      if isinstance(writer, SegmentWriter):
+        assert SegmentReader(writer.filename).count == args.frames
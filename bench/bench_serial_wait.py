@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Busy wait versus event driven serial reads on a pty pair
+#  a child process writes frames carrying their write time into the master
+#  side, this process reads the slave side with pyserial and reports the CPU
+#  time per MB received and the delay from the write to the read
+########################################################
+
+import os
+import sys
+import pty
+import tty
+import time
+import struct
+import argparse
+import multiprocessing as mp
+
+import serial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pslog
+from frame import FrameParser, encode_frame
+
+
+# the read_chunk of pslog before the event driven reads
+def busy_read_chunk(ser):
+  num_bytes = 0
+  while not num_bytes:
+    num_bytes = ser.inWaiting()
+  return ser.read(num_bytes)
+
+
+def writer(master, rate, duration, payload_size, idle):
+  padding = bytes(payload_size - 8)
+  period = 1.0 / rate
+  time.sleep(idle)
+  start = time.monotonic()
+  next_write = start
+  while time.monotonic() - start < duration:
+    os.write(master, encode_frame(struct.pack('<Q', time.monotonic_ns()) + padding))
+    next_write += period
+    delay = next_write - time.monotonic()
+    if delay > 0:
+      time.sleep(delay)
+  time.sleep(idle)
+  os.close(master)
+
+
+def run(read_chunk, rate, duration, payload_size, idle, read_min=1, read_timeout=10):
+  master, slave = pty.openpty()
+  tty.setraw(slave)
+  pslog.read_min = read_min
+  pslog.read_timeout = read_timeout
+  ser = serial.Serial(os.ttyname(slave), 921600, timeout=pslog.read_timeout_s())
+  child = mp.Process(target=writer, args=(master, rate, duration, payload_size, idle))
+  child.start()
+  os.close(master)
+  parser = FrameParser()
+  latencies = []
+  nbytes = 0
+  expected = int(rate * duration)
+  cpu = time.process_time()
+  start = time.monotonic()
+  while len(latencies) < expected and time.monotonic() - start < duration + 2 * idle + 1:
+    try:
+      chunk = read_chunk(ser)
+    except (serial.SerialException, OSError):
+      break
+    now = time.monotonic_ns()
+    nbytes += len(chunk)
+    for data in parser.feed(chunk):
+      latencies.append(now - struct.unpack_from('<Q', data)[0])
+  cpu = time.process_time() - cpu
+  wall = time.monotonic() - start
+  child.join()
+  ser.close()
+  os.close(slave)
+  latencies.sort()
+  return nbytes, cpu, wall, latencies
+
+
+def percentile(values, p):
+  if not values:
+    return float('nan')
+  return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='CPU per MB and wake to read latency of the serial reads')
+  parser.add_argument('-r', '--rate', type=float, default=2000, help='frames per second')
+  parser.add_argument('-t', '--duration', type=float, default=3)
+  parser.add_argument('-s', '--payload_size', type=int, default=16)
+  parser.add_argument('-i', '--idle', type=float, default=1, help='idle seconds before and after the data')
+  args = parser.parse_args()
+  args.payload_size = max(8, args.payload_size)
+
+  pslog.verbose = False
+  for name, read_chunk, read_min in (('busy wait', busy_read_chunk, 1),
+                                     ('event', pslog.read_chunk, 1),
+                                     ('event min 64', pslog.read_chunk, 64)):
+    nbytes, cpu, wall, latencies = run(read_chunk, args.rate, args.duration, args.payload_size, args.idle, read_min)
+    print('%-13s %6d frames, cpu %5.2f s over %5.2f s (%5.1f%%), %7.2f cpu s/MB, latency us p50 %6.0f p99 %6.0f max %6.0f' %
+          (name, len(latencies), cpu, wall, 100 * cpu / wall, cpu / max(nbytes / 1e6, 1e-9),
+           percentile(latencies, 50) / 1e3, percentile(latencies, 99) / 1e3, percentile(latencies, 100) / 1e3))
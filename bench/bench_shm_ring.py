@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Producer to consumer process handoff: mp.Queue versus ShmRing
+#  the producer pushes N small messages, the time is taken until the
+#  consumer process has received the last one
+########################################################
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shm_ring import ShmRing
+
+
+def queue_consumer(q, count, done):
+  received = 0
+  while received < count:
+    q.get()
+    received += 1
+  done.put(time.perf_counter())
+
+
+def ring_consumer(ring, index, count, done, ready):
+  reader = ring.reader(index)
+  ready.set()
+  received = 0
+  while received + reader.lost < count:
+    msgs = reader.read(4096)
+    if not msgs:
+      time.sleep(0)
+    received += len(msgs)
+  done.put((time.perf_counter(), received, reader.lost))
+
+
+def run_queue(msg, count):
+  q = mp.Queue()
+  done = mp.Queue()
+  consumer = mp.Process(target=queue_consumer, args=(q, count, done))
+  consumer.start()
+  start = time.perf_counter()
+  for _ in range(count):
+    q.put(msg)
+  put = time.perf_counter() - start
+  end = done.get()
+  consumer.join()
+  return put, end - start, count, 0
+
+
+def run_ring(msg, count, lossless, consumers):
+  ring = ShmRing(65536, max(256, len(msg)), consumers, lossless)
+  done = mp.Queue()
+  ready = [mp.Event() for _ in range(consumers)]
+  procs = [mp.Process(target=ring_consumer, args=(ring, i, count, done, ready[i])) for i in range(consumers)]
+  for p in procs:
+    p.start()
+  for r in ready:
+    r.wait()
+  start = time.perf_counter()
+  for _ in range(count):
+    ring.put(msg)
+  put = time.perf_counter() - start
+  results = [done.get() for _ in procs]
+  for p in procs:
+    p.join()
+  ring.close()
+  end = max(r[0] for r in results)
+  return put, end - start, min(r[1] for r in results), max(r[2] for r in results)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='mp.Queue versus shared memory ring')
+  parser.add_argument('-n', '--messages', type=int, default=200000)
+  parser.add_argument('-s', '--size', type=int, default=16)
+  parser.add_argument('-c', '--consumers', type=int, default=2)
+  args = parser.parse_args()
+
+  msg = os.urandom(args.size)
+  print('%d messages of %d bytes' % (args.messages, args.size))
+  for name, run in (('mp.Queue', lambda: run_queue(msg, args.messages)),
+                    ('ring lossless x1', lambda: run_ring(msg, args.messages, True, 1)),
+                    ('ring lossless x%d' % (args.consumers), lambda: run_ring(msg, args.messages, True, args.consumers)),
+                    ('ring lossy x%d' % (args.consumers), lambda: run_ring(msg, args.messages, False, args.consumers))):
+    put, total, received, lost = run()
+    print('%-18s producer %9.0f msg/s, end to end %9.0f msg/s, received %d lost %d' %
+          (name, args.messages / put, args.messages / total, received, lost))
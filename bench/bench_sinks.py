@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Benchmark of the fan out of the packages to the sinks
+#  feeds batches of packages, as the serial reads give them, to sets of
+#  sinks of growing size and prints the cost per package. The batch is
+#  decoded once whatever the number of decoded sinks, the decode line is
+#  what each of them would pay to decode it again on its own. The clients of
+#  a server share its messages, they cost nothing here.
+#    $ bench/bench_sinks.py --frames 200000 --batch 32
+########################################################
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from binwriter import BinaryWriter
+from schema import Schema
+from sinks import Fanout, Decoder, BinarySink, ServerSink, CSVSink, JSONLinesSink
+
+SCHEMA = '<IIffff time sequence x y z w'
+
+
+# a server that takes the messages and throws them away
+class NullServer:
+  def is_alive(self):
+    return True
+
+  def add_message(self, msg, stamp=None):
+    pass
+
+
+def batches(schema, frames, batch):
+  packer = schema.struct
+  data = [packer.pack(i, i, 0.5 * i, 1.5, -2.5, 3.25) for i in range(batch)]
+  return [data] * (frames // batch)
+
+
+def run(sinks, schema, work):
+  fanout = Fanout(schema)
+  for sink in sinks:
+    fanout.add(sink)
+  start = time.perf_counter()
+  for n, batch in enumerate(work):
+    fanout.write(n, batch)
+  elapsed = time.perf_counter() - start
+  fanout.close()
+  return elapsed
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='cost per package of the sinks')
+  parser.add_argument('--frames', type=int, default=200000)
+  parser.add_argument('--batch', type=int, default=32, help='packages per serial read')
+  args = parser.parse_args()
+
+  schema = Schema.parse(SCHEMA)
+  work = batches(schema, args.frames, args.batch)
+  frames = len(work) * args.batch
+  with tempfile.TemporaryDirectory() as directory:
+    writer = BinaryWriter(os.path.join(directory, 'data.bin'), 0, 1000)
+    csv_file = lambda: CSVSink(os.path.join(directory, 'data.csv'), schema, 0)
+    configurations = [
+      ('binary', lambda: [BinarySink(writer)]),
+      ('binary+2 servers', lambda: [BinarySink(writer), ServerSink(NullServer()), ServerSink(NullServer())]),
+      ('binary+csv', lambda: [BinarySink(writer), csv_file()]),
+      ('binary+csv+json', lambda: [BinarySink(writer), csv_file(), JSONLinesSink(NullServer(), schema)]),
+    ]
+    decoder = Decoder(schema)
+    start = time.perf_counter()
+    for batch in work:
+      decoder.decode(batch)
+    decode = time.perf_counter() - start
+    print('%-20s %7.0f ns/package' % ('decode', decode / frames * 1e9))
+    for name, sinks in configurations:
+      elapsed = run(sinks(), schema, work)
+      print('%-20s %7.0f ns/package' % (name, elapsed / frames * 1e9))
+    writer.close()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Startup time of pslog
+#  for each set of options, the import time of pslog (python -X importtime,
+#  the cumulative time of the modules a run imports and the slowest of them)
+#  and the wall clock from the start of the process to its first read of
+#  the serial port. The simulator writes frames to a pty from the start, and
+#  the time of the read is the receive time of the first package in the
+#  indexed file (monotonic ns, the clock of this process too).
+#    $ bench/bench_startup.py -n 10
+#    $ bench/bench_startup.py --pslog /tmp/before/pslog.py
+########################################################
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simulator import FrameGenerator, open_pty, stream
+from binreader import IndexedReader
+
+PSLOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pslog.py')
+
+# name: pslog arguments
+SCENARIOS = {
+  'file': [],
+  'tcp': ['-t'],
+  'tcp_aio': ['-t', '--aio'],
+  'udp_shm': ['-u', '--shm'],
+  'metrics': ['--metrics'],
+  'csv': ['--schema', '<16s data', '--csv'],
+}
+
+
+# milliseconds of the modules imported in a run, all of them and the top
+# level ones, slowest first
+def import_times(text):
+  modules = []
+  for line in text.splitlines():
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+    _, cumulative, name = line[len('import time:'):].split('|')
+    # the top level imports, their cumulative time holds the others
+    if not name.startswith('  '):
+      modules.append((int(cumulative) / 1000, name.strip()))
+  modules.sort(reverse=True)
+  return sum(m[0] for m in modules), modules
+
+
+# seconds from the start of pslog to the receive time of its first package
+# and what it wrote to stderr, pslog stops after that package
+def first_read(pslog, options, directory, timeout, importtime=False):
+  master, slave, device = open_pty()
+  writer = mp.Process(target=stream, args=(master, FrameGenerator(), 5000, timeout))
+  writer.daemon = True
+  writer.start()
+  outfile = os.path.join(directory, 'startup')
+  command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + [pslog, '-p', device, '-d', '-f', outfile,
+             '-n', '1', '--format', 'indexed', '--display', 'quiet'] + options
+  start = time.monotonic_ns()
+  pslog = subprocess.Popen(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+  try:
+    _, errors = pslog.communicate(timeout=timeout)
+  except subprocess.TimeoutExpired:
+    pslog.kill()
+    _, errors = pslog.communicate()
+  writer.terminate()
+  writer.join()
+  os.close(master)
+  os.close(slave)
+  stamp = None
+  # with -d the file has no extension
+  if os.path.exists(outfile):
+    with IndexedReader(outfile) as reader:
+      stamp = int(reader.timestamps[0]) if reader.count else None
+  for name in os.listdir(directory):
+    if name.startswith('startup'):
+      os.remove(os.path.join(directory, name))
+  return (stamp - start) / 1e9 if stamp else None, errors
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='pslog startup time: imports and time to the first read')
+  parser.add_argument('-s', '--scenarios', type=str, default=','.join(SCENARIOS), help='comma separated, from: ' + ', '.join(SCENARIOS))
+  parser.add_argument('-n', '--runs', type=int, default=5, help='runs of each scenario, the median is shown')
+  parser.add_argument('--pslog', type=str, default=PSLOG, help='pslog.py to time, e.g. of another version')
+  parser.add_argument('--top', type=int, default=4, help='slowest imports shown')
+  parser.add_argument('--timeout', type=float, default=10)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as directory:
+    for n, name in enumerate(s.strip() for s in args.scenarios.split(',')):
+      # a different port for each scenario, a server may still hold the last one
+      options = SCENARIOS[name] + ['-P', str(5600 + n)]
+      total, modules = import_times(first_read(args.pslog, options, directory, args.timeout, True)[1])
+      times = sorted(t for t in (first_read(args.pslog, options, directory, args.timeout)[0] for _ in range(args.runs)) if t)
+      median = times[len(times) // 2] * 1000 if times else float('nan')
+      print('%-8s imports %6.1f ms, first read %6.1f ms (%d/%d runs) | %s' % (
+            name, total, median, len(times), args.runs, ', '.join('%s %.1f' % (m, t) for t, m in modules[:args.top])))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Server CPU with subscribed clients
+#  the same stream (packages of 8 types) is published to N clients that all
+#  take the whole stream (all) or that subscribe to different parts of it
+#  (mixed: whole stream, one type, 1 of 100, 10 per second, two types), and
+#  the CPU time of the server is printed for each N. For the asyncio server
+#  the time of the process that also produces the packages is taken.
+#    $ bench/bench_subscriptions.py --clients 1,4,16,64 --rate 2000
+########################################################
+
+import os
+import sys
+import time
+import socket
+import argparse
+import selectors
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from net_process import TCPServer
+from aio_server import AsyncTCPServer
+
+MIXED = (None, b'subscribe type=3\n', b'subscribe every=100\n', b'subscribe rate=10\n', b'subscribe length=16 type=1,2\n')
+TICKS = os.sysconf('SC_CLK_TCK')
+
+
+# user + system CPU seconds of a process
+def cpu_time(pid):
+  with open('/proc/%d/stat' % (pid)) as f:
+    fields = f.read().rsplit(')', 1)[1].split()
+  return (int(fields[11]) + int(fields[12])) / TICKS
+
+
+# runs in its own process: the server, then rate packages per second in
+# batches of 1 ms once the clients are connected, puts the server CPU time
+# and the wall time it was measured over
+def serve(aio, port, rate, duration, ready, start, result):
+  # the messages of the server about the connections
+  sys.stdout = open(os.devnull, 'w')
+  if aio:
+    server = AsyncTCPServer(port, max_pending=1 << 20)
+  else:
+    server = TCPServer(port)
+  server.daemon = True
+  server.start()
+  ready.set()
+  start.wait()
+  pid = os.getpid() if aio else server.pid
+  cpu = cpu_time(pid)
+  wall = time.monotonic()
+  batch = max(1, rate // 1000)
+  msgs = [bytes([i % 8]) + bytes(15) for i in range(batch)]
+  began = time.monotonic()
+  sent = 0
+  while time.monotonic() - began < duration:
+    for msg in msgs:
+      server.add_message(msg)
+    sent += batch
+    delay = began + sent / rate - time.monotonic()
+    if delay > 0:
+      time.sleep(delay)
+  # the server has the time to deliver what it holds
+  time.sleep(1)
+  result.put((cpu_time(pid) - cpu, time.monotonic() - wall))
+  server.terminate()
+
+
+def run(aio, port, count, mixed, rate, duration):
+  ready = mp.Event()
+  start = mp.Event()
+  result = mp.Queue()
+  process = mp.Process(target=serve, args=(aio, port, rate, duration, ready, start, result))
+  process.start()
+  ready.wait()
+  time.sleep(0.5)
+  selector = selectors.DefaultSelector()
+  socks = []
+  for n in range(count):
+    sock = socket.create_connection(('127.0.0.1', port))
+    line = MIXED[n % len(MIXED)] if mixed else None
+    if line:
+      sock.sendall(line)
+    sock.setblocking(False)
+    selector.register(sock, selectors.EVENT_READ)
+    socks.append(sock)
+  time.sleep(0.3)
+  start.set()
+  received = 0
+  end = time.monotonic() + duration + 1.5
+  while time.monotonic() < end:
+    for key, _ in selector.select(0.1):
+      try:
+        received += len(key.fileobj.recv(1 << 16))
+      except BlockingIOError:
+        pass
+  cpu, wall = result.get()
+  process.join()
+  for sock in socks:
+    sock.close()
+  selector.close()
+  return cpu, wall, received // 16
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='server CPU time with clients that take the whole stream or subscribe to parts of it')
+  parser.add_argument('--clients', type=str, default='1,4,16,32', help='numbers of clients, comma separated')
+  parser.add_argument('-r', '--rate', type=int, default=2000, help='packages per second')
+  parser.add_argument('-t', '--duration', type=float, default=3)
+  parser.add_argument('--aio', action='store_true', help='asyncio server instead of the server process')
+  parser.add_argument('-P', '--port', type=int, default=5460)
+  args = parser.parse_args()
+
+  port = args.port
+  for count in [int(c) for c in args.clients.split(',')]:
+    for mixed in (False, True):
+      cpu, wall, messages = run(args.aio, port, count, mixed, args.rate, args.duration)
+      port += 1
+      print('%3d clients %-5s server cpu %6.2f s (%5.1f%%), %8d packages delivered' % (
+            count, 'mixed' if mixed else 'all', cpu, 100 * cpu / wall, messages))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Serial device simulator on a pseudo terminal
+#  writes frames in the format of serialize_struct (see the README) into the
+#  master side of a pty, pslog reads the slave side as if it was the serial
+#  port of a microcontroller. Every payload starts with a sequence number
+#  (uint32) and the time it was written (uint64, monotonic ns), so the
+#  receivers can tell which frames arrived and how long they took.
+#  Run it alone to feed a pslog started by hand:
+#    $ bench/simulator.py -r 1000 -s 32
+#    $ ./pslog.py -p /dev/pts/N
+########################################################
+
+import os
+import sys
+import pty
+import tty
+import time
+import random
+import struct
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from frame import encode_frame, MAX_FRAME
+
+STAMP_FORMAT = '<IQ'
+STAMP_SIZE = struct.calcsize(STAMP_FORMAT)
+
+
+# (sequence number, write time) of a payload made by FrameGenerator
+def read_stamp(payload):
+  return struct.unpack_from(STAMP_FORMAT, payload)
+
+
+################# Classe FrameGenerator ########################################
+# payload_size: bytes of each payload, at least STAMP_SIZE
+# corruption: fraction of the frames written with a wrong checksum
+# noise: fraction of the frames followed by random bytes out of any frame
+# The sequence numbers of the corrupted frames are kept in bad, so what a
+# receiver saved can be checked against what was sent.
+class FrameGenerator:
+  def __init__(self, payload_size=16, corruption=0.0, noise=0.0, seed=0):
+    if payload_size < STAMP_SIZE or payload_size + 5 > MAX_FRAME:
+      raise ValueError('payload size must be between %d and %d' % (STAMP_SIZE, MAX_FRAME - 5))
+    self.payload_size = payload_size
+    self.corruption = corruption
+    self.noise = noise
+    self.random = random.Random(seed)
+    self.padding = bytes(range(payload_size - STAMP_SIZE))
+    self.sequence = 0
+    self.sent = 0
+    self.bad = []
+    self.noise_bytes = 0
+
+  def frame(self):
+    payload = struct.pack(STAMP_FORMAT, self.sequence, time.monotonic_ns()) + self.padding
+    self.sequence += 1
+    frame = encode_frame(payload)
+    if self.corruption and self.random.random() < self.corruption:
+      # a bit above the lowest one, the checksum ignores bit 0 of the XOR
+      position = self.random.randrange(3, len(frame) - 2)
+      frame = frame[:position] + bytes([frame[position] ^ 0x10]) + frame[position + 1:]
+      self.bad.append(self.sequence - 1)
+    else:
+      self.sent += 1
+    if self.noise and self.random.random() < self.noise:
+      garbage = bytes(self.random.randrange(256) for _ in range(self.random.randrange(1, 16)))
+      self.noise_bytes += len(garbage)
+      frame += garbage
+    return frame
+
+  def burst(self, count):
+    return b''.join(self.frame() for _ in range(count))
+
+  def stats(self):
+    return {'frames': self.sequence, 'good': self.sent, 'corrupted': len(self.bad),
+            'noise_bytes': self.noise_bytes}
+
+################## Fim da classe FrameGenerator ################################
+
+
+# a raw pty pair, returns (master fd, slave fd, slave name)
+def open_pty():
+  master, slave = pty.openpty()
+  tty.setraw(slave)
+  return master, slave, os.ttyname(slave)
+
+
+# writes frames into fd at rate frames per second for duration seconds, in
+# bursts of about 1 ms. rate 0 writes as fast as the reader takes them.
+# Returns the seconds spent writing.
+def stream(fd, generator, rate, duration, burst_ms=1.0):
+  if rate:
+    count = max(1, int(rate * burst_ms / 1000))
+    period = count / rate
+  else:
+    count = max(1, 4096 // (generator.payload_size + 5))
+    period = 0
+  start = time.monotonic()
+  next_write = start
+  while time.monotonic() - start < duration:
+    data = generator.burst(count)
+    while data:
+      data = data[os.write(fd, data):]
+    if period:
+      next_write += period
+      delay = next_write - time.monotonic()
+      if delay > 0:
+        time.sleep(delay)
+  return time.monotonic() - start
+
+
+# writes text lines for the repeat mode, returns (bytes written, seconds)
+def stream_text(fd, rate, duration, line=b'sensor 12.5 13.25 -0.5 ok\n'):
+  count = max(1, int(rate / 1000)) if rate else max(1, 4096 // len(line))
+  period = count / rate if rate else 0
+  block = line * count
+  nbytes = 0
+  start = time.monotonic()
+  next_write = start
+  while time.monotonic() - start < duration:
+    data = block
+    while data:
+      data = data[os.write(fd, data):]
+    nbytes += len(block)
+    if period:
+      next_write += period
+      delay = next_write - time.monotonic()
+      if delay > 0:
+        time.sleep(delay)
+  return nbytes, time.monotonic() - start
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='simulated serial device on a pty')
+  parser.add_argument('-r', '--rate', type=float, default=1000, help='frames per second (0: as fast as possible)')
+  parser.add_argument('-s', '--payload_size', type=int, default=16)
+  parser.add_argument('-c', '--corruption', type=float, default=0.0, help='fraction of frames with a bad checksum')
+  parser.add_argument('-z', '--noise', type=float, default=0.0, help='fraction of frames followed by random bytes')
+  parser.add_argument('-t', '--duration', type=float, default=60)
+  parser.add_argument('-w', '--wait', type=float, default=5, help='seconds to wait before writing, to start the reader')
+  args = parser.parse_args()
+
+  master, slave, name = open_pty()
+  print('device:', name)
+  sys.stdout.flush()
+  time.sleep(args.wait)
+  generator = FrameGenerator(args.payload_size, args.corruption, args.noise)
+  elapsed = stream(master, generator, args.rate, args.duration)
+  print(generator.stats(), '%.0f frames/s' % (generator.sequence / elapsed))
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Memory mapped readers for the pslog binary files
+#    | count(int32) | data | data | ... |
+#  the types are the same list given to read_binary_file.m, for example
+#  ['uint32','int32','float32','float32'], one entry per field of a package,
+#  or the numpy dtype of a package (Schema.dtype, see schema.py).
+#  The indexed format is described in binwriter.py.
+########################################################
+
+import sys
+import mmap
+import struct
+
+import numpy as np
+
+from binwriter import INDEXED_MAGIC, INDEXED_HEADER_FORMAT, INDEXED_HEADER_SIZE, RECORD_FORMAT, RECORD_SIZE
+
+# fread type names and their little endian numpy equivalent
+TYPES = {'uint8': '<u1', 'uchar': '<u1', 'int8': '<i1', 'schar': '<i1', 'char': 'S1',
+         'uint16': '<u2', 'ushort': '<u2', 'int16': '<i2', 'short': '<i2',
+         'uint32': '<u4', 'uint': '<u4', 'int32': '<i4', 'int': '<i4',
+         'uint64': '<u8', 'int64': '<i8',
+         'float32': '<f4', 'single': '<f4', 'float': '<f4',
+         'float64': '<f8', 'double': '<f8'}
+
+HEADER_FORMAT = 'i'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# a record longer than this is garbage
+MAX_RECORD = 1 << 16
+# a record this older than the one before it is garbage (the packages of
+# several devices in one file are not in strict time order)
+MAX_REORDER_NS = 10 * 1000000000
+# records checked at once by scan_records
+SCAN_RUN = 1 << 20
+
+
+# packed structured dtype from a list of fread type names, the names may be
+# padded with spaces as in the matlab cellstr
+def make_dtype(types, names=None):
+  formats = []
+  for t in types:
+    t = t.strip()
+    if t not in TYPES:
+      raise ValueError('unknown type: %s' % (t))
+    formats.append(TYPES[t])
+  if names is None:
+    names = ['f%d' % (i) for i in range(len(formats))]
+  return np.dtype({'names': list(names), 'formats': formats})
+
+
+# offsets and timestamps of the records of an indexed file from start to
+# end, and the end of the last one. The walk stops at the first record that
+# can not be one (too long, past end, zero or much older timestamp), as the
+# end of a file that was not closed may hold garbage. The runs of records of
+# the same length, the usual case, are checked with numpy at disk speed.
+def scan_records(buffer, start, end, last_timestamp=0):
+  offsets = []
+  timestamps = []
+  offset = start
+  last = last_timestamp
+  while offset + RECORD_SIZE <= end:
+    length, stamp = struct.unpack_from(RECORD_FORMAT, buffer, offset)
+    step = RECORD_SIZE + length
+    if length > MAX_RECORD or offset + step > end or not stamp or stamp + MAX_REORDER_NS < last:
+      break
+    n = min((end - offset) // step, SCAN_RUN)
+    if n > 1 and struct.unpack_from('<I', buffer, offset + step)[0] == length:
+      lengths = np.ndarray(n, '<u4', buffer, offset, (step,))
+      stamps = np.ndarray(n, '<u8', buffer, offset + 4, (step,))
+      good = lengths == length
+      good[1:] &= stamps[1:] + MAX_REORDER_NS >= stamps[:-1]
+      good &= stamps != 0
+      n = n if good.all() else int(np.argmin(good))
+      offsets.append(offset + np.arange(n, dtype=np.uint64) * step)
+      timestamps.append(np.array(stamps[:n], dtype=np.uint64))
+      last = int(stamps[n - 1])
+    else:
+      n = 1
+      offsets.append(np.array([offset], dtype=np.uint64))
+      timestamps.append(np.array([stamp], dtype=np.uint64))
+      last = stamp
+    offset += n * step
+  if not offsets:
+    return np.zeros(0, np.uint64), np.zeros(0, np.uint64), offset
+  return np.concatenate(offsets), np.concatenate(timestamps), offset
+
+
+################# Classe BinaryReader ########################################
+# the packages are a structured array over the mapped file, nothing is read
+# until it is used, so files larger than the memory can be sliced or iterated
+class BinaryReader:
+  def __init__(self, filename, types, names=None):
+    self.filename = filename
+    self.dtype = types if isinstance(types, np.dtype) else make_dtype(types, names)
+    self.file = open(filename, 'rb')
+    self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+    self.count, = struct.unpack_from(HEADER_FORMAT, self.map, 0)
+    # a file cut short holds less packages than its header says
+    available = (len(self.map) - HEADER_SIZE) // self.dtype.itemsize
+    if self.count > available:
+      print('warning: %s header says %d packages, file has %d' % (filename, self.count, available), file=sys.stderr)
+      self.count = available
+    self.data = np.frombuffer(self.map, self.dtype, self.count, HEADER_SIZE)
+
+  def __len__(self):
+    return self.count
+
+  def __getitem__(self, key):
+    return self.data[key]
+
+  # packages from start to stop, a view without copies
+  def frames(self, start=0, stop=None):
+    return self.data[start:stop]
+
+  # iterate over the packages size at a time
+  def chunks(self, size, start=0, stop=None):
+    stop = self.count if stop is None else min(stop, self.count)
+    for first in range(start, stop, size):
+      yield self.data[first:min(first + size, stop)]
+
+  # the map stays open while any view of it is alive, it is released when the
+  # last one is collected
+  def close(self):
+    self.data = None
+    try:
+      self.map.close()
+    except BufferError:
+      pass
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+################## Fim da classe BinaryReader ################################
+
+
+################# Classe IndexedReader ########################################
+# random access to the packages of an indexed file by number or by receive
+# time, both in O(log n) or better through the index at the end of the file.
+# A file that was not closed has no index, it is rebuilt by walking the
+# records written up to the last flush.
+class IndexedReader:
+  def __init__(self, filename):
+    self.filename = filename
+    self.file = open(filename, 'rb')
+    self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, _, count, index_offset, data_end = struct.unpack_from(INDEXED_HEADER_FORMAT, self.map, 0)
+    if magic != INDEXED_MAGIC:
+      raise ValueError('%s is not an indexed pslog file' % (filename))
+    self.version = version
+    self.data_end = data_end
+    if index_offset:
+      index = np.frombuffer(self.map, '<u8', 2 * count, index_offset).reshape(count, 2)
+      self.offsets = index[:, 0]
+      self.timestamps = index[:, 1]
+    else:
+      self.offsets, self.timestamps = self.scan(data_end)
+    self.count = len(self.offsets)
+
+  # walk the records from the first one to end, used when there is no index
+  def scan(self, end):
+    offsets, timestamps, _ = scan_records(self.map, INDEXED_HEADER_SIZE, min(end, len(self.map)))
+    return offsets, timestamps
+
+  def __len__(self):
+    return self.count
+
+  # data of package n, a memoryview over the map
+  def frame(self, n):
+    offset = int(self.offsets[n])
+    length, _ = struct.unpack_from(RECORD_FORMAT, self.map, offset)
+    start = offset + RECORD_SIZE
+    return memoryview(self.map)[start:start + length]
+
+  def __getitem__(self, n):
+    return self.frame(n)
+
+  def timestamp(self, n):
+    return int(self.timestamps[n])
+
+  # (timestamp, data) of the packages from start to stop
+  def frames(self, start=0, stop=None):
+    stop = self.count if stop is None else min(stop, self.count)
+    for n in range(start, stop):
+      yield self.timestamp(n), self.frame(n)
+
+  # number of the first package received at or after t (ns)
+  def find_time(self, t):
+    return int(np.searchsorted(self.timestamps, t, side='left'))
+
+  # range of packages received between t0 and t1 (ns), t1 excluded
+  def time_window(self, t0, t1):
+    return self.find_time(t0), self.find_time(t1)
+
+  def close(self):
+    self.offsets = self.timestamps = None
+    try:
+      self.map.close()
+    except BufferError:
+      pass
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+################## Fim da classe IndexedReader ################################
+
+
+# same as read_binary_file.m, the packages as a structured array
+def read_binary_file(filename, types):
+  return BinaryReader(filename, types).data
+
+
+if __name__ == '__main__':
+  if len(sys.argv) == 2:
+    reader = IndexedReader(sys.argv[1])
+    print(reader.count, 'packages')
+    for t, data in reader.frames(0, 10):
+      print(t, bytes(data))
+    exit(0)
+  if len(sys.argv) < 3:
+    print('usage: binreader.py file.bin type [type ...] | binreader.py file.pslx')
+    exit(1)
+  reader = BinaryReader(sys.argv[1], sys.argv[2:])
+  print(reader.count, 'packages of', reader.dtype.itemsize, 'bytes')
+  print(reader[:10])
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Streaming writers for the pslog binary files
+#  legacy format, readable by read_binary_file.m:
+#    | count(int32) | data | data | ... |
+#  indexed format, for packages of any size and with receive timestamps:
+#    | header | record | record | ... | index |
+#    header: magic 'PSLX', version(uint16), reserved(uint16), count(uint64),
+#            index offset(uint64, 0 while open), data end(uint64)
+#    record: length(uint32) | timestamp(uint64, monotonic ns) | data
+#    index: one (record offset(uint64), timestamp(uint64)) per package
+#  frames are appended as they arrive and the header is rewritten in place at
+#  every flush, so the file is always readable up to the last flush. With
+#  checkpoints the index entries are also appended at every flush to a side
+#  file (filename.idx, the same uint64 pairs) removed on close, so recover.py
+#  does not have to walk the records of a file that was never closed.
+########################################################
+
+import os
+import sys
+import time
+import struct
+from array import array
+
+HEADER_FORMAT = 'i'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+INDEXED_MAGIC = b'PSLX'
+INDEXED_VERSION = 1
+INDEXED_HEADER_FORMAT = '<4sHHQQQ'
+INDEXED_HEADER_SIZE = struct.calcsize(INDEXED_HEADER_FORMAT)
+RECORD_FORMAT = '<IQ'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+CHECKPOINT_EXTENSION = '.idx'
+
+################# Classe BinaryWriter ########################################
+# flush_frames: flush after this many frames (0 disables)
+# flush_ms: flush when this many milliseconds passed since the last flush
+#           (0 disables), checked when a frame is written
+# buffer_size: size of the write buffer in bytes
+# fsync: force the data to the disk at every flush
+# metrics: a metrics.Metrics that gets the time of every fsync
+# checkpoint: for the interface of IndexedWriter, the count header rewritten
+#             at every flush is the checkpoint of this format
+class BinaryWriter:
+  def __init__(self, filename, flush_frames=0, flush_ms=1000, buffer_size=1 << 20, fsync=True, metrics=None,
+               checkpoint=False):
+    self.filename = filename
+    self.metrics = metrics
+    self.flush_frames = flush_frames
+    self.flush_ms = flush_ms
+    self.fsync = fsync
+    self.count = 0
+    self.pending = 0
+    self.file = open(filename, 'wb', buffering=buffer_size)
+    self.file.write(self.header())
+    self.last_flush = time.monotonic()
+
+  def header(self):
+    return struct.pack(HEADER_FORMAT, self.count)
+
+  # the timestamp is only kept by the indexed format
+  def write(self, frame, timestamp=None):
+    self.file.write(frame)
+    self.count += 1
+    self.pending += 1
+    if self.flush_frames and self.pending >= self.flush_frames:
+      self.flush()
+    elif self.flush_ms and (time.monotonic() - self.last_flush) * 1000 >= self.flush_ms:
+      self.flush()
+
+  # flush when flush_ms passed with frames waiting, called between reads so
+  # the last frames before a silence are not left in the buffer
+  def tick(self):
+    if self.pending and self.flush_ms and (time.monotonic() - self.last_flush) * 1000 >= self.flush_ms:
+      self.flush()
+
+  # write the buffered frames and then patch the count header, in this order
+  # a crash never leaves a header counting frames that are not on the disk
+  def flush(self):
+    if self.file.closed:
+      return
+    self.file.flush()
+    if self.fsync and self.pending:
+      self.sync()
+    os.pwrite(self.file.fileno(), self.header(), 0)
+    if self.fsync and self.pending:
+      self.sync()
+    self.pending = 0
+    self.last_flush = time.monotonic()
+
+  def sync(self):
+    if self.metrics is None:
+      os.fsync(self.file.fileno())
+      return
+    start = time.monotonic_ns()
+    os.fsync(self.file.fileno())
+    self.metrics.observe('fsync', time.monotonic_ns() - start)
+
+  def close(self):
+    if self.file.closed:
+      return
+    self.flush()
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+################## Fim da classe BinaryWriter ################################
+
+
+################# Classe IndexedWriter ########################################
+# same flushing policy as BinaryWriter, the index is appended on close
+# checkpoint: keep the index up to the last flush in filename.idx
+class IndexedWriter (BinaryWriter):
+  def __init__(self, filename, flush_frames=0, flush_ms=1000, buffer_size=1 << 20, fsync=True, metrics=None,
+               checkpoint=False):
+    self.offset = INDEXED_HEADER_SIZE
+    self.index_offset = 0
+    self.offsets = array('Q')
+    self.timestamps = array('Q')
+    self.checkpoint = None
+    self.checkpointed = 0
+    BinaryWriter.__init__(self, filename, flush_frames, flush_ms, buffer_size, fsync, metrics)
+    if checkpoint:
+      self.checkpoint = open(filename + CHECKPOINT_EXTENSION, 'wb')
+
+  def header(self):
+    return struct.pack(INDEXED_HEADER_FORMAT, INDEXED_MAGIC, INDEXED_VERSION, 0,
+                       self.count, self.index_offset, self.offset)
+
+  def write(self, frame, timestamp=None):
+    if timestamp is None:
+      timestamp = time.monotonic_ns()
+    self.offsets.append(self.offset)
+    self.timestamps.append(timestamp)
+    self.file.write(struct.pack(RECORD_FORMAT, len(frame), timestamp))
+    self.offset += RECORD_SIZE + len(frame)
+    BinaryWriter.write(self, frame)
+
+  # the index is written as two interleaved uint64 columns
+  def index_bytes(self, first, last):
+    index = array('Q', bytes(16 * (last - first)))
+    index[0::2] = self.offsets[first:last]
+    index[1::2] = self.timestamps[first:last]
+    if sys.byteorder != 'little':
+      index.byteswap()
+    return index.tobytes()
+
+  def write_index(self):
+    self.file.write(self.index_bytes(0, self.count))
+    self.index_offset = self.offset
+
+  # the entries go to the side file after their records are on the disk
+  def flush(self):
+    BinaryWriter.flush(self)
+    if self.checkpoint is not None and self.checkpointed < self.count and not self.index_offset:
+      self.checkpoint.write(self.index_bytes(self.checkpointed, self.count))
+      self.checkpoint.flush()
+      if self.fsync:
+        os.fsync(self.checkpoint.fileno())
+      self.checkpointed = self.count
+
+  def close(self):
+    if self.file.closed:
+      return
+    self.write_index()
+    self.pending += 1
+    BinaryWriter.close(self)
+    if self.checkpoint is not None:
+      self.checkpoint.close()
+      os.remove(self.checkpoint.name)
+      self.checkpoint = None
+
+################## Fim da classe IndexedWriter ################################
+
+
+# writer class for each output format
+WRITERS = {'legacy': BinaryWriter, 'indexed': IndexedWriter}
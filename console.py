@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Console output of the received packages
+#  frames: one line per package as before, but built with a single string
+#          and written once per read instead of once per byte
+#  summary: a status line redrawn refresh_hz times per second with the
+#           rates, the error counts and a hex dump of the last package
+#  quiet: nothing per package
+#  so a slow terminal never holds the acquisition back for long.
+########################################################
+
+import sys
+from time import monotonic_ns
+
+MODES = ('frames', 'summary', 'quiet')
+# text of each byte value in the frames mode, as print_data wrote them
+BYTE_TEXT = ['%d ' % (b) for b in range(256)]
+# bytes of the last package shown in the summary
+DUMP_BYTES = 24
+# the buffered lines are written when they reach this size
+BUFFER_SIZE = 1 << 16
+
+
+################# Classe Console ########################################
+# mode: one of MODES
+# refresh_hz: how many times per second the summary is redrawn
+# out: where to write (default=sys.stdout)
+class Console:
+  def __init__(self, mode='frames', refresh_hz=10, out=None):
+    if mode not in MODES:
+      raise ValueError('unknown display mode: %s' % (mode))
+    self.mode = mode
+    self.out = out if out is not None else sys.stdout
+    self.period = 1000000000 // max(1, refresh_hz)
+    self.tty = hasattr(self.out, 'isatty') and self.out.isatty()
+    self.lines = []
+    self.size = 0
+    self.next_refresh = monotonic_ns() + self.period
+    # summary
+    self.frames = 0
+    self.bytes = 0
+    self.errors = 0
+    self.skipped = 0
+    self.last = b''
+    self.last_source = None
+    self.last_refresh = (monotonic_ns(), 0, 0)
+    self.status = False
+
+  # a package received, n is its number
+  def frame(self, n, data, source=None):
+    if self.mode == 'frames':
+      if source is None:
+        line = '%d- Data: %s \n' % (n, ''.join(map(BYTE_TEXT.__getitem__, data)))
+      else:
+        line = '%d- Device %d Data: %s \n' % (n, source, ''.join(map(BYTE_TEXT.__getitem__, data)))
+      self.lines.append(line)
+      self.size += len(line)
+      if self.size >= BUFFER_SIZE:
+        self.flush()
+    elif self.mode == 'summary':
+      self.frames = n + 1
+      self.last = data
+      self.last_source = source
+
+  # after each read: bytes read so far and the error counters of the parser.
+  # The lines of the frames mode are written now, the summary when the
+  # refresh period ended
+  def update(self, nbytes, errors=0, skipped=0):
+    self.bytes = nbytes
+    self.errors = errors
+    self.skipped = skipped
+    if self.mode == 'frames':
+      self.flush()
+    elif self.mode == 'summary':
+      now = monotonic_ns()
+      if now >= self.next_refresh:
+        self.next_refresh = now + self.period
+        self.refresh(now)
+
+  # a line that is not a package, shown in the frames mode or when always
+  def message(self, text, always=False):
+    if self.mode == 'frames' or always:
+      if self.status:
+        self.lines.append('\n')
+        self.status = False
+      self.lines.append(text + '\n')
+      self.size += len(text) + 1
+      if self.mode != 'frames':
+        self.flush()
+
+  def refresh(self, now=None):
+    if self.mode == 'summary':
+      self.render(now or monotonic_ns())
+    self.flush()
+
+  def render(self, now):
+    then, frames, nbytes = self.last_refresh
+    elapsed = max(now - then, 1) / 1e9
+    self.last_refresh = (now, self.frames, self.bytes)
+    dump = self.last[:DUMP_BYTES].hex(' ')
+    if len(self.last) > DUMP_BYTES:
+      dump += ' ...'
+    source = '' if self.last_source is None else 'device %d ' % (self.last_source)
+    line = 'frames %d (%.0f/s) bytes %d (%.1f kB/s) errors %d skipped %d | last %s%d B: %s' % (
+           self.frames, (self.frames - frames) / elapsed, self.bytes, (self.bytes - nbytes) / elapsed / 1e3,
+           self.errors, self.skipped, source, len(self.last), dump)
+    if self.tty:
+      self.lines.append('\r' + line + '\x1b[K')
+      self.status = True
+    else:
+      self.lines.append(line + '\n')
+
+  def flush(self):
+    if self.lines:
+      self.out.write(''.join(self.lines))
+      self.out.flush()
+      self.lines = []
+      self.size = 0
+
+  def close(self):
+    if self.mode == 'summary':
+      self.render(monotonic_ns())
+    if self.status:
+      self.lines.append('\n')
+      self.status = False
+    self.flush()
+
+################## Fim da classe Console ################################
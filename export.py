@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Columnar export of the pslog captures
+#  the payload of the packages is decoded with the schema (schema.py) a chunk
+#  at a time, straight from the mapped file with numpy, and written as one
+#  column per field to HDF5 (h5py), Parquet or Arrow IPC (pyarrow), the
+#  format is chosen by the extension of the output:
+#    $ export.py data.bin data.parquet -s '<Iff time x y'
+#    $ export.py data.pslx data.h5          (schema from .pslogrc)
+#  The legacy format (.bin), the indexed format (.pslx, the receive time is
+#  added as the column 'timestamp') and segmented captures (.manifest.json)
+#  are read. Only a chunk is in memory at any time.
+########################################################
+
+import sys
+import argparse
+
+import numpy as np
+
+try:
+  import h5py
+except ImportError:
+  h5py = None
+try:
+  import pyarrow
+  import pyarrow.ipc
+  import pyarrow.parquet
+except ImportError:
+  pyarrow = None
+
+from binwriter import INDEXED_HEADER_SIZE
+from binreader import BinaryReader, IndexedReader
+from segments import SegmentReader, MANIFEST_EXTENSION
+from schema import Schema, configured_schema
+
+# packages per chunk: a row group of Parquet, a chunk of the HDF5 datasets
+CHUNK_ROWS = 1 << 20
+
+
+# the columns of a structured array, contiguous
+def columns(records, names):
+  return {name: np.ascontiguousarray(records[name]) for name in names}
+
+
+# chunks of the legacy format, views over the mapped file
+def legacy_chunks(filename, schema, rows):
+  with BinaryReader(filename, schema.dtype) as reader:
+    for chunk in reader.chunks(rows):
+      yield columns(chunk, schema.names)
+
+
+# chunks of the indexed format. When every package has the size of the
+# schema the records are an array of | length | timestamp | payload |, other
+# files are decoded package by package and the packages of another size are
+# skipped.
+def indexed_chunks(filename, schema, rows):
+  with IndexedReader(filename) as reader:
+    count = reader.count
+    record = np.dtype({'names': ['length', 'timestamp', 'payload'], 'formats': ['<u4', '<u8', schema.dtype]})
+    if count and reader.data_end == INDEXED_HEADER_SIZE + count * record.itemsize:
+      records = np.frombuffer(reader.map, record, count, INDEXED_HEADER_SIZE)
+      # with all the lengths right the records follow each other
+      if all(np.all(records['length'][first:first + rows] == schema.size) for first in range(0, count, rows)):
+        for first in range(0, count, rows):
+          chunk = records[first:first + rows]
+          data = {'timestamp': np.ascontiguousarray(chunk['timestamp'])}
+          data.update(columns(chunk['payload'], schema.names))
+          yield data
+        return
+    yield from frame_chunks(reader.frames(), schema, rows, filename)
+
+
+# chunks of a segmented capture, the segments are streamed in order
+def segment_chunks(filename, schema, rows):
+  reader = SegmentReader(filename, schema.size)
+  yield from frame_chunks(reader.frames(), schema, rows, filename)
+
+
+# chunks of (timestamp, data) packages, the timestamp may be None
+def frame_chunks(frames, schema, rows, filename):
+  stamps = []
+  payloads = []
+  skipped = 0
+  for stamp, data in frames:
+    if len(data) != schema.size:
+      skipped += 1
+      continue
+    stamps.append(stamp)
+    payloads.append(data)
+    if len(payloads) == rows:
+      yield frame_columns(stamps, payloads, schema)
+      stamps = []
+      payloads = []
+  if payloads:
+    yield frame_columns(stamps, payloads, schema)
+  if skipped:
+    print('warning: %s has %d packages of another size than the schema' % (filename, skipped), file=sys.stderr)
+
+
+def frame_columns(stamps, payloads, schema):
+  records = schema.decode(b''.join(payloads))
+  data = {}
+  if stamps[0] is not None:
+    data['timestamp'] = np.array(stamps, dtype=np.uint64)
+  data.update(columns(records, schema.names))
+  return data
+
+
+# the chunks of any capture, chosen by its extension
+def record_chunks(filename, schema, rows=CHUNK_ROWS):
+  if filename.endswith(MANIFEST_EXTENSION):
+    return segment_chunks(filename, schema, rows)
+  if filename.endswith('.pslx'):
+    return indexed_chunks(filename, schema, rows)
+  return legacy_chunks(filename, schema, rows)
+
+
+################# Classe HDF5Exporter ########################################
+# one resizable, chunked dataset per column
+class HDF5Exporter:
+  def __init__(self, filename, compression=None):
+    if h5py is None:
+      raise ValueError('HDF5 export needs the h5py module')
+    self.file = h5py.File(filename, 'w')
+    self.compression = compression
+    self.count = 0
+
+  def write(self, data):
+    rows = len(next(iter(data.values())))
+    if not self.count:
+      for name, column in data.items():
+        self.file.create_dataset(name, (0,), column.dtype, maxshape=(None,), chunks=(max(rows, 1),),
+                                 compression=self.compression)
+    for name, column in data.items():
+      dataset = self.file[name]
+      dataset.resize((self.count + rows,))
+      dataset[self.count:] = column
+    self.count += rows
+
+  def close(self):
+    self.file.attrs['count'] = self.count
+    self.file.close()
+
+################## Fim da classe HDF5Exporter ################################
+
+
+################# Classe ParquetExporter ########################################
+# one row group per chunk, without dictionary encoding: the samples of a
+# sensor are rarely repeated and the dictionary is built to be dropped
+class ParquetExporter:
+  def __init__(self, filename, compression=None):
+    if pyarrow is None:
+      raise ValueError('Parquet export needs the pyarrow module')
+    self.filename = filename
+    self.compression = compression or 'snappy'
+    self.writer = None
+    self.count = 0
+
+  def write(self, data):
+    table = pyarrow.table(data)
+    if self.writer is None:
+      self.writer = pyarrow.parquet.ParquetWriter(self.filename, table.schema, compression=self.compression,
+                                                   use_dictionary=False)
+    self.writer.write_table(table, row_group_size=max(table.num_rows, 1))
+    self.count += table.num_rows
+
+  def close(self):
+    if self.writer is not None:
+      self.writer.close()
+
+################## Fim da classe ParquetExporter ################################
+
+
+################# Classe ArrowExporter ########################################
+# Arrow IPC file (Feather v2), one record batch per chunk
+class ArrowExporter:
+  def __init__(self, filename, compression=None):
+    if pyarrow is None:
+      raise ValueError('Arrow export needs the pyarrow module')
+    self.filename = filename
+    self.compression = compression
+    self.writer = None
+    self.count = 0
+
+  def write(self, data):
+    batch = pyarrow.RecordBatch.from_pydict(data)
+    if self.writer is None:
+      options = pyarrow.ipc.IpcWriteOptions(compression=self.compression)
+      self.writer = pyarrow.ipc.new_file(self.filename, batch.schema, options=options)
+    self.writer.write_batch(batch)
+    self.count += batch.num_rows
+
+  def close(self):
+    if self.writer is not None:
+      self.writer.close()
+
+################## Fim da classe ArrowExporter ################################
+
+
+EXPORTERS = {'.h5': HDF5Exporter, '.hdf5': HDF5Exporter, '.parquet': ParquetExporter,
+             '.arrow': ArrowExporter, '.feather': ArrowExporter}
+
+
+def exporter(filename, compression=None):
+  for extension, cls in EXPORTERS.items():
+    if filename.endswith(extension):
+      return cls(filename, compression)
+  raise ValueError('unknown output format: %s, use one of %s' % (filename, ', '.join(EXPORTERS)))
+
+
+# convert the capture source into target, returns the number of packages
+def export(source, target, schema, rows=CHUNK_ROWS, compression=None):
+  if not isinstance(schema, Schema):
+    schema = Schema.parse(schema)
+  out = exporter(target, compression)
+  try:
+    for data in record_chunks(source, schema, rows):
+      out.write(data)
+  finally:
+    out.close()
+  return out.count
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='export a pslog capture (.bin, .pslx or .manifest.json) to HDF5, Parquet or Arrow')
+  parser.add_argument('source', type=str)
+  parser.add_argument('target', type=str, help='output file: ' + ', '.join(EXPORTERS))
+  parser.add_argument('-s', '--schema', type=str, default=None, help="layout of the payload, '<Iff time x y' or 'time:uint32, x:float32, y:float32' (default=schema of .pslogrc)")
+  parser.add_argument('--rows', type=int, default=CHUNK_ROWS, help='packages per chunk or row group (default=%d)' % (CHUNK_ROWS))
+  parser.add_argument('-c', '--compression', type=str, default=None, help='codec of the output, e.g. gzip for HDF5, zstd for Parquet')
+  args = parser.parse_args()
+
+  schema = args.schema or configured_schema()
+  if not schema:
+    print('Error: no schema, give one with -s or in .pslogrc')
+    exit(1)
+  try:
+    count = export(args.source, args.target, schema, args.rows, args.compression)
+  except ValueError as er:
+    print('Error:', str(er))
+    exit(1)
+  print(count, 'packages written to', args.target)
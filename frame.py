@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Streaming frame decoder for the pslog serial format
+#    | 0xFFFF | length(1 byte) | data | checksum1 | checksum2 |
+#  length counts itself, the data and the two checksum bytes.
+########################################################
+
+from functools import reduce
+from operator import xor
+
+HEADER = b'\xff\xff'
+# smallest valid length byte: the length itself plus the 2 checksums
+MIN_LENGTH = 3
+# a frame is the header plus length bytes, length fits in one byte
+MAX_FRAME = len(HEADER) + 0xFF
+
+
+#checksum of a raw frame without header: xor of the length byte and the data
+def checksum(buffer):
+  cksum1 = reduce(xor, buffer[:-2], 0) & 0xFE
+  return cksum1, (~cksum1) & 0xFE
+
+
+#build a complete frame (header included) around a payload, the same as the
+#serialize_struct in the README
+def encode_frame(payload):
+  body = bytes([len(payload) + MIN_LENGTH]) + bytes(payload)
+  return HEADER + body + bytes(checksum(body + b'\x00\x00'))
+
+
+################# Classe FrameParser ########################################
+# Receives chunks of any size, as returned by the serial port, and gives back
+# the payload of every complete and valid frame. Bytes that can not be the
+# start of a frame are dropped, and when a checksum fails the search restarts
+# one byte after the rejected header, so a real header hidden inside a corrupt
+# frame is not lost.
+class FrameParser:
+  def __init__(self, capacity=1 << 16):
+    self.buffer = bytearray(capacity)
+    self.view = memoryview(self.buffer)
+    self.start = 0
+    self.end = 0
+    # statistics
+    self.bytes = 0
+    self.frames = 0
+    self.errors = 0
+    self.skipped = 0
+
+  def pending(self):
+    return self.end - self.start
+
+  # append a chunk at the end of the buffer, moving the pending bytes to the
+  # front (or growing it) only when there is no room left
+  def _append(self, chunk):
+    size = len(chunk)
+    if self.end + size > len(self.buffer):
+      pending = self.end - self.start
+      if pending + size > len(self.buffer):
+        grown = bytearray(max(2 * len(self.buffer), pending + size))
+        grown[:pending] = self.buffer[self.start:self.end]
+        self.buffer = grown
+        self.view = memoryview(self.buffer)
+      else:
+        self.buffer[:pending] = self.buffer[self.start:self.end]
+      self.start = 0
+      self.end = pending
+    self.buffer[self.end:self.end + size] = chunk
+    self.end += size
+
+  # feed a chunk of bytes, yields the payload of each valid frame
+  def feed(self, chunk):
+    if chunk:
+      self.bytes += len(chunk)
+      self._append(chunk)
+    buffer = self.buffer
+    view = self.view
+    while True:
+      pos = buffer.find(HEADER, self.start, self.end)
+      if pos < 0:
+        # keep a trailing 0xFF, it may be the first half of a header
+        keep = 1 if self.end > self.start and buffer[self.end - 1] == 0xFF else 0
+        self.skipped += self.end - keep - self.start
+        self.start = self.end - keep
+        break
+      self.skipped += pos - self.start
+      self.start = pos
+      if self.end - pos < 3:
+        break
+      length = buffer[pos + 2]
+      if length < MIN_LENGTH:
+        self.errors += 1
+        self.skipped += 1
+        self.start = pos + 1
+        continue
+      stop = pos + 2 + length
+      if stop > self.end:
+        break
+      frame = view[pos + 2:stop]
+      cksum1, cksum2 = checksum(frame)
+      if cksum1 == buffer[stop - 2] and cksum2 == buffer[stop - 1]:
+        self.frames += 1
+        self.start = stop
+        yield bytes(frame[1:-2])
+      else:
+        # resync: the header may have been a pair of data bytes
+        self.errors += 1
+        self.skipped += 1
+        self.start = pos + 1
+    if self.start == self.end:
+      self.start = self.end = 0
+
+  def reset(self):
+    self.start = self.end = 0
+
+################## Fim da classe FrameParser ################################
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Acquisition as objects, to embed pslog in other programs
+#  a FrameSource gives the chunks of bytes read from a serial port (or a
+#  pseudo terminal), a raw dump file or a TCP socket, with the time they were
+#  read. A SerialLogger owns a source, its frame parser and the sinks of the
+#  packages (sinks.py) and holds no global state, so several of them can run
+#  in the same process. The packages of each read come as one batch:
+#    logger = SerialLogger(SerialSource('/dev/ttyACM0', 115200), '<Iff time x y')
+#    logger.add_sink(BinarySink(IndexedWriter('data.pslx')))
+#    with logger:
+#      for stamp, frames in logger:          # or async for, or run(callback)
+#        ...
+########################################################
+
+from time import monotonic_ns
+
+from frame import FrameParser
+from pipeline import SerialReader
+from sinks import Fanout
+
+# bytes of a read of a file or a socket
+CHUNK_SIZE = 1 << 16
+# latency histograms of the stages of a read, traced by a SerialLogger:
+#   read: from the end of the read to the start of its decoding, the time the
+#         chunk waited in the pipeline queue
+#   validate: the frame parser finding and checking the packages
+#   enqueue: the sinks taking the batch (file, servers queues, decoding)
+# the servers add the send stage
+STAGES = ('read', 'validate', 'enqueue')
+
+
+# wait for data on the serial port and read all the available bytes at once.
+# The read blocks in select on the port (inside pyserial) until read_min
+# bytes arrive or the read timeout ends, so no CPU is used while it is idle
+def read_chunk(ser, read_min=1):
+  buffer = ser.read(max(read_min, ser.inWaiting()))
+  num_bytes = ser.inWaiting()
+  if num_bytes:
+    buffer += ser.read(num_bytes)
+  return buffer
+
+
+################# Classe FrameSource ########################################
+# read() returns (receive time in monotonic ns, chunk), an empty chunk when
+# nothing arrived before the timeout and None when the source has ended
+class FrameSource:
+  def open(self):
+    return self
+
+  def read(self):
+    return None
+
+  def close(self):
+    pass
+
+  def __enter__(self):
+    return self.open()
+
+  def __exit__(self, *exc):
+    self.close()
+
+################## Fim da classe FrameSource ################################
+
+
+################# Classe SerialSource ########################################
+# a serial port or a pseudo terminal, opened with pyserial
+# timeout: seconds a read waits for read_min bytes (None: forever)
+# pipeline: a SerialReader thread drains the port into a queue of queue_size
+#           chunks, read() waits at most idle_timeout seconds for one
+# ser: a serial.Serial to use instead of a new one, pyserial is imported only
+#      to build the new one
+# low_latency: ask the driver to hand over the bytes at once (the latency
+#              timer of the USB serial adapters), low_latency tells after
+#              open whether the port took it
+class SerialSource (FrameSource):
+  def __init__(self, port, baudrate=115200, timeout=None, read_min=1, pipeline=False, queue_size=4096,
+               idle_timeout=None, ser=None, low_latency=False):
+    self.port = port
+    self.baudrate = baudrate
+    self.timeout = timeout
+    self.read_min = read_min
+    self.pipeline = pipeline
+    self.queue_size = queue_size
+    self.idle_timeout = idle_timeout
+    if ser is None:
+      import serial
+      ser = serial.Serial()
+    self.ser = ser
+    self.low_latency = low_latency
+    self.reader = None
+
+  # raises serial.SerialException when the port can not be opened
+  def open(self):
+    self.ser.port = self.port
+    self.ser.baudrate = self.baudrate
+    self.ser.timeout = self.timeout
+    self.ser.open()
+    if self.low_latency:
+      try:
+        self.ser.set_low_latency_mode(True)
+      except (AttributeError, NotImplementedError, ValueError, OSError):
+        # not a serial driver that has it (a pseudo terminal, another OS)
+        self.low_latency = False
+    if self.pipeline:
+      self.reader = SerialReader(self.ser, self.queue_size)
+      self.reader.start()
+    return self
+
+  # raises the error of the port, also the one the pipeline thread got
+  def read(self):
+    if self.reader is None:
+      chunk = read_chunk(self.ser, self.read_min)
+      return monotonic_ns(), chunk
+    chunk = self.reader.get(self.idle_timeout)
+    if chunk is None:
+      raise self.reader.error
+    return chunk
+
+  def close(self):
+    if self.ser.is_open:
+      self.ser.close()
+
+################## Fim da classe SerialSource ################################
+
+
+################# Classe FileSource ########################################
+# a raw dump of a serial port (e.g. cat /dev/ttyACM0 > dump.raw), read in
+# chunks of chunk_size bytes
+class FileSource (FrameSource):
+  def __init__(self, filename, chunk_size=CHUNK_SIZE):
+    self.filename = filename
+    self.chunk_size = chunk_size
+    self.file = None
+
+  def open(self):
+    self.file = open(self.filename, 'rb')
+    return self
+
+  def read(self):
+    chunk = self.file.read(self.chunk_size)
+    if not chunk:
+      return None
+    return monotonic_ns(), chunk
+
+  def close(self):
+    if self.file is not None:
+      self.file.close()
+      self.file = None
+
+################## Fim da classe FileSource ################################
+
+
+################# Classe SocketSource ########################################
+# the raw bytes of a serial port served on TCP (e.g. by ser2net or socat)
+# timeout: seconds a read waits for data (None: forever)
+class SocketSource (FrameSource):
+  def __init__(self, host, port, timeout=None, chunk_size=CHUNK_SIZE):
+    self.host = host
+    self.port = port
+    self.timeout = timeout
+    self.chunk_size = chunk_size
+    self.sock = None
+
+  # socket is loaded only by the loggers that read one
+  def open(self):
+    import socket
+    self.sock = socket.create_connection((self.host, self.port))
+    self.sock.settimeout(self.timeout)
+    self.timeout_error = socket.timeout
+    return self
+
+  def read(self):
+    try:
+      chunk = self.sock.recv(self.chunk_size)
+    except self.timeout_error:
+      return monotonic_ns(), b''
+    if not chunk:
+      return None
+    return monotonic_ns(), chunk
+
+  def close(self):
+    if self.sock is not None:
+      self.sock.close()
+      self.sock = None
+
+################## Fim da classe SocketSource ################################
+
+
+################# Classe SerialLogger ########################################
+# source: a FrameSource
+# schema: a schema.Schema or its text, needed by the decoded sinks
+# data_size: stop after this number of packages (0: until the source ends)
+# trace: a metrics.Metrics that gets the latency histograms of the STAGES
+# The sinks get every batch before it is given to the caller, through the
+# iterators or the callback of run()
+class SerialLogger:
+  def __init__(self, source, schema=None, data_size=0, trace=None):
+    if isinstance(schema, (str, list)):
+      # numpy is loaded only by the loggers that decode
+      from schema import Schema
+      schema = Schema.parse(schema)
+    self.source = source
+    self.schema = schema
+    self.data_size = data_size
+    self.parser = FrameParser()
+    self.fanout = Fanout(schema)
+    self.count = 0
+    self.stages = [trace.histogram(name) for name in STAGES] if trace is not None else None
+
+  def add_sink(self, sink):
+    return self.fanout.add(sink)
+
+  def open(self):
+    self.source.open()
+    return self
+
+  def done(self):
+    return bool(self.data_size) and self.count >= self.data_size
+
+  # the packages of the next read as (stamp, frames), written to the sinks,
+  # frames is empty when the read timed out, None when the source ended
+  def read_batch(self):
+    chunk = self.source.read()
+    if chunk is None:
+      return None
+    stamp, chunk = chunk
+    if self.stages is not None and chunk:
+      frames = self.traced_write(stamp, chunk)
+    else:
+      frames = self.parse(chunk)
+      if frames:
+        self.fanout.write(stamp, frames)
+    self.fanout.tick()
+    return stamp, frames
+
+  # the packages of a chunk, up to data_size
+  def parse(self, chunk):
+    frames = list(self.parser.feed(chunk))
+    if self.data_size and self.count + len(frames) > self.data_size:
+      frames = frames[:self.data_size - self.count]
+    self.count += len(frames)
+    return frames
+
+  # parse and write to the sinks taking the time of each stage
+  def traced_write(self, stamp, chunk):
+    read, validate, enqueue = self.stages
+    start = monotonic_ns()
+    frames = self.parse(chunk)
+    parsed = monotonic_ns()
+    if frames:
+      self.fanout.write(stamp, frames)
+      enqueue.add(monotonic_ns() - parsed)
+    read.add(start - stamp)
+    validate.add(parsed - start)
+    return frames
+
+  # yields (stamp, frames) until the source ends or data_size packages, the
+  # empty batches of the read timeouts only with idle
+  def batches(self, idle=False):
+    while not self.done():
+      batch = self.read_batch()
+      if batch is None:
+        break
+      if batch[1] or idle:
+        yield batch
+
+  def __iter__(self):
+    return self.batches()
+
+  # the same batches from an asyncio task, the blocking reads are done in a
+  # thread of the loop executor
+  async def abatches(self, idle=False):
+    import asyncio
+    loop = asyncio.get_running_loop()
+    while not self.done():
+      batch = await loop.run_in_executor(None, self.read_batch)
+      if batch is None:
+        break
+      if batch[1] or idle:
+        yield batch
+
+  def __aiter__(self):
+    return self.abatches()
+
+  # read until the end calling callback(stamp, frames) for every batch,
+  # returns the number of packages
+  def run(self, callback=None):
+    for stamp, frames in self.batches():
+      if callback is not None:
+        callback(stamp, frames)
+    return self.count
+
+  def close(self):
+    self.fanout.close()
+    self.source.close()
+
+  def __enter__(self):
+    return self.open()
+
+  def __exit__(self, *exc):
+    self.close()
+
+################## Fim da classe SerialLogger ################################
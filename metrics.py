@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Live metrics of the logger
+#  counters and histograms kept in plain python objects, the hot path only
+#  adds to an int or to a list item. Values that other objects already count
+#  (the frame parser, the pipeline, the servers) are not copied on every
+#  frame, a collector function reads them when a snapshot is taken.
+#  The server processes write their counters into a SharedCounters block.
+#  A snapshot is printed as a stats line, dumped on a signal or served as
+#  JSON on a unix socket:
+#    $ python3 metrics.py /tmp/pslog.sock
+########################################################
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import multiprocessing as mp
+
+
+################# Classe Histogram ########################################
+# log2 buckets: bucket b holds the values from 2**(b-1) to 2**b - 1, so add()
+# is a bit_length and an increment and the percentiles are upper bounds
+# within a factor of 2
+class Histogram:
+  def __init__(self, unit='ns', buckets=64):
+    self.unit = unit
+    self.buckets = [0] * buckets
+    self.count = 0
+    self.total = 0
+    self.max = 0
+
+  def add(self, value):
+    self.buckets[value.bit_length()] += 1
+    self.count += 1
+    self.total += value
+    if value > self.max:
+      self.max = value
+
+  def percentile(self, p):
+    if not self.count:
+      return 0
+    target = p / 100.0 * self.count
+    seen = 0
+    for b, n in enumerate(self.buckets):
+      seen += n
+      if seen >= target and n:
+        return min((1 << b) - 1, self.max)
+    return self.max
+
+  def snapshot(self):
+    return {'unit': self.unit, 'count': self.count,
+            'mean': self.total / self.count if self.count else 0,
+            'p50': self.percentile(50), 'p99': self.percentile(99), 'max': self.max}
+
+################## Fim da classe Histogram ################################
+
+
+################# Classe SharedHistogram ########################################
+# the same buckets in shared memory, added to by one process (a server) and
+# read by the logger, without a lock as the SharedCounters
+class SharedHistogram (Histogram):
+  def __init__(self, unit='ns', buckets=64):
+    self.unit = unit
+    self.size = buckets
+    # the buckets, then count, total and max
+    self.values = mp.RawArray('q', buckets + 3)
+
+  def add(self, value):
+    values = self.values
+    size = self.size
+    values[value.bit_length()] += 1
+    values[size] += 1
+    values[size + 1] += value
+    if value > values[size + 2]:
+      values[size + 2] = value
+
+  @property
+  def buckets(self):
+    return self.values[:self.size]
+
+  @property
+  def count(self):
+    return self.values[self.size]
+
+  @property
+  def total(self):
+    return self.values[self.size + 1]
+
+  @property
+  def max(self):
+    return self.values[self.size + 2]
+
+################## Fim da classe SharedHistogram ################################
+
+
+################# Classe SharedCounters ########################################
+# fixed set of int64 counters in shared memory, written by one process (a
+# server) and read by the logger, no lock: each value is written by a
+# single process and a reader only needs a recent value
+class SharedCounters:
+  def __init__(self, names):
+    self.names = tuple(names)
+    self.index = {name: n for n, name in enumerate(self.names)}
+    self.values = mp.RawArray('q', len(self.names))
+
+  def add(self, name, value=1):
+    self.values[self.index[name]] += value
+
+  def set(self, name, value):
+    self.values[self.index[name]] = value
+
+  def snapshot(self):
+    return dict(zip(self.names, self.values))
+
+################## Fim da classe SharedCounters ################################
+
+
+################# Classe Metrics ########################################
+# counters: name -> int, changed with add()
+# histograms: name -> Histogram, changed with observe()
+# collectors: name -> function returning a dict, called at every snapshot
+# rates: names (counter or collector.key) printed with their rate per second
+class Metrics:
+  def __init__(self):
+    self.counters = {}
+    self.histograms = {}
+    self.collectors = {}
+    self.rates = set()
+    self.started = time.monotonic()
+    self.last = (self.started, {})
+
+  def add(self, name, value=1):
+    self.counters[name] = self.counters.get(name, 0) + value
+
+  def histogram(self, name, unit='ns'):
+    if name not in self.histograms:
+      self.histograms[name] = Histogram(unit)
+    return self.histograms[name]
+
+  # a histogram kept by another object, e.g. a SharedHistogram of a server
+  def attach(self, name, histogram):
+    self.histograms[name] = histogram
+    return histogram
+
+  def observe(self, name, value):
+    self.histogram(name).add(value)
+
+  # rates: keys of the collector dict that only grow (counters), the others
+  # are levels (gauges)
+  def register(self, name, collector, rates=()):
+    self.collectors[name] = collector
+    self.rates.update(name + '.' + key for key in rates)
+
+  def snapshot(self):
+    snapshot = {'uptime': time.monotonic() - self.started, 'counters': dict(self.counters)}
+    for name, collector in list(self.collectors.items()):
+      try:
+        snapshot[name] = collector()
+      except Exception as er:
+        snapshot[name] = {'error': str(er)}
+    snapshot['histograms'] = {name: h.snapshot() for name, h in self.histograms.items()}
+    return snapshot
+
+  # one line with the counters, their rates since the previous line and the
+  # p50 and p99 of the histograms
+  def line(self):
+    snapshot = self.snapshot()
+    now = time.monotonic()
+    then, previous = self.last
+    elapsed = max(now - then, 1e-9)
+    values = dict(snapshot['counters'])
+    for name, value in snapshot.items():
+      if isinstance(value, dict) and name not in ('counters', 'histograms'):
+        for key, v in value.items():
+          if isinstance(v, (int, float)):
+            values[name + '.' + key] = v
+    self.last = (now, values)
+    parts = []
+    for name, value in values.items():
+      if name in previous and (name in self.rates or name in self.counters):
+        parts.append('%s %d (%.0f/s)' % (name, value, (value - previous[name]) / elapsed))
+      else:
+        parts.append('%s %s' % (name, format_value(value)))
+    for name, h in snapshot['histograms'].items():
+      parts.append('%s p50 %s p99 %s' % (name, format_time(h['p50'], h['unit']), format_time(h['p99'], h['unit'])))
+    return ', '.join(parts)
+
+  def dump(self, file=None):
+    json.dump(self.snapshot(), file or sys.stderr, indent=2)
+    (file or sys.stderr).write('\n')
+
+################## Fim da classe Metrics ################################
+
+
+def format_value(value):
+  if isinstance(value, float):
+    return '%.2f' % (value)
+  return str(value)
+
+
+def format_time(value, unit):
+  if unit != 'ns':
+    return '%d %s' % (value, unit)
+  if value >= 1000000:
+    return '%.1f ms' % (value / 1e6)
+  return '%.0f us' % (value / 1e3)
+
+
+################# Classe MetricsServer ########################################
+# unix socket that answers every connection with a JSON snapshot and closes
+class MetricsServer (threading.Thread):
+  def __init__(self, metrics, path):
+    threading.Thread.__init__(self)
+    self.daemon = True
+    self.metrics = metrics
+    self.path = path
+    if os.path.exists(path):
+      os.remove(path)
+    self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.server.bind(path)
+    self.server.listen(5)
+
+  def run(self):
+    while True:
+      try:
+        connection, _ = self.server.accept()
+      except OSError:
+        break
+      try:
+        connection.sendall(json.dumps(self.metrics.snapshot()).encode() + b'\n')
+      except OSError:
+        pass
+      connection.close()
+
+  def close(self):
+    self.server.close()
+    if os.path.exists(self.path):
+      os.remove(self.path)
+
+################## Fim da classe MetricsServer ################################
+
+
+# client of MetricsServer
+def read_metrics(path):
+  client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  client.connect(path)
+  data = b''
+  while True:
+    chunk = client.recv(1 << 16)
+    if not chunk:
+      break
+    data += chunk
+  client.close()
+  return json.loads(data)
+
+
+if __name__ == '__main__':
+  if len(sys.argv) != 2:
+    print('usage: metrics.py socket_path')
+    exit(1)
+  print(json.dumps(read_metrics(sys.argv[1]), indent=2))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Acquisition from several serial ports in one process
+#  every port is watched by the same selector, a port is only read when it
+#  has data, and each one has its own frame parser. The packages are given
+#  back with the number of the device (its position in the list).
+########################################################
+
+import os
+import selectors
+from time import monotonic_ns
+
+import serial
+
+from frame import FrameParser
+
+
+# "port[:baudrate], port[:baudrate], ..." -> [(port, baudrate), ...]
+def parse_devices(text, baudrate=115200):
+  devices = []
+  for item in text.split(','):
+    item = item.strip()
+    if not item:
+      continue
+    if ':' in item:
+      port, rate = item.rsplit(':', 1)
+      devices.append((port.strip(), int(rate)))
+    else:
+      devices.append((item, baudrate))
+  return devices
+
+
+################# Classe Device ########################################
+class Device:
+  def __init__(self, source, port, baudrate):
+    self.source = source
+    self.port = port
+    self.baudrate = baudrate
+    self.ser = serial.Serial()
+    self.parser = FrameParser()
+    self.bytes = 0
+
+  def open(self):
+    self.ser.port = self.port
+    self.ser.baudrate = self.baudrate
+    self.ser.timeout = 0
+    self.ser.open()
+
+################## Fim da classe Device ################################
+
+
+################# Classe MultiReader ########################################
+class MultiReader:
+  def __init__(self, devices, verbose=False):
+    self.devices = [Device(n, port, rate) for n, (port, rate) in enumerate(devices)]
+    self.selector = selectors.DefaultSelector()
+    self.verbose = verbose
+
+  # opens every port, raises serial.SerialException with the failed one
+  def open(self):
+    for device in self.devices:
+      device.open()
+      self.selector.register(device.ser.fileno(), selectors.EVENT_READ, device)
+      print("Serial port ", device.port, "conected at", device.baudrate, "bps as device", device.source)
+
+  # yields (device number, receive time in monotonic ns, data) until every
+  # port is closed. With idle, (None, time, None) follows every wake up, also
+  # the ones after timeout seconds without data, so the files can be flushed
+  def frames(self, timeout=None, idle=False):
+    selector = self.selector
+    while selector.get_map():
+      for key, _ in selector.select(timeout):
+        device = key.data
+        try:
+          chunk = os.read(key.fd, 1 << 16)
+        except (BlockingIOError, InterruptedError):
+          continue
+        except OSError:
+          chunk = b''
+        if not chunk:
+          print('device', device.source, device.port, 'closed')
+          selector.unregister(key.fd)
+          continue
+        stamp = monotonic_ns()
+        device.bytes += len(chunk)
+        for data in device.parser.feed(chunk):
+          yield device.source, stamp, data
+      if idle:
+        yield None, monotonic_ns(), None
+
+  # bytes, errors and skipped bytes of all the devices
+  def totals(self):
+    return (sum(d.parser.bytes for d in self.devices), sum(d.parser.errors for d in self.devices),
+            sum(d.parser.skipped for d in self.devices))
+
+  def stats(self):
+    return [(d.source, d.port, d.bytes, d.parser.frames, d.parser.errors) for d in self.devices]
+
+  def close(self):
+    for device in self.devices:
+      if device.ser.is_open:
+        device.ser.close()
+    self.selector.close()
+
+################## Fim da classe MultiReader ################################
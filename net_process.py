@@ -1,31 +1,120 @@
 import multiprocessing as mp
+import os
 import socket
 import select
-import queue
+import struct
+import threading
+import time
+from collections import deque
+
+from subscription import Subscription, select_messages, PREFIX
 
 # Global variables associated to class TCPServer
 # message_queues = {}
+# the poll of the servers wakes up when a message arrives (the pipe of the
+# queue or the Wakeup of the ring), the timeout only expires the clients
 TIMEOUT=1000
+# poll timeout when reading from a shared memory ring without a Wakeup, it is
+# not a file descriptor so the poll can not wake up when a message arrives
+RING_TIMEOUT=10
+# most bytes given to one send call of the TCP server
+SEND_SIZE=1 << 18
+# longest subscribe line a TCP client may send, the limit of the lines of the
+# asyncio server
+LINE_SIZE=1 << 16
+# payload of an ethernet frame without the IP and UDP headers
+UDP_MTU=1472
+# header of the packed datagrams: sequence number and number of messages
+DATAGRAM_HEADER_FORMAT='<IH'
+DATAGRAM_HEADER_SIZE=struct.calcsize(DATAGRAM_HEADER_FORMAT)
+# header of the datagrams of one message: sequence number
+SEQUENCE_FORMAT='<I'
+SEQUENCE_SIZE=struct.calcsize(SEQUENCE_FORMAT)
 # Commonly used flag setes
 READ_ONLY = select.POLLIN | select.POLLPRI | select.POLLHUP | select.POLLERR
 READ_WRITE = READ_ONLY | select.POLLOUT
+# names of the metrics.SharedCounters given to the servers
+UDP_COUNTERS = ('clients', 'datagrams', 'send_errors')
+TCP_COUNTERS = ('clients', 'sent', 'backlog', 'backlog_max')
 
 ################# Classe UDPServer ########################################
+# ring: a shm_ring.ShmRing to read the messages from instead of the queue
+# consumer: index of this server in the ring
+# batch: pack as many messages as fit in mtu bytes into each datagram, else
+#        one message per datagram. Every datagram starts with a sequence
+#        number so the clients can count the lost ones.
+# keepalive: seconds without any datagram from a client before it is
+#            dropped (0 keeps the clients forever)
+# counters: a metrics.SharedCounters with UDP_COUNTERS, updated by the server
+# verbose: print every datagram sent
+# latency: a metrics.SharedHistogram of the time from the receive time of a
+#          message to its datagrams being sent, the messages carry the time
+# wakeup: with a ring, the logger wakes the server when it adds messages
+#         instead of the server polling the ring every RING_TIMEOUT ms
 class UDPServer (mp.Process):
-  def __init__(self, port):
+  def __init__(self, port, ring=None, consumer=1, batch=False, mtu=UDP_MTU, keepalive=0, counters=None, verbose=False,
+               latency=None, wakeup=False):
     mp.Process.__init__(self)
     self.port=port
     # self.soc = socket.socket()
-    self.clients = []
+    # address -> time of the last datagram received from it
+    self.clients = {}
     self.udp_server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    self.message_queue = mp.Queue()
+    self.message_queue = MessagePipe()
+    self.ring = ring
+    self.consumer = consumer
+    self.batch = batch
+    self.mtu = mtu
+    self.keepalive = keepalive
+    self.sequence = 0
+    self.counters = counters
+    self.verbose = verbose
+    self.latency = latency
+    self.wakeup = Wakeup() if wakeup and ring is not None else None
+
+  # send every message, one per datagram or packed, to every client, stamp is
+  # the receive time of the oldest one
+  def send_messages(self, msgs, stamp=None):
+    if not self.clients:
+      return
+    if self.batch:
+      datagrams = pack_datagrams(msgs, self.mtu, self.sequence)
+    else:
+      datagrams = number_datagrams(msgs, self.sequence)
+    self.sequence = (self.sequence + len(datagrams)) & 0xFFFFFFFF
+    sendto = self.udp_server.sendto
+    sent = errors = 0
+    for client in list(self.clients):
+      try:
+        for datagram in datagrams:
+          sendto(datagram, client)
+          sent += 1
+      except BlockingIOError:
+        # the socket buffer is full, the rest is lost for this client
+        errors += 1
+      except OSError as er:
+        errors += 1
+        if self.verbose:
+          print('removing client', client, str(er))
+        del self.clients[client]
+    if self.latency is not None and stamp and sent:
+      self.latency.add(time.monotonic_ns() - stamp)
+    if self.counters:
+      self.counters.add('datagrams', sent)
+      self.counters.add('send_errors', errors)
+      self.counters.set('clients', len(self.clients))
+    if self.verbose:
+      print('sent %d datagrams to %d clients' % (len(datagrams), len(self.clients)))
 
-  def broadcast(self, msg):
-    if self.clients and msg:
-      for client in self.clients:
-        self.udp_server.sendto(msg,client)
-        if verbose:
-          print('sending "%s" to %s' % (msg, client))
+  def expire_clients(self, now):
+    if not self.keepalive:
+      return
+    for client, last in list(self.clients.items()):
+      if now - last > self.keepalive:
+        print('client', client, 'expired')
+        del self.clients[client]
+    if self.counters:
+      self.counters.set('clients', len(self.clients))
 
   def run(self):
     host = ''                   # Get local machine name
@@ -36,46 +125,282 @@ class UDPServer (mp.Process):
       print(str(er))
       exit(1)
 
-    # Set up the poller
+    # Set up the poller, the datagrams from the clients and the messages of
+    # the logger wake it up
     poller = select.poll()
-    poller.register(self.udp_server, READ_ONLY | READ_WRITE)
-    fd_to_socket = { self.udp_server.fileno(): self.udp_server,}
+    poller.register(self.udp_server, READ_ONLY)
+
+    reader = self.ring.reader(self.consumer) if self.ring else None
+    incoming = incoming_fd(reader, self.message_queue, self.wakeup)
+    if incoming is not None:
+      poller.register(incoming, READ_ONLY)
+    timeout = RING_TIMEOUT if incoming is None else TIMEOUT
 
     print("UDP server running")
     while True:
-      events = poller.poll(TIMEOUT)
+      events = wait(poller, timeout, reader, self.wakeup)
+      now = time.monotonic()
       for fd, flag in events:
-        # Retrieve the actual socket from its file descriptor
-        s = fd_to_socket[fd]
-        # Handle inputs
+        if fd == incoming:
+          if self.wakeup is not None:
+            self.wakeup.drain()
+          continue
+        # Handle inputs, any datagram subscribes or renews a client
         if flag & (select.POLLIN | select.POLLPRI):
-          if s is self.udp_server:
-            # A "readable" udp_server socket is ready to accept a connection
-            data, addr = s.recvfrom(1024) # Establish connection with client.
-            print('new client from', addr)
-            self.clients.append(addr)
-        elif flag & select.POLLOUT:
-          # Socket is ready to send data, if there is any to send.
-          # self.message_queue.put(b'any data\n')
-          if not self.message_queue.empty():
-            next_msg = self.message_queue.get_nowait()
-            self.broadcast(next_msg)
+          while True:
+            try:
+              data, addr = self.udp_server.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+              break
+            if addr not in self.clients:
+              print('new client from', addr)
+            self.clients[addr] = now
+            if self.counters:
+              self.counters.set('clients', len(self.clients))
+      self.expire_clients(now)
+      msgs, stamp = read_messages(reader, self.message_queue, self.latency is not None)
+      if msgs:
+        self.send_messages(msgs, stamp)
 
-  def add_message(self,msg):
+  # stamp: receive time of the message (monotonic ns), taken now when the
+  # latency is traced and there is none
+  def add_message(self,msg,stamp=None):
     if msg:
-      self.message_queue.put(msg)
+      add_message(self, msg, stamp)
 
 ################## Fim da classe UDPserver ################################
 
 
+################# Classe Wakeup ########################################
+# wakes a server process sleeping in poll when the logger puts messages in
+# the shared memory ring, which has no file descriptor. The eventfd (a pipe
+# where there is none) is written only when the server said it would sleep,
+# so the logger makes no system call while the server is busy
+class Wakeup:
+  def __init__(self):
+    if hasattr(os, 'eventfd'):
+      self.read_fd = self.write_fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+    else:
+      self.read_fd, self.write_fd = os.pipe()
+      os.set_blocking(self.read_fd, False)
+      os.set_blocking(self.write_fd, False)
+    self.sleeping = mp.RawValue('b', 0)
+
+  def fileno(self):
+    return self.read_fd
+
+  # logger side, after the messages are in the ring
+  def notify(self):
+    if self.sleeping.value:
+      self.sleeping.value = 0
+      try:
+        # an eventfd takes a uint64
+        os.write(self.write_fd, (1).to_bytes(8, 'little'))
+      except BlockingIOError:
+        pass
+
+  # server side, arm before looking at the ring for the last time and
+  # sleeping, disarm once awake
+  def arm(self):
+    self.sleeping.value = 1
+
+  def disarm(self):
+    self.sleeping.value = 0
+
+  def drain(self):
+    try:
+      os.read(self.read_fd, 4096)
+    except BlockingIOError:
+      pass
+
+################## Fim da classe Wakeup ################################
+
+
+################# Classe MessagePipe ########################################
+# the messages of the logger to a server process without a ring: put leaves
+# them to a thread of the logger that writes all it has to a Pipe as one
+# batch, so the logger never waits for a slow server, and the server polls
+# the Pipe. The messages put and read are counted in shared memory, each
+# count by one process, for qsize.
+class MessagePipe:
+  def __init__(self):
+    self.reader, self.writer = mp.Pipe(duplex=False)
+    self.put_count = mp.RawValue('Q', 0)
+    self.get_count = mp.RawValue('Q', 0)
+    self.pending = deque()
+    # created by the first put, in the logger process
+    self.ready = None
+    self.feeder = None
+
+  def fileno(self):
+    return self.reader.fileno()
+
+  # logger side
+  def put(self, msg):
+    if self.feeder is None:
+      self.ready = threading.Event()
+      self.feeder = threading.Thread(target=self.feed, daemon=True)
+      self.feeder.start()
+    self.pending.append(msg)
+    self.put_count.value += 1
+    self.ready.set()
+
+  def feed(self):
+    pending = self.pending
+    while True:
+      self.ready.wait()
+      self.ready.clear()
+      while pending:
+        self.writer.send([pending.popleft() for _ in range(len(pending))])
+
+  # server side, the messages of the batches in the Pipe, without waiting,
+  # until there are at least limit of them
+  def get_batches(self, limit):
+    msgs = []
+    while len(msgs) < limit and self.reader.poll():
+      msgs.extend(self.reader.recv())
+    self.get_count.value += len(msgs)
+    return msgs
+
+  def qsize(self):
+    return self.put_count.value - self.get_count.value
+
+################## Fim da classe MessagePipe ################################
+
+
+# the file descriptor that becomes readable when the logger gives messages
+# to a server: the Pipe of the MessagePipe or the Wakeup of the ring, None
+# for a ring without Wakeup
+def incoming_fd(reader, message_queue, wakeup):
+  if reader is None:
+    return message_queue.fileno()
+  if wakeup is not None:
+    return wakeup.fileno()
+  return None
+
+
+# poll, when the server has a Wakeup it only sleeps if the ring is empty
+def wait(poller, timeout, reader, wakeup):
+  if wakeup is None:
+    return poller.poll(timeout)
+  wakeup.arm()
+  events = poller.poll(0 if reader.pending() else timeout)
+  wakeup.disarm()
+  return events
+
+
+# up to limit messages of the ring (the queue gives whole batches, which may
+# go past it) without blocking, and the receive time of the oldest one when
+# they are stamped (None otherwise)
+def read_messages(reader, message_queue, stamped, limit=1024):
+  if reader is not None:
+    stamps = [] if stamped else None
+    msgs = reader.read(limit, stamps)
+    return msgs, stamps[0] if stamps else None
+  msgs = message_queue.get_batches(limit)
+  if stamped and msgs:
+    return [m for _, m in msgs], msgs[0][0]
+  return msgs, None
+
+
+# add_message of the servers: the message goes to the ring, waking the
+# server, or to the queue, with its receive time when the latency is traced
+def add_message(server, msg, stamp=None):
+  if server.latency is not None and not stamp:
+    stamp = time.monotonic_ns()
+  if server.ring:
+    server.ring.put(msg, stamp or 0)
+    if server.wakeup is not None:
+      server.wakeup.notify()
+  elif server.latency is not None:
+    server.message_queue.put((stamp, msg))
+  else:
+    server.message_queue.put(msg)
+
+
+# pack messages into datagrams of up to mtu bytes:
+#   | sequence(uint32) | count(uint16) | length(uint16) | data | length | data |...
+# a message that does not fit in an empty datagram goes alone in one
+def pack_datagrams(msgs, mtu, sequence):
+  datagrams = []
+  parts = []
+  size = DATAGRAM_HEADER_SIZE
+  for msg in msgs:
+    needed = 2 + len(msg)
+    if parts and size + needed > mtu:
+      datagrams.append(struct.pack(DATAGRAM_HEADER_FORMAT, (sequence + len(datagrams)) & 0xFFFFFFFF, len(parts) // 2) + b''.join(parts))
+      parts = []
+      size = DATAGRAM_HEADER_SIZE
+    parts.append(struct.pack('<H', len(msg)))
+    parts.append(msg)
+    size += needed
+  if parts:
+    datagrams.append(struct.pack(DATAGRAM_HEADER_FORMAT, (sequence + len(datagrams)) & 0xFFFFFFFF, len(parts) // 2) + b''.join(parts))
+  return datagrams
+
+
+# one message per datagram, after its sequence number:
+#   | sequence(uint32) | data |
+def number_datagrams(msgs, sequence):
+  pack = struct.Struct(SEQUENCE_FORMAT).pack
+  return [pack((sequence + n) & 0xFFFFFFFF) + msg for n, msg in enumerate(msgs)]
+
+
+# client side of number_datagrams, returns (sequence, message)
+def unpack_numbered(datagram):
+  sequence, = struct.unpack_from(SEQUENCE_FORMAT, datagram, 0)
+  return sequence, datagram[SEQUENCE_SIZE:]
+
+
+# client side of pack_datagrams, returns (sequence, messages)
+def unpack_datagram(datagram):
+  sequence, count = struct.unpack_from(DATAGRAM_HEADER_FORMAT, datagram, 0)
+  msgs = []
+  offset = DATAGRAM_HEADER_SIZE
+  for _ in range(count):
+    length, = struct.unpack_from('<H', datagram, offset)
+    offset += 2
+    msgs.append(datagram[offset:offset + length])
+    offset += length
+  return sequence, msgs
+
+
 ################# Classe TCPServer ########################################
 # thread class for a tcp server
+# ring and consumer as in UDPServer
+# a client may send a subscribe line to get only part of the packages
+# (subscription.py), the other data it sends is echoed back. A line may come
+# in several reads, the start of a subscribe line waits for the rest of it
+# counters: a metrics.SharedCounters with TCP_COUNTERS, updated by the server
+# verbose: print every message received and sent
+# latency: a metrics.SharedHistogram of the time from the receive time of the
+#          oldest message a client waits for to its send, the messages carry
+#          the time
+# wakeup: as in UDPServer
+# nodelay: send the small messages at once (TCP_NODELAY) instead of letting
+#          the kernel wait to fill a segment
+# The messages go to a client as soon as they arrive, all that it has
+# waiting in one send, and the server waits for POLLOUT only for the clients
+# the kernel could not take everything from
 class TCPServer (mp.Process):
-  def __init__(self, port):
+  def __init__(self, port, ring=None, consumer=0, counters=None, verbose=False, latency=None, wakeup=False, nodelay=False):
     mp.Process.__init__(self)
     self.port=port
     self.message_queues = {}
-    self.message_queue = mp.Queue()
+    # connection -> Subscription, None for the whole stream
+    self.subscriptions = {}
+    # connection -> bytes of a subscribe line whose end did not arrive yet
+    self.lines = {}
+    # connection -> receive time of the oldest message it waits for
+    self.oldest = {}
+    self.message_queue = MessagePipe()
+    self.ring = ring
+    self.consumer = consumer
+    self.counters = counters
+    self.verbose = verbose
+    self.latency = latency
+    self.wakeup = Wakeup() if wakeup and ring is not None else None
+    self.nodelay = nodelay
 
   def run(self):
     try:
@@ -87,16 +412,28 @@ class TCPServer (mp.Process):
       print(str(er))
       exit(1)
 
-    poller = select.poll()
+    self.poller = poller = select.poll()
     poller.register(server, READ_ONLY)
-    fd_to_socket = { server.fileno(): server,}
+    self.fd_to_socket = fd_to_socket = { server.fileno(): server,}
+    reader = self.ring.reader(self.consumer) if self.ring else None
+    incoming = incoming_fd(reader, self.message_queue, self.wakeup)
+    if incoming is not None:
+      poller.register(incoming, READ_ONLY)
+    timeout = RING_TIMEOUT if incoming is None else TIMEOUT
     print("TCP server running")
 
     while True:
-      events = poller.poll(TIMEOUT)
+      events = wait(poller, timeout, reader, self.wakeup)
       for fd, flag in events:
-        # Retrieve the actual socket from its file descriptor
-        s = fd_to_socket[fd]
+        if fd == incoming:
+          if self.wakeup is not None:
+            self.wakeup.drain()
+          continue
+        # Retrieve the actual socket from its file descriptor, it may have
+        # been closed by an earlier event
+        s = fd_to_socket.get(fd)
+        if s is None:
+          continue
         # Handle inputs
         if flag & (select.POLLIN | select.POLLPRI):
           if s is server:
@@ -104,59 +441,42 @@ class TCPServer (mp.Process):
             connection, client_address = server.accept()
             print('new connection from', client_address)
             connection.setblocking(0)
+            if self.nodelay:
+              connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             fd_to_socket[ connection.fileno() ] = connection
-            poller.register(connection, READ_WRITE)
+            poller.register(connection, READ_ONLY)
 
             # Give the connection a queue for data we want to send
-            self.message_queues[connection] = queue.Queue()
+            self.message_queues[connection] = deque()
+            self.subscriptions[connection] = None
+            self.lines[connection] = bytearray()
           else:
             try:
               data = s.recv(1024)
             except:
-              poller.unregister(s)
-              s.close()
+              self.remove_client(s)
             else:
               if data:
                 # A readable client socket has data
-                if verbose:
-                  print('received "%s" from %s' % (data, s.getpeername()))
-                self.message_queues[s].put(data)
-                # Add output channel for response
-                poller.modify(s, READ_WRITE)
+                self.client_data(s, data)
               else:
                 # Interpret empty result as closed connection
                 print('closing', client_address, 'after reading no data')
-                # Stop listening for input on the connection
-                poller.unregister(s)
-                s.close()
-                # Remove message queue
-                del self.message_queues[s]
+                # Stop listening for input on the connection and remove
+                # its message queue
+                self.remove_client(s)
         elif flag & select.POLLHUP:
           # Client hung up
           print('closing', 'after receiving HUP')
-          # Stop listening for input on the connection
-          poller.unregister(s)
-          s.close()
+          self.remove_client(s)
         elif flag & select.POLLOUT:
-          # Socket is ready to send data, if there is any to send.
-          # self.message_queues[s].put(b'any data\n')
-          while not self.message_queue.empty():
-            self.add_message_to_queues(self.message_queue.get_nowait())
-
-          if not self.message_queues[s].empty():
-          # try:
-            # TODO send all queue messages at once or not, maybe let to next call
-            next_msg = self.message_queues[s].get_nowait()
-            try:
-              if verbose:
-                print('sending "%s" to %s' % (next_msg, s.getpeername()))
-              s.send(next_msg)
-            except:
-              poller.unregister(s)
-              s.close()
-          else:
-            if verbose:
-              print("empty queue")
+          # Socket is ready to send the rest of its data
+          self.send_pending(s)
+      msgs, stamp = read_messages(reader, self.message_queue, self.latency is not None)
+      for connection in self.add_messages_to_queues(msgs, stamp):
+        self.send_pending(connection)
+      if self.counters:
+        self.update_counters()
 
     #end of while True:
     poller.unregister(server)
@@ -164,12 +484,133 @@ class TCPServer (mp.Process):
     print("Leaving TCP server")
     #### end of method run() #####
 
+  # send what a client waits for in one call, up to SEND_SIZE bytes, the
+  # messages the kernel does not take wait for POLLOUT
+  def send_pending(self, connection):
+    pending = self.message_queues.get(connection)
+    if not pending:
+      return
+    batch = []
+    size = 0
+    for msg in pending:
+      batch.append(msg)
+      size += len(msg)
+      if size >= SEND_SIZE:
+        break
+    try:
+      n = connection.send(b''.join(batch))
+    except BlockingIOError:
+      n = 0
+    except OSError:
+      self.remove_client(connection)
+      return
+    sent = 0
+    for msg in batch:
+      if n < len(msg):
+        break
+      n -= len(msg)
+      pending.popleft()
+      sent += 1
+    if n:
+      pending[0] = pending[0][n:]
+    if self.verbose:
+      print('sent %d messages to %s, %d waiting' % (sent, connection.getpeername(), len(pending)))
+    if self.counters:
+      self.counters.add('sent', sent)
+    # while the client has messages waiting the time of the oldest one is
+    # kept, an upper bound for the ones left
+    if self.latency is not None and sent and connection in self.oldest:
+      self.latency.add(time.monotonic_ns() - self.oldest[connection])
+      if not pending:
+        del self.oldest[connection]
+    self.poller.modify(connection, READ_WRITE if pending else READ_ONLY)
+
+  # number of clients and messages waiting to be sent to them
+  def update_counters(self):
+    backlog = [len(q) for q in self.message_queues.values()]
+    self.counters.set('clients', len(backlog))
+    self.counters.set('backlog', sum(backlog))
+    self.counters.set('backlog_max', max(backlog, default=0))
+
+  # the complete subscribe lines of what a client sent replace its
+  # subscription, the rest is echoed back. The start of a subscribe line is
+  # kept until its end arrives.
+  def client_data(self, connection, data):
+    buffer = self.lines[connection]
+    buffer += data
+    echo = []
+    start = 0
+    end = buffer.find(b'\n')
+    while end >= 0:
+      line = bytes(buffer[start:end + 1])
+      if line.startswith(PREFIX):
+        self.subscribe(connection, line)
+      else:
+        echo.append(line)
+      start = end + 1
+      end = buffer.find(b'\n', start)
+    tail = bytes(buffer[start:])
+    buffer.clear()
+    if tail.startswith(PREFIX) or PREFIX.startswith(tail):
+      if len(tail) > LINE_SIZE:
+        print('closing', connection.getpeername(), 'after a subscribe line of more than', LINE_SIZE, 'bytes')
+        self.remove_client(connection)
+        return
+      buffer += tail
+    else:
+      echo.append(tail)
+    if echo:
+      data = b''.join(echo)
+      if self.verbose:
+        print('received "%s" from %s' % (data, connection.getpeername()))
+      self.message_queues[connection].append(data)
+      self.send_pending(connection)
+
+  # a subscribe line replaces the subscription of the client
+  def subscribe(self, connection, line):
+    try:
+      self.subscriptions[connection] = Subscription.parse(line)
+    except ValueError as er:
+      print('invalid subscription from', connection.getpeername(), str(er))
+    else:
+      if self.verbose:
+        print('subscription "%s" from %s' % (line.decode('ascii', 'replace').strip(), connection.getpeername()))
+
+  def remove_client(self, connection):
+    self.fd_to_socket.pop(connection.fileno(), None)
+    try:
+      self.poller.unregister(connection)
+    except (KeyError, ValueError):
+      pass
+    connection.close()
+    self.message_queues.pop(connection, None)
+    self.subscriptions.pop(connection, None)
+    self.lines.pop(connection, None)
+    self.oldest.pop(connection, None)
+
   def add_message_to_queues(self,msg):
-    for k in self.message_queues:
-      self.message_queues[k].put(msg)
+    self.add_messages_to_queues([msg])
+
+  # a batch of messages to the clients, filtered once per subscription,
+  # stamp is the receive time of the oldest one. Returns the clients that
+  # got messages
+  def add_messages_to_queues(self, msgs, stamp=None):
+    if not msgs or not self.message_queues:
+      return []
+    subscriptions = {k: self.subscriptions.get(k) for k in self.message_queues}
+    clients = []
+    for k, selected in select_messages(msgs, subscriptions).items():
+      if selected:
+        pending = self.message_queues[k]
+        if stamp is not None and k not in self.oldest:
+          self.oldest[k] = stamp
+        pending.extend(selected)
+        clients.append(k)
+    return clients
 
-  def add_message(self,msg):
+  # stamp as in UDPServer
+  def add_message(self,msg,stamp=None):
     if msg:
-      self.message_queue.put(msg)
+      add_message(self, msg, stamp)
 
 ################## Fim da classe TCPserver ################################
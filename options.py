@@ -3,8 +3,8 @@
 import os
 
 class Options:
-  options_dict={'serialport' : '-p', 'data_size': '-n', 'output_file': '-f', 'baudrate': '-b', 'datetime': '-d', 'repeat': '-r', 'tcp': '-t', 'udp': '-u', 'verbose': '-v', 'net_port': '-P'}
-  types  ={'serialport' : 'str', 'data_size': 'int', 'output_file': 'str', 'baudrate': 'int', 'datetime': 'bool', 'repeat': 'bool', 'tcp': 'bool', 'udp': 'bool', 'verbose': 'bool', 'net_port': 'int'}
+  options_dict={'serialport' : '-p', 'data_size': '-n', 'output_file': '-f', 'baudrate': '-b', 'datetime': '-d', 'repeat': '-r', 'tcp': '-t', 'udp': '-u', 'verbose': '-v', 'net_port': '-P', 'flush_frames': '--flush_frames', 'flush_ms': '--flush_ms', 'pipeline': '--pipeline', 'queue_size': '--queue_size', 'format': '--format', 'aio': '--aio', 'client_buffer': '--client_buffer', 'slow_client': '--slow_client', 'shm': '--shm', 'shm_slots': '--shm_slots', 'lossless': '--lossless', 'udp_batch': '--udp_batch', 'mtu': '--mtu', 'keepalive': '--keepalive', 'encoding': '--encoding', 'devices': '--devices', 'merge': '--merge', 'read_min': '--read_min', 'read_timeout': '--read_timeout', 'metrics': '--metrics', 'stats': '--stats', 'metrics_socket': '--metrics_socket', 'display': '--display', 'refresh_hz': '--refresh_hz', 'segment_mb': '--segment_mb', 'segment_minutes': '--segment_minutes', 'compress': '--compress', 'schema': '--schema', 'csv': '--csv', 'json_port': '--json_port', 'durable': '--durable', 'low_latency': '--low_latency'}
+  types  ={'serialport' : 'str', 'data_size': 'int', 'output_file': 'str', 'baudrate': 'int', 'datetime': 'bool', 'repeat': 'bool', 'tcp': 'bool', 'udp': 'bool', 'verbose': 'bool', 'net_port': 'int', 'flush_frames': 'int', 'flush_ms': 'int', 'pipeline': 'bool', 'queue_size': 'int', 'format': 'str', 'aio': 'bool', 'client_buffer': 'int', 'slow_client': 'str', 'shm': 'bool', 'shm_slots': 'int', 'lossless': 'bool', 'udp_batch': 'bool', 'mtu': 'int', 'keepalive': 'int', 'encoding': 'str', 'devices': 'list', 'merge': 'bool', 'read_min': 'int', 'read_timeout': 'int', 'metrics': 'bool', 'stats': 'int', 'metrics_socket': 'str', 'display': 'str', 'refresh_hz': 'int', 'segment_mb': 'int', 'segment_minutes': 'int', 'compress': 'str', 'schema': 'str', 'csv': 'bool', 'json_port': 'int', 'durable': 'bool', 'low_latency': 'bool'}
 
   def __init__(self):
     self.raw_options = []
@@ -30,7 +30,8 @@ class Options:
       line = line.strip()
       if line[0] == '#':
         continue
-      line = [s.strip() for s in line.split('=')]
+      # the value may hold '=' (a struct byte order in schema)
+      line = [s.strip() for s in line.split('=', 1)]
 
       if len(line) != 2:
         continue
@@ -58,6 +59,8 @@ class Options:
           opt_dict[self.raw_options[i]] = True
         elif self.raw_options[i+1].lower() == 'false':
           opt_dict[self.raw_options[i]] = False
+      elif self.types[self.raw_options[i]] == 'list':
+        opt_dict[self.raw_options[i]] = [s.strip() for s in self.raw_options[i+1].split(',') if s.strip()]
       else:
         opt_dict[self.raw_options[i]] = self.raw_options[i+1]
       self.opt_dict = opt_dict
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Pipeline mode: a thread that only drains the serial port
+#  the chunks go through a bounded queue to the thread that decodes, saves,
+#  prints and publishes them, so a slow consumer never stops the reads.
+########################################################
+
+import time
+import queue
+import threading
+
+
+################# Classe PipelineStats ########################################
+# counters shared by the reader and the consumer, rates are averages since
+# the previous call to snapshot()
+class PipelineStats:
+  def __init__(self):
+    self.bytes = 0
+    self.chunks = 0
+    self.frames = 0
+    self.drops = 0
+    self.dropped_bytes = 0
+    self.max_depth = 0
+    self.last = (time.monotonic(), 0, 0)
+
+  def snapshot(self, depth=0):
+    now = time.monotonic()
+    then, nbytes, frames = self.last
+    elapsed = max(now - then, 1e-9)
+    self.last = (now, self.bytes, self.frames)
+    return {'queue_depth': depth,
+            'max_queue_depth': self.max_depth,
+            'bytes_per_s': (self.bytes - nbytes) / elapsed,
+            'frames_per_s': (self.frames - frames) / elapsed,
+            'bytes': self.bytes,
+            'frames': self.frames,
+            'drops': self.drops,
+            'dropped_bytes': self.dropped_bytes}
+
+################## Fim da classe PipelineStats ################################
+
+
+################# Classe SerialReader ########################################
+# thread that reads whatever the port has and puts it into a bounded queue
+# together with the time it was read (monotonic ns), when the queue is full
+# the chunk is dropped and counted, the frame parser resyncs at the next header
+class SerialReader (threading.Thread):
+  def __init__(self, ser, maxsize=4096, stats=None):
+    threading.Thread.__init__(self)
+    self.daemon = True
+    self.ser = ser
+    self.chunks = queue.Queue(maxsize)
+    self.stats = stats if stats is not None else PipelineStats()
+    self.error = None
+
+  def run(self):
+    ser = self.ser
+    stats = self.stats
+    chunks = self.chunks
+    try:
+      while True:
+        # blocks until at least one byte arrives, then takes the rest
+        chunk = ser.read(max(1, ser.inWaiting()))
+        waiting = ser.inWaiting()
+        if waiting:
+          chunk += ser.read(waiting)
+        if not chunk:
+          # read timeout without data
+          continue
+        stamp = time.monotonic_ns()
+        stats.bytes += len(chunk)
+        stats.chunks += 1
+        try:
+          chunks.put_nowait((stamp, chunk))
+        except queue.Full:
+          stats.drops += 1
+          stats.dropped_bytes += len(chunk)
+        else:
+          depth = chunks.qsize()
+          if depth > stats.max_depth:
+            stats.max_depth = depth
+    except Exception as er:
+      self.error = er
+      # wake the consumer, it stops at the None
+      chunks.put(None)
+
+  # next (timestamp, chunk) for the consumer, None if the reader stopped, an
+  # empty chunk if timeout seconds passed without data
+  def get(self, timeout=None):
+    try:
+      return self.chunks.get(timeout=timeout)
+    except queue.Empty:
+      return time.monotonic_ns(), b''
+
+  def depth(self):
+    return self.chunks.qsize()
+
+  def snapshot(self):
+    return self.stats.snapshot(self.depth())
+
+  # snapshot of the counters once every interval seconds, None in between
+  def report(self, interval=1.0):
+    if time.monotonic() - self.stats.last[0] < interval:
+      return None
+    return self.snapshot()
+
+################## Fim da classe SerialReader ################################
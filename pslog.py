@@ -10,20 +10,39 @@
 
 import sys
 import os
-import serial
 import signal
 import argparse
-import struct
 from datetime import datetime, time, date
+from time import monotonic_ns
 from options import Options
-from net_process import UDPServer
-from net_process import TCPServer
+from binwriter import WRITERS
+from textwriter import TextWriter
+from logger import SerialSource, SerialLogger, read_chunk as read_port
+from console import Console, MODES
+from sinks import BinarySink, ServerSink, CSVSink, JSONLinesSink
+# pyserial, the servers, the shared memory ring, the metrics, the segments,
+# the schema and the reader of several ports are imported where they are used,
+# so a run only loads the parts it needs (multiprocessing, asyncio, numpy...)
 
 # global variables some are defined in main()
-data_list=[]
 pack_size=0
-ser = serial.Serial()
+# the serial port, built where it is opened
+ser = None
 main_pid = 0
+writer = None
+device_writers = []
+ring = None
+metrics = None
+metrics_server = None
+next_report = 0
+console = None
+fanout = None
+json_server = None
+tcp_server = None
+udp_server = None
+# read by the timeouts of the serial reads, also when pslog is imported
+durable = None
+flush_ms = None
 
 # Parsing of command line arguments
 parser = argparse.ArgumentParser(description="Log serial data received with the format |0xFFFF | lenght(1 byte) | checksum1(1 byte) | checksum2(1 byte) | into a binary file with the format: | data_size(in bytes, 4bytes) | raw_binary_data |. The purpose of this script is to log data from microcontrollers with in a more secure way than just throwing data over the serial port and reading on the computer with any verification whatsoever.")
@@ -37,6 +56,38 @@ parser.add_argument("-t", "--tcp", help="start a TCP server do distribute readed
 parser.add_argument("-u", "--udp", help="start a UDP server do distribute readed data",action='store_true',default=None)
 parser.add_argument("-v", "--verbose", help="More information on connections, sending and receiving data are printed on stdout",action='store_true',default=None)
 parser.add_argument("-P", "--net_port", type=int,help="TCP or UDP port (default=5353)",default=None)
+parser.add_argument("--flush_frames", type=int,help="flush the binary file to disk every N packages (default=0, disabled)",default=None)
+parser.add_argument("--flush_ms", type=int,help="flush the binary file to disk every N milliseconds (default=1000)",default=None)
+parser.add_argument("--pipeline", help="read the serial port in a dedicated thread, decoding, saving and publishing are done in another one",action='store_true',default=None)
+parser.add_argument("--queue_size", type=int,help="number of chunks the pipeline holds before dropping data (default=4096)",default=None)
+parser.add_argument("--aio", help="run the TCP server with asyncio inside the logger process instead of a server process",action='store_true',default=None)
+parser.add_argument("--client_buffer", type=int,help="packages queued for each TCP client of the asyncio server (default=4096)",default=None)
+parser.add_argument("--slow_client", type=str, help="what the asyncio server does with a client whose buffer is full: drop the oldest packages (drop) or disconnect it (disconnect) (default=drop)",default=None)
+parser.add_argument("--shm", help="hand the packages to the server process through a shared memory ring instead of a pipe",action='store_true',default=None)
+parser.add_argument("--shm_slots", type=int,help="number of packages the shared memory ring holds (default=65536)",default=None)
+parser.add_argument("--lossless", help="with --shm, wait for the server instead of overwriting packages it did not read",action='store_true',default=None)
+parser.add_argument("--udp_batch", help="pack several packages in each UDP datagram instead of one, every datagram starts with a sequence number to detect losses",action='store_true',default=None)
+parser.add_argument("--mtu", type=int,help="largest UDP datagram with --udp_batch (default=1472)",default=None)
+parser.add_argument("--keepalive", type=int,help="seconds a UDP client is kept without sending any datagram (default=0, forever)",default=None)
+parser.add_argument("--encoding", type=str,help="how the bytes received in repeat mode are decoded, e.g. latin-1 or utf-8 (default=latin-1)",default=None)
+parser.add_argument("--devices", type=str,help="read several serial ports at once: 'port[:baudrate], port[:baudrate], ...'. Each package sent to the servers starts with the device number (1 byte)",default=None)
+parser.add_argument("--merge", help="with --devices, save all the devices in one file, each package starting with the device number, instead of one file per device",action='store_true',default=None)
+parser.add_argument("--read_min", type=int,help="bytes a serial read waits for before waking up, larger values mean less wake ups at high rates (default=1)",default=None)
+parser.add_argument("--read_timeout", type=int,help="milliseconds a serial read waits for --read_min bytes (default=10)",default=None)
+parser.add_argument("--metrics", help="keep counters and histograms of the acquisition, the servers and the file writes, dumped to stderr as JSON on SIGUSR1",action='store_true',default=None)
+parser.add_argument("--stats", type=int,help="print a line with the metrics to stderr every N seconds, implies --metrics (default=0, disabled)",default=None)
+parser.add_argument("--metrics_socket", type=str,help="serve the metrics as JSON on this unix socket, read with 'metrics.py path', implies --metrics",default=None)
+parser.add_argument("--display", type=str, choices=MODES, help="what is printed while receiving: every package (frames), a status line with the rates, errors and the last package (summary) or nothing (quiet) (default=frames)",default=None)
+parser.add_argument("--refresh_hz", type=int,help="times per second the summary display is redrawn (default=10)",default=None)
+parser.add_argument("--segment_mb", type=int,help="start a new binary file every N megabytes of data, the files are listed in a .manifest.json (default=0, disabled)",default=None)
+parser.add_argument("--segment_minutes", type=int,help="start a new binary file every N minutes (default=0, disabled)",default=None)
+parser.add_argument("--compress", type=str, help="compress each finished binary file in the background: none, gzip, zstd or lz4, zstd and lz4 need their python modules (default=none)",default=None)
+parser.add_argument("--schema", type=str,help="layout of the payload, a struct format and field names ('<Iff time x y') or 'time:uint32, x:float32, y:float32', used by export.py to write columnar files (default=none)",default=None)
+parser.add_argument("--csv", help="also save the packages decoded with --schema to a CSV text file, one line per package with its receive time",action='store_true',default=None)
+parser.add_argument("--json_port", type=int,help="serve the packages decoded with --schema as JSON lines on this TCP port (default=0, disabled)",default=None)
+parser.add_argument("--durable", help="keep an index checkpoint of the indexed files in a .idx file and save the files on SIGTERM too, repair what a crash left with recover.py",action='store_true',default=None)
+parser.add_argument("--low_latency", help="hand every package to the clients as soon as it is read: the serial driver delivers bytes at once, the server processes wake up on new packages and send without delay (TCP_NODELAY), the latency of each stage (read, validate, enqueue, send) is kept in the metrics, implies --metrics",action='store_true',default=None)
+parser.add_argument("--format", type=str, choices=sorted(WRITERS), help="binary file format: legacy is | count | data |..., indexed adds the length and receive time of each package and an index (default=legacy)",default=None)
 
 # update options from any source(config file or shell)
 def update_options(args):
@@ -51,6 +102,38 @@ def update_options(args):
   global udp
   global verbose
   global net_port
+  global flush_frames
+  global flush_ms
+  global pipeline
+  global queue_size
+  global file_format
+  global aio
+  global client_buffer
+  global slow_client
+  global shm
+  global shm_slots
+  global lossless
+  global udp_batch
+  global mtu
+  global keepalive
+  global encoding
+  global devices
+  global merge
+  global read_min
+  global read_timeout
+  global use_metrics
+  global stats
+  global metrics_socket
+  global display
+  global refresh_hz
+  global segment_mb
+  global segment_minutes
+  global compress
+  global schema
+  global csv
+  global json_port
+  global durable
+  global low_latency
 
   if args.baudrate != None:
     baud_rate=args.baudrate
@@ -94,6 +177,163 @@ def update_options(args):
     net_port=args.net_port
   elif 'net_port' not in globals():
     net_port=None
+  if args.flush_frames != None:
+    flush_frames=args.flush_frames
+  elif 'flush_frames' not in globals():
+    flush_frames=None
+  if args.flush_ms != None:
+    flush_ms=args.flush_ms
+  elif 'flush_ms' not in globals():
+    flush_ms=None
+  if args.pipeline != None:
+    pipeline=args.pipeline
+  elif 'pipeline' not in globals():
+    pipeline=None
+  if args.queue_size != None:
+    queue_size=args.queue_size
+  elif 'queue_size' not in globals():
+    queue_size=None
+  if args.format != None:
+    file_format=args.format
+  elif 'file_format' not in globals():
+    file_format=None
+  if args.aio != None:
+    aio=args.aio
+  elif 'aio' not in globals():
+    aio=None
+  if args.client_buffer != None:
+    client_buffer=args.client_buffer
+  elif 'client_buffer' not in globals():
+    client_buffer=None
+  if args.slow_client != None:
+    slow_client=args.slow_client
+  elif 'slow_client' not in globals():
+    slow_client=None
+  if args.shm != None:
+    shm=args.shm
+  elif 'shm' not in globals():
+    shm=None
+  if args.shm_slots != None:
+    shm_slots=args.shm_slots
+  elif 'shm_slots' not in globals():
+    shm_slots=None
+  if args.lossless != None:
+    lossless=args.lossless
+  elif 'lossless' not in globals():
+    lossless=None
+  if args.udp_batch != None:
+    udp_batch=args.udp_batch
+  elif 'udp_batch' not in globals():
+    udp_batch=None
+  if args.mtu != None:
+    mtu=args.mtu
+  elif 'mtu' not in globals():
+    mtu=None
+  if args.keepalive != None:
+    keepalive=args.keepalive
+  elif 'keepalive' not in globals():
+    keepalive=None
+  if args.encoding != None:
+    encoding=args.encoding
+  elif 'encoding' not in globals():
+    encoding=None
+  if args.devices != None:
+    devices=args.devices
+  elif 'devices' not in globals():
+    devices=None
+  if args.merge != None:
+    merge=args.merge
+  elif 'merge' not in globals():
+    merge=None
+  if args.read_min != None:
+    read_min=args.read_min
+  elif 'read_min' not in globals():
+    read_min=None
+  if args.read_timeout != None:
+    read_timeout=args.read_timeout
+  elif 'read_timeout' not in globals():
+    read_timeout=None
+  if args.metrics != None:
+    use_metrics=args.metrics
+  elif 'use_metrics' not in globals():
+    use_metrics=None
+  if args.stats != None:
+    stats=args.stats
+  elif 'stats' not in globals():
+    stats=None
+  if args.metrics_socket != None:
+    metrics_socket=args.metrics_socket
+  elif 'metrics_socket' not in globals():
+    metrics_socket=None
+  if args.display != None:
+    display=args.display
+  elif 'display' not in globals():
+    display=None
+  if args.refresh_hz != None:
+    refresh_hz=args.refresh_hz
+  elif 'refresh_hz' not in globals():
+    refresh_hz=None
+  if args.segment_mb != None:
+    segment_mb=args.segment_mb
+  elif 'segment_mb' not in globals():
+    segment_mb=None
+  if args.segment_minutes != None:
+    segment_minutes=args.segment_minutes
+  elif 'segment_minutes' not in globals():
+    segment_minutes=None
+  if args.compress != None:
+    compress=args.compress
+  elif 'compress' not in globals():
+    compress=None
+  if args.schema != None:
+    schema=args.schema
+  elif 'schema' not in globals():
+    schema=None
+  if args.csv != None:
+    csv=args.csv
+  elif 'csv' not in globals():
+    csv=None
+  if args.json_port != None:
+    json_port=args.json_port
+  elif 'json_port' not in globals():
+    json_port=None
+  if args.durable != None:
+    durable=args.durable
+  elif 'durable' not in globals():
+    durable=None
+  if args.low_latency != None:
+    low_latency=args.low_latency
+  elif 'low_latency' not in globals():
+    low_latency=None
+
+
+# the options of .pslogrc, or of ~/.pslogrc, by name
+def read_config():
+  opt = Options()
+  if opt.read('.pslogrc') or opt.read('~/.pslogrc'):
+    return opt.get_dict_options()
+  return {}
+
+
+# the options the command line does not give are taken from the configuration
+# file, tcp and udp only when the command line gives none of the two, so the
+# command line is parsed once
+def apply_config(args, config):
+  for name, value in config.items():
+    if name in ('tcp', 'udp') and (args.tcp or args.udp):
+      continue
+    if getattr(args, name) is None:
+      if isinstance(value, list):
+        value = ','.join(value)
+      setattr(args, name, value)
+
+
+# the values of the configuration file are checked as argparse checks the
+# ones of the command line
+def check_choice(name, value, choices):
+  if value not in choices:
+    print("Error: invalid %s '%s' (choose from %s)" % (name, value, ', '.join(choices)))
+    exit(1)
 
 
 def format_filename(filename,extension):
@@ -111,33 +351,72 @@ def format_filename(filename,extension):
   return filename
 
 
+# open the binary file, the packages are written as they are received
+def open_binary_file(outfile):
+  global writer
+  writer = new_binary_writer(outfile)
+
+
+# a writer of the chosen format for outfile, or a writer of segments of that
+# format listed in outfile.manifest.json
+def new_binary_writer(outfile):
+  if segment_mb or segment_minutes or compress != 'none':
+    from segments import SegmentWriter
+    try:
+      return SegmentWriter(format_filename(outfile,''), file_format, segment_mb*1000000, segment_minutes*60,
+                           compress, flush_frames, flush_ms, metrics, durable)
+    except ValueError as er:
+      print('Error:', str(er))
+      exit(1)
+  if file_format == 'indexed':
+    filename = format_filename(outfile,'.pslx')
+  else:
+    filename = format_filename(outfile,'.bin')
+  return WRITERS[file_format](filename, flush_frames, flush_ms, metrics=metrics, checkpoint=durable)
+
+
+# flush the remaining packages and the header and close the binary files
 def save_to_binary_file(outfile):
-  if not len(data_list):
+  global writer
+  global device_writers
+  writers = [w for w in [writer] + device_writers if w is not None]
+  if not writers:
     if main_pid == os.getpid():
       print("no data to save")
     return
 
-  filename = format_filename(outfile,'.bin')
-  print("\nsaving data to binary file",filename)
-  binfile = open(filename, 'wb')
-  binfile.write(struct.pack('i',len(data_list)))
-  for pack in data_list:
-    binfile.write(pack)
-  binfile.close
+  for w in writers:
+    w.close()
+    if not w.count:
+      os.remove(w.filename)
+      print("no data to save in",w.filename)
+    else:
+      print("\n%d packages saved to binary file" % (w.count),w.filename)
+  writer = None
+  device_writers = []
+
+
+# open the text file of the repeat mode, the data is written as it arrives
+def open_text_file(outfile):
+  global writer
+  filename = format_filename(outfile,'.txt')
+  writer = TextWriter(filename, encoding, flush_ms)
 
 
 def save_to_text_file(outfile):
-  buffer=byte2str(data_list)
-  if not len(buffer):
+  global writer
+  if writer is None:
     if main_pid == os.getpid():
       print("no data to save")
     return
 
-  filename = format_filename(outfile,'.txt')
-  print("\nsaving data to text file",filename)
-  txtfile = open(filename, 'w')
-  txtfile.write(buffer)
-  txtfile.close()
+  writer.close()
+  if not writer.count:
+    os.remove(writer.filename)
+    print("no data to save")
+  else:
+    print("\n%d bytes saved to text file" % (writer.count),writer.filename)
+  writer = None
 
 
 def signal_handler(signal, frame):
@@ -145,9 +424,11 @@ def signal_handler(signal, frame):
   # global udp_server
   # global ser
 
+  close_console()
   if repeat:
     save_to_text_file(outfile)
   else:
+    close_sinks()
     save_to_binary_file(outfile)
 
   try:
@@ -160,29 +441,20 @@ def signal_handler(signal, frame):
   except:
     pass
 
+  try:
+    json_server.terminate()
+  except:
+    pass
+
   if main_pid == os.getpid():
-    ser.close()
+    if ser is not None:
+      ser.close()
+    close_ring()
+    close_metrics()
     print("\nExiting due to user hit of Ctrl+c")
   sys.exit(0)
 
 
-#convert from int to bytes
-def int2bytes(i):
-  if type(i).__name__=='int':
-    return bytes([i])
-  if type(i).__name__=='bytes':
-    return i;
-  else:
-    return None
-
-
-# Test function to verify the data at the debug time
-def print_data(data):
-  for byte in data:
-    print(byte,end=' ')
-  print(' ')
-
-
 #checksum - make the sum of verification of the received packages
 #data is a bytes object with all the bytes but the header and checksum ones
 #use the raw buffer as parameter, without the header.
@@ -223,120 +495,180 @@ def check_package(buffer):
   return cksum1_calculated==cksum1_received and cksum2_calculated==cksum2_received
 
 
+# wait for data on the serial port and read all the available bytes at once
+# (logger.read_chunk)
+def read_chunk(ser):
+  try:
+    return read_port(ser, read_min)
+  except Exception as er:
+    print("Error reading serial port:", str(er))
+    exit(1)
+
+
+# timeout of the serial reads: wait forever for a single byte, or at most
+# read_timeout milliseconds for read_min bytes
+def read_timeout_s():
+  if read_min <= 1:
+    return idle_timeout_s()
+  return read_timeout/1000.0
+
+
+# in durable mode a silent port wakes the receiver every flush_ms, so the
+# last packages before the silence reach the disk
+def idle_timeout_s():
+  if durable and flush_ms:
+    return flush_ms/1000.0
+  return None
+
+
 ## Receiver, read from serial port and write to a binary file
 # port: is de address of the serial
 # baud_rate: is the baud rate of the serial port
 # size: the number of data points to receive
 # outfile: name of the file to write the data
-def receive_data(ser):
-  global data_list
-  #last serves as to check the header, making possible to head one byte
-  #at a time to check for the reader.
-  if "last" not in receive_data.__dict__: receive_data.last = b'\x00'
-  # global ser
-  #opens and configures the serial port
-  ser.port=port
-  ser.baudrate=baud_rate
+def receive_data():
+  global ser
+  import serial
+  #opens and configures the serial port, in pipeline mode another thread
+  #reads the port and this one consumes
+  source = SerialSource(port, baud_rate, read_timeout_s(), read_min, pipeline, queue_size, idle_timeout_s(), None, low_latency)
+  ser = source.ser
   if verbose:
     print("[ Port:",port,",","Baudrate:",baud_rate,"]")
-  ser.timeout=None
   try:
-    ser.open()
+    source.open()
   except:
     print('Error: could not open serial port ',port)
     print('Try to use another serial port with "-p port" option')
     exit(1)
   print("Serial port ",port,"conected at",baud_rate,"bps, waiting for data.")
+  if low_latency and not source.low_latency:
+    print("The driver of",port,"has no low latency mode, its own delay stays")
   print("Hit 'ctrl+c' to save the data and exit at any time.")
 
+  #the logger parses the reads and writes the packages of each one to the
+  #sinks, the parser keeps the partial frames between reads, in low latency
+  #mode it keeps the time of each stage
+  serial_logger = SerialLogger(source, schema, data_size, metrics if low_latency else None)
+  open_sinks(serial_logger)
+  decoder = serial_logger.parser
+  reader = source.reader
   #counter of how many data has been received
   i=0
-
-  #open the data file
-  while (data_size==0) or (i<data_size):
-    #verify
-    buffer=b'\x00'
-    num_bytes=0;
-    while not num_bytes:
-      try:
-        num_bytes=ser.inWaiting();#wait for a byte
-      except Exception as er:
-        print(str(er))
-        exit(1)
-
+  errors = 0
+  #the first package is checked against the schema
+  check_schema = bool(schema)
+  if metrics:
+    metrics.register('parser', lambda: {'bytes': decoder.bytes, 'frames': decoder.frames, 'errors': decoder.errors, 'skipped': decoder.skipped, 'pending': decoder.pending()},
+                     ('bytes', 'frames', 'errors', 'skipped'))
+    if pipeline:
+      metrics.register('pipeline', lambda: {'depth': reader.depth(), 'max_depth': reader.stats.max_depth, 'drops': reader.stats.drops, 'dropped_bytes': reader.stats.dropped_bytes},
+                       ('drops', 'dropped_bytes'))
+    latency = metrics.histogram('receive_to_write')
+
+  # the packages of a read went to the file, the servers and the decoded
+  # sinks together, decoded once, the empty reads let the file flush
+  batches = serial_logger.batches(idle=True)
+  while True:
     try:
-      buffer=ser.read(1)
-    except:
-      if verbose:
-        print("Error reading serial port")
+      batch = next(batches, None)
+    except (serial.SerialException, OSError) as er:
+      print("Error reading serial port:", str(er))
       exit(1)
-    assert(len(buffer)==1)
-    assert(len(receive_data.last)==1)
-    #check the header: 0xFFFF
-    if verbose:
-      print('Head: ', i , ' ', buffer , ' ', receive_data.last )
-    if (buffer[0] == 0xFF) and (receive_data.last[0] == 0xFF):
-      try:
-        tmp=ser.read(1)
-      except:
-        if verbose:
-          print("Error reading serial port")
-        exit(1)
-      #print(tmp)
-      pack_size=tmp[0]
-      assert(pack_size>=0)
-      if num_bytes<(2+pack_size):
-        num_bytes=0
-        while num_bytes<(pack_size-1):
-          try:
-            num_bytes=ser.inWaiting();
-          except:
-            if verbose:
-              print("Error reading serial port")
-            exit(1)
-      try:
-        buffer=int2bytes(pack_size) + ser.read(pack_size-1)
-      except:
-        if verbose:
-          print("Error reading serial port")
-        exit(1)
-
-      assert(len(buffer)>0)
-
-      #remove the checksum received
-      log_print='%d-' % (i)
-      print(log_print,end=' ')
-
-      if check_package(buffer):
-        i+=1
-        data=buffer[1:-2]#remove 2 checksum bytes and remove size byte
-        #restart the 'last' var so the header will not be wrongly found
-        receive_data.last=b'\x00'
-        data_list.append(data)
-        print('Data:' , end=' ')
-        print_data(data)
-        add_message_to_server(data)
-      else:
-        receive_data.last = b'\x00'
-        print('error: lost data')
-    else:
-      assert(len(buffer)==1)
-      assert(len(receive_data.last)==1)
-      #since the header doesnt match, read another byte and try again with the current byte as the last
-      receive_data.last=buffer#at this point, buffer is a single byte, and may or may not be matched one of the header bytes
+    if batch is None:
+      break
+    stamp, frames = batch
+    for data in frames:
+      if check_schema:
+        check_schema = False
+        if len(data) != schema.size:
+          console.message('warning: package of %d bytes, the schema has %d' % (len(data), schema.size), True)
+      console.frame(i, data)
+      i+=1
+    console.update(decoder.bytes, decoder.errors, decoder.skipped)
+    # one sample per chunk: the time its last package took to be saved
+    if metrics:
+      latency.add(monotonic_ns() - stamp)
+    if decoder.errors != errors:
+      # the frames the parser rejected in this read
+      if metrics:
+        metrics.add('checksum_failures', decoder.errors - errors)
+      errors = decoder.errors
+      console.message('error: lost data')
       if verbose:
-        print('not a package')
-  ser.close()
+        console.message('frames: %d errors: %d skipped bytes: %d' % (decoder.frames, decoder.errors, decoder.skipped), True)
+    if pipeline:
+      reader.stats.frames = decoder.frames
+      report = reader.report()
+      if verbose and report:
+        console.message('pipeline: %s' % (report), True)
+    if stats:
+      report_metrics()
+  close_console()
+  source.close()
+
+
+## Receiver for several serial ports, the packages of all of them are
+# published to the same servers with the device number in front
+def multi_receive(devices):
+  global device_writers
+  import serial
+  from multi import MultiReader
+  reader = MultiReader(devices, verbose)
+  try:
+    reader.open()
+  except serial.SerialException as er:
+    print('Error: could not open serial port:', str(er))
+    exit(1)
+  print("Hit 'ctrl+c' to save the data and exit at any time.")
+  if not merge:
+    device_writers = [new_binary_writer('%s.%d' % (outfile, n)) for n in range(len(devices))]
+  if metrics:
+    metrics.register('devices', lambda: {'%d.%s' % (s[0], k): v for s in reader.stats() for k, v in zip(('bytes', 'frames', 'errors'), s[2:])},
+                     ['%d.%s' % (n, k) for n in range(len(devices)) for k in ('bytes', 'frames', 'errors')])
 
+  i=0
+  errors = 0
+  # the writers flush after flush_ms and keep their checkpoint also when
+  # their port is quiet, as receive_data does on its empty reads
+  writers = [writer] if merge else device_writers
+  for source, stamp, data in reader.frames(idle_timeout_s(), True):
+    if data is None:
+      for device_writer in writers:
+        device_writer.tick()
+      continue
+    console.frame(i, data, source)
+    i+=1
+    tagged = bytes([source]) + data
+    if merge:
+      writer.write(tagged, stamp)
+    else:
+      device_writers[source].write(data, stamp)
+    add_message_to_server(tagged, stamp)
+    totals = reader.totals()
+    console.update(*totals)
+    if metrics and totals[1] != errors:
+      metrics.add('checksum_failures', totals[1] - errors)
+      errors = totals[1]
+    if stats:
+      report_metrics()
+    if data_size and i>=data_size:
+      break
+  close_console()
+  if verbose:
+    for device_stats in reader.stats():
+      print('device %d %s: %d bytes, %d packages, %d errors' % device_stats)
+  reader.close()
 
-def repeater(ser):
-  global data_list
 
-  # global data_list
+def repeater():
+  global ser
+  import serial
   # opens and configures the serial port
+  ser = serial.Serial()
   ser.port=port
   ser.baudrate=baud_rate
-  ser.timeout=None
+  ser.timeout=read_timeout_s()
   try:
     ser.open()
   except:
@@ -344,47 +676,124 @@ def repeater(ser):
     exit(1)
   print("Hit 'ctrl+c' to save the data and exit at any time.")
 
-  data_list = b''
   while 1:
-    num_bytes=0;
-    buffer=''
-    while not num_bytes:
-      try:
-        num_bytes=ser.inWaiting()#wait for a byte
-      except:
-        if verbose:
-          print("Error reading serial port")
-        exit(1)
+    buffer=read_chunk(ser)
+    sys.stdout.write(writer.write(buffer))
+    add_message_to_server(buffer)
+    if metrics:
+      metrics.add('bytes_read', len(buffer))
+      if stats:
+        report_metrics()
+
+
+# write what the console still holds, the server processes have a copy that
+# is never used
+def close_console():
+  global console
+  if console is not None and main_pid == os.getpid():
+    console.close()
+    console = None
+
+
+# the sinks of the packages, the binary file is closed by save_to_binary_file
+def open_sinks(serial_logger):
+  global fanout
+  fanout = serial_logger.fanout
+  fanout.add(BinarySink(writer))
+  if tcp:
+    fanout.add(ServerSink(tcp_server))
+  elif udp:
+    fanout.add(ServerSink(udp_server))
+  if csv:
+    # never the name of the binary file
+    fanout.add(CSVSink(format_filename(outfile,'') + '.csv', schema, flush_ms))
+  if json_port:
+    fanout.add(JSONLinesSink(json_server, schema))
+  if metrics and fanout.decoded:
+    metrics.register('decoder', lambda: {'records': fanout.decoder.records, 'mismatched': fanout.decoder.mismatched}, ('records',))
+
+
+def close_sinks():
+  global fanout
+  if fanout is None or main_pid != os.getpid():
+    return
+  for sink in fanout.sinks:
+    if isinstance(sink, CSVSink):
+      if not sink.count:
+        sink.close()
+        os.remove(sink.filename)
+      else:
+        print("\n%d packages saved to CSV file" % (sink.count),sink.filename)
+  fanout.close()
+  fanout = None
+
 
+# release the shared memory ring, only the logger process removes it
+def close_ring():
+  global ring
+  if ring is not None and main_pid == os.getpid():
+    ring.close()
+    ring = None
+
+
+# print the metrics line to stderr every stats seconds
+def report_metrics():
+  global next_report
+  now = monotonic_ns()
+  if now >= next_report:
+    next_report = now + stats * 1000000000
+    print('stats:', metrics.line(), file=sys.stderr)
+
+
+def dump_metrics(signal, frame):
+  metrics.dump()
+
+
+# messages waiting for a server: in its queue, or in the ring for its consumer
+def server_queue(server, consumer):
+  from shm_ring import INVALID
+  if ring is None:
+    return server.message_queue.qsize()
+  position = ring.consumer_position(consumer)
+  return 0 if position == INVALID else ring.head() - position
+
+
+# collectors of the servers, SIGUSR1 dump and the unix socket endpoint
+def start_metrics(counters):
+  global metrics_server
+  if tcp and aio:
+    metrics.register('tcp', tcp_server.stats, ('sent', 'drops'))
+  elif tcp:
+    metrics.register('tcp', lambda: dict(counters.snapshot(), queue=server_queue(tcp_server, 0)), ('sent',))
+  elif udp:
+    metrics.register('udp', lambda: dict(counters.snapshot(), queue=server_queue(udp_server, 1)), ('datagrams', 'send_errors'))
+  signal.signal(signal.SIGUSR1, dump_metrics)
+  if metrics_socket:
+    from metrics import MetricsServer
     try:
-      buffer=ser.read(num_bytes)
-    except:
-      if verbose:
-        print("Error reading serial port")
+      metrics_server = MetricsServer(metrics, metrics_socket)
+    except OSError as er:
+      print('Error: could not create the metrics socket', metrics_socket, str(er))
       exit(1)
-
-    print(byte2str(buffer),end='')
-    data_list += buffer
-    add_message_to_server(buffer)
+    metrics_server.start()
 
 
-def byte2str(byte):
-    out = ''
-    for ch in byte:
-        out+=chr(ch)
-    return out
+def close_metrics():
+  global metrics_server
+  if metrics_server is not None and main_pid == os.getpid():
+    metrics_server.close()
+    metrics_server = None
 
 
-def add_message_to_server(msg):
+def add_message_to_server(msg, stamp=None):
   if msg:
-    if tcp_server.is_alive():
-      tcp_server.add_message(msg)
-    if udp_server.is_alive():
-      udp_server.add_message(msg)
+    if tcp_server is not None and tcp_server.is_alive():
+      tcp_server.add_message(msg, stamp)
+    if udp_server is not None and udp_server.is_alive():
+      udp_server.add_message(msg, stamp)
 
 
 def main():
-  global ser
   global tcp_server
   global udp_server
   global baud_rate
@@ -397,17 +806,46 @@ def main():
   global udp
   global verbose
   global net_port
+  global flush_frames
+  global flush_ms
+  global pipeline
+  global queue_size
+  global file_format
+  global aio
+  global client_buffer
+  global slow_client
+  global shm
+  global shm_slots
+  global lossless
+  global udp_batch
+  global mtu
+  global keepalive
+  global encoding
+  global devices
+  global merge
+  global read_min
+  global read_timeout
+  global use_metrics
+  global stats
+  global metrics_socket
+  global display
+  global refresh_hz
+  global segment_mb
+  global segment_minutes
+  global compress
+  global schema
+  global csv
+  global json_port
+  global durable
+  global low_latency
+  global ring
+  global main_pid
+  global json_server
+  global metrics
+  global console
 
-  opt = Options()
-  if opt.read('.pslogrc'):
-    options = opt.get_list_options()
-    args = parser.parse_args(options)
-    update_options(args)
-  elif opt.read('~/.pslogrc'):
-    options = opt.get_list_options()
-    args = parser.parse_args(options)
-    update_options(args)
   args=parser.parse_args()
+  apply_config(args, read_config())
   update_options(args)
 
   # verify default options
@@ -434,30 +872,179 @@ def main():
       net_port = 5050
     if tcp:
       net_port = 5353
-  else:
-    net_port = 5353
+  if flush_frames == None:
+    flush_frames = 0
+  if flush_ms == None:
+    flush_ms = 1000
+  if pipeline == None:
+    pipeline = False
+  if not queue_size:
+    queue_size = 4096
+  if not file_format:
+    file_format = 'legacy'
+  if aio == None:
+    aio = False
+  if not client_buffer:
+    client_buffer = 4096
+  if not slow_client:
+    slow_client = 'drop'
+  if shm == None:
+    shm = False
+  if not shm_slots:
+    shm_slots = 65536
+  if lossless == None:
+    lossless = False
+  if udp_batch == None:
+    udp_batch = False
+  if not mtu and udp:
+    from net_process import UDP_MTU
+    mtu = UDP_MTU
+  if not keepalive:
+    keepalive = 0
+  if not encoding:
+    encoding = 'latin-1'
+  if devices:
+    from multi import parse_devices
+    devices = parse_devices(devices, baud_rate)
+  if merge == None:
+    merge = False
+  if not read_min:
+    read_min = 1
+  if not read_timeout:
+    read_timeout = 10
+  if not stats:
+    stats = 0
+  if use_metrics == None:
+    use_metrics = False
+  if stats or metrics_socket or low_latency:
+    use_metrics = True
+  if not display:
+    display = 'frames'
+  if not refresh_hz:
+    refresh_hz = 10
+  if not segment_mb:
+    segment_mb = 0
+  if not segment_minutes:
+    segment_minutes = 0
+  if not compress:
+    compress = 'none'
+  if schema:
+    from schema import Schema
+    try:
+      schema = Schema.parse(schema)
+    except ValueError as er:
+      print('Error: invalid schema:', str(er))
+      exit(1)
+  if csv == None:
+    csv = False
+  if not json_port:
+    json_port = 0
+  if durable == None:
+    durable = False
+  if low_latency == None:
+    low_latency = False
+  if low_latency:
+    # a read returns as soon as a byte arrives
+    read_min = 1
+  check_choice('--format', file_format, sorted(WRITERS))
+  check_choice('--display', display, MODES)
+  if compress != 'none':
+    from segments import COMPRESSIONS
+    check_choice('--compress', compress, COMPRESSIONS)
+  if aio:
+    from aio_server import POLICIES
+    check_choice('--slow_client', slow_client, POLICIES)
+  if (csv or json_port) and not schema:
+    print('Error: --csv and --json_port need the layout of the packages in --schema')
+    exit(1)
+  if (csv or json_port) and (repeat or devices):
+    print('Error: --csv and --json_port work with the packages of a single serial port')
+    exit(1)
   if verbose:
-    print('Final options:', [baud_rate, outfile, data_size, port, dtime, repeat, tcp, udp, net_port])
+    print('Final options:', [baud_rate, outfile, data_size, port, dtime, repeat, tcp, udp, net_port, flush_frames, flush_ms, pipeline, queue_size, file_format, aio, client_buffer, slow_client, shm, shm_slots, lossless, udp_batch, mtu, keepalive, encoding, devices, merge, read_min, read_timeout, use_metrics, stats, metrics_socket, display, refresh_hz, segment_mb, segment_minutes, compress, schema, csv, json_port, durable, low_latency])
   main_pid = os.getpid()
+  console = Console(display, refresh_hz)
 
   signal.signal(signal.SIGINT, signal_handler)
-
-
-  tcp_server = TCPServer(net_port)
-  udp_server = UDPServer(net_port)
-
-  if tcp:
+  if durable:
+    signal.signal(signal.SIGTERM, signal_handler)
+
+
+  # the ring is shared with the server processes, so it is created before them
+  if shm and (udp or (tcp and not aio)):
+    from shm_ring import ShmRing
+    ring = ShmRing(shm_slots, lossless=lossless)
+  if use_metrics:
+    from metrics import Metrics, SharedCounters, SharedHistogram
+    metrics = Metrics()
+  # only the server of this run is created, the send stage is timed by the
+  # server, in its own process through shared memory
+  counters = None
+  send_latency = None
+  if tcp and aio:
+    from aio_server import AsyncTCPServer
+    if low_latency:
+      send_latency = metrics.histogram('send')
+    tcp_server = AsyncTCPServer(net_port, client_buffer, slow_client, verbose=verbose, latency=send_latency)
+  elif tcp:
+    import net_process
+    if use_metrics:
+      counters = SharedCounters(net_process.TCP_COUNTERS)
+    if low_latency:
+      send_latency = metrics.attach('send', SharedHistogram())
+    tcp_server = net_process.TCPServer(net_port, ring, 0, counters, verbose, send_latency, low_latency, low_latency)
+  elif udp:
+    import net_process
+    if use_metrics:
+      counters = SharedCounters(net_process.UDP_COUNTERS)
+    if low_latency:
+      send_latency = metrics.attach('send', SharedHistogram())
+    udp_server = net_process.UDPServer(net_port, ring, 1, udp_batch, mtu, keepalive, counters, verbose, send_latency, low_latency)
+
+  if tcp_server is not None:
     tcp_server.daemon=True
     tcp_server.start()
-  elif udp:
+  elif udp_server is not None:
     udp_server.daemon=True
     udp_server.start()
-
+  if json_port:
+    if aio:
+      from aio_server import AsyncTCPServer
+      json_server = AsyncTCPServer(json_port, client_buffer, slow_client, verbose=verbose)
+    else:
+      from net_process import TCPServer
+      json_server = TCPServer(json_port, verbose=verbose)
+    json_server.daemon=True
+    json_server.start()
+  if metrics:
+    start_metrics(counters)
+
+  # the files are closed also when an error ends the acquisition, unless the
+  # signal handler already did it
   if repeat:
-    repeater(ser)
+    open_text_file(outfile)
+    try:
+      repeater()
+    finally:
+      if writer is not None:
+        save_to_text_file(outfile)
+  elif devices:
+    if merge:
+      open_binary_file(outfile)
+    try:
+      multi_receive(devices)
+    finally:
+      if writer is not None or device_writers:
+        save_to_binary_file(outfile)
   else:
-    receive_data(ser)
-    save_to_binary_file()
+    # opened after the servers start so their processes do not share the file
+    open_binary_file(outfile)
+    try:
+      receive_data()
+    finally:
+      close_sinks()
+      if writer is not None:
+        save_to_binary_file(outfile)
 
 
 if __name__ == "__main__":
@@ -472,3 +1059,9 @@ if __name__ == "__main__":
   except:
     pass
 
+  try:
+    json_server.terminate()
+  except:
+    pass
+  close_ring()
+  close_metrics()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Recovery of the captures that were not closed
+#  after a SIGKILL, a power loss or a crash the packages written after the
+#  last flush may be on the disk without the header counting them, and an
+#  indexed file has no index. The file is repaired in place:
+#    legacy: the count header is set to the whole packages in the file and a
+#            partial last package is cut, the size of a package comes from
+#            --frame_size or from the schema
+#    indexed: the records are walked from the index checkpoint (filename.idx,
+#             written with --durable) or from the first one, the garbage after
+#             the last good record is cut, then the index and the header are
+#             written as close() does
+#    $ recover.py data.pslx
+#    $ recover.py data.bin --schema '<Iff time x y'
+########################################################
+
+import os
+import mmap
+import struct
+import argparse
+
+import numpy as np
+
+from binwriter import (HEADER_FORMAT, HEADER_SIZE, INDEXED_MAGIC, INDEXED_HEADER_FORMAT, INDEXED_HEADER_SIZE,
+                       RECORD_FORMAT, RECORD_SIZE, CHECKPOINT_EXTENSION)
+from binreader import scan_records
+from schema import Schema, configured_schema
+
+# index entries written at once
+INDEX_CHUNK = 1 << 20
+
+
+def is_indexed(filename):
+  with open(filename, 'rb') as f:
+    return f.read(len(INDEXED_MAGIC)) == INDEXED_MAGIC
+
+
+# set the count header of a legacy file to the packages it holds
+def recover_legacy(filename, frame_size, dry_run=False):
+  size = os.path.getsize(filename)
+  with open(filename, 'rb' if dry_run else 'r+b') as f:
+    header, = struct.unpack(HEADER_FORMAT, f.read(HEADER_SIZE))
+    count = (size - HEADER_SIZE) // frame_size
+    end = HEADER_SIZE + count * frame_size
+    if not dry_run and (count != header or end != size):
+      os.pwrite(f.fileno(), struct.pack(HEADER_FORMAT, count), 0)
+      f.truncate(end)
+      os.fsync(f.fileno())
+  return {'file': filename, 'format': 'legacy', 'header': header, 'recovered': count, 'cut_bytes': size - end}
+
+
+# index entries of the checkpoint that point inside the file, and the end of
+# the last record they cover
+def read_checkpoint(filename, data, size):
+  path = filename + CHECKPOINT_EXTENSION
+  if not os.path.exists(path):
+    return np.zeros(0, np.uint64), np.zeros(0, np.uint64), INDEXED_HEADER_SIZE
+  with open(path, 'rb') as f:
+    raw = f.read()
+  index = np.frombuffer(raw, '<u8', len(raw) // 16 * 2).reshape(-1, 2)
+  offsets = index[:, 0]
+  timestamps = index[:, 1]
+  # the checkpoint is written after its records, only a cut file loses some
+  while len(offsets):
+    offset = int(offsets[-1])
+    if offset + RECORD_SIZE <= size:
+      length, stamp = struct.unpack_from(RECORD_FORMAT, data, offset)
+      if offset + RECORD_SIZE + length <= size and stamp == timestamps[-1]:
+        return offsets, timestamps, offset + RECORD_SIZE + length
+    offsets = offsets[:-1]
+    timestamps = timestamps[:-1]
+  return offsets, timestamps, INDEXED_HEADER_SIZE
+
+
+# rebuild the index of an indexed file that was not closed
+def recover_indexed(filename, dry_run=False):
+  size = os.path.getsize(filename)
+  with open(filename, 'rb') as f:
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, _, header, index_offset, data_end = struct.unpack_from(INDEXED_HEADER_FORMAT, data, 0)
+    if index_offset:
+      data.close()
+      return {'file': filename, 'format': 'indexed', 'header': header, 'recovered': header, 'cut_bytes': 0,
+              'closed': True}
+    offsets, timestamps, start = read_checkpoint(filename, data, size)
+    checkpoint = len(offsets)
+    last = int(timestamps[-1]) if checkpoint else 0
+    tail_offsets, tail_timestamps, end = scan_records(data, start, size, last)
+    data.close()
+  offsets = np.concatenate((offsets, tail_offsets))
+  timestamps = np.concatenate((timestamps, tail_timestamps))
+  count = len(offsets)
+  if not dry_run:
+    with open(filename, 'r+b') as f:
+      f.truncate(end)
+      f.seek(end)
+      index = np.empty((min(count, INDEX_CHUNK), 2), '<u8')
+      for first in range(0, count, INDEX_CHUNK):
+        n = min(INDEX_CHUNK, count - first)
+        index[:n, 0] = offsets[first:first + n]
+        index[:n, 1] = timestamps[first:first + n]
+        f.write(index[:n].tobytes())
+      f.flush()
+      os.fsync(f.fileno())
+      os.pwrite(f.fileno(), struct.pack(INDEXED_HEADER_FORMAT, INDEXED_MAGIC, version, 0, count, end, end), 0)
+      os.fsync(f.fileno())
+    if os.path.exists(filename + CHECKPOINT_EXTENSION):
+      os.remove(filename + CHECKPOINT_EXTENSION)
+  return {'file': filename, 'format': 'indexed', 'header': header, 'checkpoint': checkpoint, 'recovered': count,
+          'cut_bytes': size - end, 'closed': False}
+
+
+# repair filename in place (only report with dry_run), frame_size is needed
+# by the legacy format
+def recover(filename, frame_size=None, dry_run=False):
+  if is_indexed(filename):
+    return recover_indexed(filename, dry_run)
+  if not frame_size:
+    raise ValueError('%s is a legacy file, the size of its packages is needed (--frame_size or --schema)' % (filename))
+  return recover_legacy(filename, frame_size, dry_run)
+
+
+def report(result):
+  if result.get('closed'):
+    return '%(file)s: closed file, %(recovered)d packages, nothing to do' % result
+  line = '%(file)s: header %(header)d packages' % result
+  if result.get('checkpoint'):
+    line += ', index checkpoint %(checkpoint)d' % result
+  return line + ', recovered %(recovered)d, %(cut_bytes)d bytes cut' % result
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='repair pslog files that were not closed (.bin or .pslx)')
+  parser.add_argument('files', type=str, nargs='+')
+  parser.add_argument('--frame_size', type=int, default=None, help='bytes of a package in a legacy file')
+  parser.add_argument('-s', '--schema', type=str, default=None, help='layout of the payload, gives the size of a package (default=schema of .pslogrc)')
+  parser.add_argument('-n', '--dry_run', action='store_true', help='only report what would be recovered')
+  args = parser.parse_args()
+
+  frame_size = args.frame_size
+  if not frame_size:
+    schema = args.schema or configured_schema()
+    if schema:
+      frame_size = Schema.parse(schema).size
+  failed = False
+  for filename in args.files:
+    try:
+      print(report(recover(filename, frame_size, args.dry_run)))
+    except (OSError, ValueError) as er:
+      print('Error:', str(er))
+      failed = True
+  if failed:
+    exit(1)
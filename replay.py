@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Replay of a capture through the TCP or UDP servers
+#  the packages of a .pslx, a .bin, a segmented capture (.manifest.json) or
+#  a raw dump of the serial port are published as pslog publishes the live
+#  ones, to load test the programs that read the servers. The pace is
+#    realtime: the receive times of the capture (.pslx and segmented
+#              indexed captures), --speed 10 replays 10 times faster
+#    rate: --rate packages per second
+#    max: as fast as possible, a stress test of the servers
+#  Every --interval seconds a line shows the packages published and the
+#  messages the server delivered to its clients, the summary gives the best
+#  delivery rate sustained over an interval:
+#    $ replay.py data.pslx -t --speed 2
+#    $ replay.py data.bin -u --udp_batch --pace max --clients 4 -s '<Iff time x y'
+########################################################
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+import net_process
+from net_process import TCPServer, UDPServer
+from aio_server import AsyncTCPServer
+from shm_ring import ShmRing, INVALID
+from metrics import SharedCounters
+from binreader import BinaryReader, IndexedReader
+from segments import SegmentReader, MANIFEST_EXTENSION
+from logger import SerialLogger, FileSource
+from sinks import ServerSink
+from schema import Schema, configured_schema
+
+PACES = ('realtime', 'rate', 'max')
+# packages of a batch when the capture has no reads to follow
+BATCH = 256
+NO_TIMES = 'the capture has no receive times, use --pace rate or max'
+
+
+# batches of (timestamp, packages) of an indexed file, the packages of one
+# serial read (same timestamp) stay together
+def indexed_batches(filename, batch=BATCH):
+  with IndexedReader(filename) as reader:
+    stamps = reader.timestamps
+    starts = np.flatnonzero(stamps[1:] != stamps[:-1]) + 1
+    bounds = np.concatenate(([0], starts, [reader.count])) if reader.count else []
+    for first, stop in zip(bounds[:-1], bounds[1:]):
+      for n in range(int(first), int(stop), batch):
+        yield int(stamps[n]), [bytes(reader.frame(i)) for i in range(n, min(n + batch, int(stop)))]
+
+
+# batches of a legacy file, the packages have frame_size bytes and no time
+def legacy_batches(filename, frame_size, batch=BATCH):
+  with BinaryReader(filename, np.dtype('V%d' % (frame_size))) as reader:
+    for chunk in reader.chunks(batch):
+      data = chunk.tobytes()
+      yield None, [data[i:i + frame_size] for i in range(0, len(data), frame_size)]
+
+
+# batches of a segmented capture, streamed segment by segment
+def segment_batches(filename, frame_size=None, batch=BATCH):
+  frames = []
+  last = None
+  for stamp, data in SegmentReader(filename, frame_size).frames():
+    if frames and (stamp != last or len(frames) == batch):
+      yield last, frames
+      frames = []
+    frames.append(data)
+    last = stamp
+  if frames:
+    yield last, frames
+
+
+# batches of a raw dump, found by the frame parser as pslog finds them
+def dump_batches(filename, batch=BATCH):
+  with SerialLogger(FileSource(filename)) as reader:
+    for _, frames in reader:
+      for n in range(0, len(frames), batch):
+        yield None, frames[n:n + batch]
+
+
+# the batches of any capture, chosen by its extension, the other files are
+# raw dumps
+def capture_batches(filename, frame_size=None, batch=BATCH):
+  if filename.endswith(MANIFEST_EXTENSION):
+    return segment_batches(filename, frame_size, batch)
+  if filename.endswith('.pslx'):
+    return indexed_batches(filename, batch)
+  if filename.endswith('.bin'):
+    if not frame_size:
+      raise ValueError('%s is a legacy file, the size of its packages is needed (--frame_size or --schema)' % (filename))
+    return legacy_batches(filename, frame_size, batch)
+  return dump_batches(filename, batch)
+
+
+# whether the packages of a capture have their receive time, as the realtime
+# pace needs: .pslx files and the segmented captures in the indexed format
+def has_timestamps(filename):
+  if filename.endswith(MANIFEST_EXTENSION):
+    with open(filename) as f:
+      return json.load(f).get('format') == 'indexed'
+  return filename.endswith('.pslx')
+
+
+# the batches given at the time their pace says, speed divides the time
+# between the receive times in realtime
+def paced(batches, pace='max', rate=0, speed=1.0):
+  start = time.monotonic()
+  first = None
+  count = 0
+  for stamp, frames in batches:
+    if pace == 'realtime':
+      if stamp is None:
+        raise ValueError(NO_TIMES)
+      if first is None:
+        first = stamp
+      delay = start + (stamp - first) / 1e9 / speed - time.monotonic()
+    elif pace == 'rate':
+      delay = start + count / rate - time.monotonic()
+    else:
+      delay = 0
+    if delay > 0:
+      time.sleep(delay)
+    count += len(frames)
+    yield stamp, frames
+
+
+################# Classe ReplayStats ########################################
+# packages published and messages delivered by the server to its clients,
+# read from the counters of the server process or from the asyncio server
+class ReplayStats:
+  def __init__(self, server, counters=None, delivered='sent', ring=None, consumer=0):
+    self.server = server
+    self.counters = counters
+    self.delivered_name = delivered
+    self.ring = ring
+    self.consumer = consumer
+    self.reset()
+
+  def reset(self):
+    self.frames = 0
+    self.bytes = 0
+    self.started = time.monotonic()
+    self.published = None
+    self.last = (self.started, 0, self.server_state()[1])
+    self.best = 0.0
+    self.first_delivered = self.last[2]
+
+  # (clients, messages delivered, messages waiting for the server)
+  def server_state(self):
+    if self.counters is None:
+      s = self.server.stats()
+      return s['clients'], s['sent'], s['incoming'] + s['backlog']
+    c = self.counters.snapshot()
+    if self.ring is None:
+      waiting = self.server.message_queue.qsize()
+    else:
+      position = self.ring.consumer_position(self.consumer)
+      waiting = 0 if position == INVALID else self.ring.head() - position
+    return c['clients'], c[self.delivered_name], waiting + c.get('backlog', 0)
+
+  def add(self, frames):
+    self.frames += len(frames)
+    self.bytes += sum(map(len, frames))
+
+  # rates since the previous line, the best delivery rate is kept
+  def line(self):
+    now = time.monotonic()
+    then, frames, delivered = self.last
+    clients, sent, waiting = self.server_state()
+    elapsed = max(now - then, 1e-9)
+    rate = (sent - delivered) / elapsed
+    self.best = max(self.best, rate)
+    self.last = (now, self.frames, sent)
+    return 'published %d (%.0f/s), delivered %d (%.0f/s) to %d clients, %d waiting' % (
+           self.frames, (self.frames - frames) / elapsed, sent, rate, clients, waiting)
+
+  # the packages are counted until the last one was published, the messages
+  # until the server delivered them
+  def summary(self):
+    now = time.monotonic()
+    published = max((self.published or now) - self.started, 1e-9)
+    elapsed = max(now - self.started, 1e-9)
+    clients, sent, waiting = self.server_state()
+    sent -= self.first_delivered
+    return ('%d packages (%d bytes) in %.2f s: %.0f packages/s, %.1f MB/s\n'
+            'delivered %d messages to %d clients in %.2f s: %.0f/s average, %.0f/s best over an interval, %d not delivered' % (
+            self.frames, self.bytes, published, self.frames / published, self.bytes / published / 1e6,
+            sent, clients, elapsed, sent / elapsed, max(self.best, sent / elapsed), waiting))
+
+################## Fim da classe ReplayStats ################################
+
+
+# wait until count clients are connected
+def wait_clients(stats, count):
+  while stats.server_state()[0] < count:
+    time.sleep(0.05)
+
+
+# publish the batches, a report line every interval seconds, then give the
+# server up to drain seconds to deliver what it holds
+def replay(batches, sink, stats, interval=1.0, drain=5.0):
+  next_report = time.monotonic() + interval
+  for stamp, frames in batches:
+    sink.write(stamp, frames, None)
+    stats.add(frames)
+    if interval and time.monotonic() >= next_report:
+      next_report += interval
+      print(stats.line())
+  stats.published = time.monotonic()
+  deadline = time.monotonic() + drain
+  while stats.server_state()[2] and time.monotonic() < deadline:
+    time.sleep(0.01)
+    if interval and time.monotonic() >= next_report:
+      next_report += interval
+      print(stats.line())
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='publish a recorded capture (.pslx, .bin, .manifest.json or a raw dump) through the TCP or UDP server of pslog')
+  parser.add_argument('capture', type=str)
+  parser.add_argument('-t', '--tcp', action='store_true', help='publish with a TCP server (default)')
+  parser.add_argument('-u', '--udp', action='store_true', help='publish with a UDP server')
+  parser.add_argument('-P', '--net_port', type=int, default=None, help='TCP or UDP port (default=5353 for TCP, 5050 for UDP)')
+  parser.add_argument('--aio', action='store_true', help='run the TCP server with asyncio in this process')
+  parser.add_argument('--shm', action='store_true', help='hand the packages to the server process through a shared memory ring')
+  parser.add_argument('--udp_batch', action='store_true', help='pack several packages in each UDP datagram')
+  parser.add_argument('--mtu', type=int, default=net_process.UDP_MTU, help='largest UDP datagram with --udp_batch (default=%d)' % (net_process.UDP_MTU))
+  parser.add_argument('--pace', type=str, choices=PACES, default='realtime', help='realtime: the receive times of the capture, rate: --rate packages per second, max: as fast as possible (default=realtime)')
+  parser.add_argument('--speed', type=float, default=1.0, help='with --pace realtime, how many times faster than the capture (default=1)')
+  parser.add_argument('--rate', type=float, default=0, help='packages per second, implies --pace rate')
+  parser.add_argument('--repeat', type=int, default=1, help='times the capture is published (default=1)')
+  parser.add_argument('--clients', type=int, default=0, help='wait for this number of clients before starting (default=0)')
+  parser.add_argument('--interval', type=float, default=1.0, help='seconds between report lines, 0 for none (default=1)')
+  parser.add_argument('--drain', type=float, default=5.0, help='seconds given to the server to deliver what it holds at the end (default=5)')
+  parser.add_argument('--frame_size', type=int, default=None, help='bytes of a package in a legacy file')
+  parser.add_argument('-s', '--schema', type=str, default=None, help='layout of the payload, gives the size of a package (default=schema of .pslogrc)')
+  parser.add_argument('-v', '--verbose', action='store_true')
+  args = parser.parse_args()
+
+  pace = 'rate' if args.rate else args.pace
+  if pace == 'rate' and args.rate <= 0:
+    print('Error: --pace rate needs --rate')
+    exit(1)
+  if args.speed <= 0:
+    print('Error: --speed must be positive')
+    exit(1)
+  frame_size = args.frame_size
+  if not frame_size:
+    schema = args.schema or configured_schema()
+    if schema:
+      frame_size = Schema.parse(schema).size
+  # with a fixed rate the batches hold about a millisecond of packages
+  batch = max(1, min(BATCH, int(args.rate / 1000))) if pace == 'rate' else BATCH
+  try:
+    if not os.path.exists(args.capture):
+      raise OSError('no such file: %s' % (args.capture))
+    capture_batches(args.capture, frame_size, batch)
+    # checked before the servers start
+    if pace == 'realtime' and not has_timestamps(args.capture):
+      raise ValueError(NO_TIMES)
+  except (OSError, ValueError) as er:
+    print('Error:', str(er))
+    exit(1)
+
+  ring = ShmRing(lossless=True) if args.shm and not args.aio else None
+  if args.udp:
+    counters = SharedCounters(net_process.UDP_COUNTERS)
+    server = UDPServer(args.net_port or 5050, ring, 0, args.udp_batch, args.mtu, 0, counters, args.verbose)
+    stats = ReplayStats(server, counters, 'datagrams', ring)
+  elif args.aio:
+    server = AsyncTCPServer(args.net_port or 5353, verbose=args.verbose)
+    stats = ReplayStats(server)
+  else:
+    counters = SharedCounters(net_process.TCP_COUNTERS)
+    server = TCPServer(args.net_port or 5353, ring, 0, counters, args.verbose)
+    stats = ReplayStats(server, counters, 'sent', ring)
+  server.daemon = True
+  server.start()
+
+  try:
+    if args.clients:
+      print('waiting for %d clients' % (args.clients))
+      wait_clients(stats, args.clients)
+    stats.reset()
+    for n in range(args.repeat):
+      batches = paced(capture_batches(args.capture, frame_size, batch), pace, args.rate, args.speed)
+      replay(batches, ServerSink(server), stats, args.interval, args.drain if n == args.repeat - 1 else 0)
+    print(stats.summary())
+  except (OSError, ValueError) as er:
+    print('Error:', str(er))
+    exit(1)
+  except KeyboardInterrupt:
+    print()
+    print(stats.summary())
+  finally:
+    server.terminate()
+    if ring is not None:
+      ring.close()
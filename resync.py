@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Offline frame extraction from a raw dump of the serial port
+#  the dump is mapped in memory and cut in regions, every 0xFFFF of a region
+#  is a header candidate and all of them are checked at once with numpy
+#  (batch_check.check_candidates). A region is read with MAX_FRAME bytes of
+#  the next one, so the frames across the border are checked too, and the
+#  regions are checked by several processes.
+#  The frames are then chosen in order as FrameParser does: a valid frame is
+#  taken when it starts after the end of the last one taken, so a false
+#  header inside a payload is skipped, and a failed checksum moves on to the
+#  next candidate. Unlike FrameParser, which waits for more bytes, the last
+#  frames are taken when they end right at the end of the dump.
+#  The payloads are saved as a legacy .bin file:
+#    $ resync.py dump.raw -o data.bin -j 4
+########################################################
+
+import os
+import json
+import mmap
+import time
+import struct
+import argparse
+import multiprocessing as mp
+
+import numpy as np
+
+from frame import MAX_FRAME
+from batch_check import check_candidates
+from binwriter import HEADER_FORMAT
+
+# bytes of a region
+REGION_SIZE = 8 << 20
+# rounds of the vectorized choice before going frame by frame
+MAX_ROUNDS = 16
+
+# the dump of each worker process
+dump = None
+
+
+def open_dump(filename):
+  global dump
+  f = open(filename, 'rb')
+  if os.fstat(f.fileno()).st_size == 0:
+    dump = np.zeros(0, np.uint8)
+  else:
+    dump = np.frombuffer(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), np.uint8)
+  f.close()
+
+
+# header candidates of the region [start, end) checked, positions in the dump
+# returns (positions, lengths) of the valid frames and the positions of the
+# frames with a wrong length or checksum
+def check_region(region):
+  start, end = region
+  data = dump[start:min(end + MAX_FRAME, len(dump))]
+  count = min(end, len(dump) - 1) - start
+  if count <= 0:
+    return np.zeros(0, np.int64), np.zeros(0, np.uint8), np.zeros(0, np.int64)
+  # positions in the region fit in 32 bits, half the memory traffic of int64
+  marks = data[:count + 1] == 0xFF
+  headers = np.flatnonzero(marks[:-1] & marks[1:]).astype(np.int32)
+  positions, lengths, valid, complete = check_candidates(data, headers)
+  return start + positions[valid].astype(np.int64), lengths[valid], start + positions[complete & ~valid].astype(np.int64)
+
+
+# the frames FrameParser would take among the valid ones, starting after
+# cursor. A frame is taken when no frame taken before it covers its start,
+# which only depends on the frames before it, so the rounds below settle on
+# that choice; the rare case that does not settle is done frame by frame.
+def choose(positions, stops, cursor):
+  chosen = positions >= cursor
+  for _ in range(MAX_ROUNDS):
+    covered = np.maximum.accumulate(np.where(chosen, stops, cursor))
+    covered = np.concatenate(([cursor], covered[:-1]))
+    rechosen = positions >= np.maximum(covered, cursor)
+    if np.array_equal(rechosen, chosen):
+      return chosen
+    chosen = rechosen
+  chosen = np.zeros(len(positions), bool)
+  for n in range(len(positions)):
+    if positions[n] >= cursor:
+      chosen[n] = True
+      cursor = stops[n]
+  return chosen
+
+
+# payloads of the chosen frames as one block of bytes
+def gather(data, positions, lengths):
+  if not len(positions):
+    return b''
+  sizes = lengths.astype(np.int64) - 3
+  starts = positions + 3
+  if (sizes == sizes[0]).all():
+    # rows of a sliding window are copied whole, faster than a 2D index
+    first = int(starts[0])
+    window = np.lib.stride_tricks.sliding_window_view(data[first:int(starts[-1]) + sizes[0]], int(sizes[0]))
+    return window[starts - first].tobytes()
+  offsets = np.cumsum(sizes) - sizes
+  index = np.arange(int(sizes.sum())) + np.repeat(starts - offsets, sizes)
+  return data[index].tobytes()
+
+
+################# Classe ResyncStats ########################################
+class ResyncStats:
+  def __init__(self, size):
+    self.bytes = size
+    self.frames = 0
+    self.payload_bytes = 0
+    self.errors = 0
+    self.false_headers = 0
+    self.lengths = np.zeros(256, np.int64)
+    self.seconds = 0.0
+
+  def snapshot(self):
+    framed = int((self.lengths * (np.arange(256) + 2)).sum())
+    return {'bytes': self.bytes, 'frames': self.frames, 'payload_bytes': self.payload_bytes,
+            'errors': self.errors, 'false_headers': self.false_headers, 'skipped_bytes': self.bytes - framed,
+            'payload_sizes': {int(n) - 3: int(c) for n, c in enumerate(self.lengths) if c},
+            'seconds': self.seconds, 'mb_per_s': self.bytes / max(self.seconds, 1e-9) / 1e6}
+
+################## Fim da classe ResyncStats ################################
+
+
+# extract the frames of the dump filename into a legacy .bin, jobs processes
+# check the regions (1: all in this process), returns the statistics
+def resync(filename, output, jobs=None, region_size=REGION_SIZE):
+  start_time = time.perf_counter()
+  open_dump(filename)
+  size = len(dump)
+  regions = [(start, min(start + region_size, size)) for start in range(0, size, region_size)]
+  jobs = jobs or os.cpu_count() or 1
+  pool = mp.Pool(jobs, open_dump, (filename,)) if jobs > 1 and len(regions) > 1 else None
+  checked = pool.imap(check_region, regions) if pool else map(check_region, regions)
+  stats = ResyncStats(size)
+  cursor = 0
+  try:
+    with open(output, 'wb') as out:
+      out.write(struct.pack(HEADER_FORMAT, 0))
+      for positions, lengths, rejected in checked:
+        stops = positions + 2 + lengths
+        chosen = choose(positions, stops, cursor)
+        taken = positions[chosen]
+        taken_lengths = lengths[chosen]
+        taken_stops = stops[chosen]
+        # a rejected header counts as an error when FrameParser would see it
+        # (not inside a frame taken)
+        before = np.searchsorted(taken, rejected, side='right') - 1
+        inside = np.where(before >= 0, taken_stops[np.maximum(before, 0)] > rejected, cursor > rejected)
+        stats.errors += int((~inside).sum())
+        stats.false_headers += len(positions) - len(taken)
+        stats.frames += len(taken)
+        stats.lengths += np.bincount(taken_lengths, minlength=256)
+        payload = gather(dump, taken, taken_lengths)
+        stats.payload_bytes += len(payload)
+        out.write(payload)
+        if len(taken):
+          cursor = int(taken_stops[-1])
+      out.flush()
+      os.pwrite(out.fileno(), struct.pack(HEADER_FORMAT, stats.frames), 0)
+  finally:
+    if pool:
+      pool.close()
+      pool.join()
+  stats.seconds = time.perf_counter() - start_time
+  return stats
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='extract the frames of a raw serial dump into a .bin file')
+  parser.add_argument('dump', type=str)
+  parser.add_argument('-o', '--output', type=str, default=None, help='output file (default=dump.bin)')
+  parser.add_argument('-j', '--jobs', type=int, default=None, help='processes checking the regions (default=number of CPUs)')
+  parser.add_argument('--region_mb', type=int, default=REGION_SIZE >> 20, help='size of a region in MB (default=%d)' % (REGION_SIZE >> 20))
+  parser.add_argument('--stats', type=str, default=None, help='also write the statistics to this JSON file')
+  args = parser.parse_args()
+
+  output = args.output or args.dump + '.bin'
+  try:
+    stats = resync(args.dump, output, args.jobs, args.region_mb << 20).snapshot()
+  except OSError as er:
+    print('Error:', str(er))
+    exit(1)
+  print('%d frames (%d payload bytes) from %d bytes in %.2f s, %.0f MB/s' % (
+        stats['frames'], stats['payload_bytes'], stats['bytes'], stats['seconds'], stats['mb_per_s']))
+  print('checksum errors: %d, false headers inside frames: %d, bytes out of frames: %d' % (
+        stats['errors'], stats['false_headers'], stats['skipped_bytes']))
+  print('payload sizes:', ', '.join('%d B x %d' % item for item in sorted(stats['payload_sizes'].items())))
+  print('saved to', output)
+  if args.stats:
+    with open(args.stats, 'w') as f:
+      json.dump(stats, f, indent=2)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Layout of the payload of the packages
+#  declared once and used to decode whole captures with numpy, two forms:
+#    a struct format string followed by the field names (optional):
+#      <Iff time x y
+#      @Bxxxd flag value     (@: native sizes and C alignment, as a memcpy
+#                              of a C struct on the same machine)
+#    a list of fields name:type, the types are fread names or struct codes:
+#      time:uint32, x:float32, y:float32
+#  in .pslogrc:
+#    schema = time:uint32, x:float32, y:float32
+########################################################
+
+import sys
+import struct
+
+import numpy as np
+
+from binreader import TYPES
+from options import Options
+
+BYTE_ORDERS = {'<': '<', '>': '>', '!': '>', '=': '=', '@': '='}
+# kind of each struct code in numpy
+KINDS = {'b': 'i', 'h': 'i', 'i': 'i', 'l': 'i', 'q': 'i', 'n': 'i',
+         'B': 'u', 'H': 'u', 'I': 'u', 'L': 'u', 'Q': 'u', 'N': 'u', 'P': 'u',
+         'e': 'f', 'f': 'f', 'd': 'f', '?': 'b', 'c': 'S', 's': 'S'}
+# struct code of each numpy kind and size, with standard sizes
+CODES = {('i', 1): 'b', ('i', 2): 'h', ('i', 4): 'i', ('i', 8): 'q',
+         ('u', 1): 'B', ('u', 2): 'H', ('u', 4): 'I', ('u', 8): 'Q',
+         ('f', 2): 'e', ('f', 4): 'f', ('f', 8): 'd', ('b', 1): '?'}
+
+
+# numpy dtype with the fields of a struct format, at the offsets struct uses
+def struct_dtype(fmt, names=None):
+  fmt = fmt.replace(' ', '')
+  order = fmt[0] if fmt and fmt[0] in BYTE_ORDERS else '@'
+  body = fmt[1:] if fmt and fmt[0] in BYTE_ORDERS else fmt
+  prefix = order
+  formats = []
+  offsets = []
+  count = ''
+  for code in body:
+    if code.isdigit():
+      count += code
+      continue
+    repeat = int(count) if count else 1
+    count = ''
+    if code == 'x':
+      prefix += '%dx' % (repeat)
+      continue
+    if code not in KINDS:
+      raise ValueError('unsupported struct code: %s' % (code))
+    if code == 's':
+      # a string is one field of repeat bytes
+      offsets.append(struct.calcsize(prefix + '%ds' % (repeat)) - repeat)
+      formats.append('S%d' % (repeat))
+      prefix += '%ds' % (repeat)
+      continue
+    size = struct.calcsize(order + code)
+    for _ in range(repeat):
+      offsets.append(struct.calcsize(prefix + code) - size)
+      if KINDS[code] in 'bS':
+        formats.append(KINDS[code] + str(size))
+      else:
+        formats.append(BYTE_ORDERS[order] + KINDS[code] + str(size))
+      prefix += code
+  if names is None:
+    names = ['f%d' % (i) for i in range(len(formats))]
+  if len(names) != len(formats):
+    raise ValueError('%s has %d fields and %d names' % (fmt, len(formats), len(names)))
+  return np.dtype({'names': list(names), 'formats': formats, 'offsets': offsets,
+                   'itemsize': struct.calcsize(fmt)})
+
+
+# struct format of a numpy dtype, the gaps between fields are pad bytes
+def dtype_format(dtype):
+  fields = sorted((offset, name, kind) for name, (kind, offset) in dtype.fields.items())
+  # numpy shows the native order as '='
+  native = '<' if sys.byteorder == 'little' else '>'
+  orders = set(native if kind.byteorder == '=' else kind.byteorder for _, _, kind in fields) - {'|'}
+  if len(orders) > 1:
+    raise ValueError('fields of different byte orders')
+  fmt = orders.pop() if orders else '<'
+  position = 0
+  for offset, name, kind in fields:
+    if offset > position:
+      fmt += '%dx' % (offset - position)
+    if kind.kind == 'S':
+      fmt += '%ds' % (kind.itemsize)
+    else:
+      fmt += CODES[kind.kind, kind.itemsize]
+    position = offset + kind.itemsize
+  if dtype.itemsize > position:
+    fmt += '%dx' % (dtype.itemsize - position)
+  return fmt
+
+
+# numpy dtype of a list of 'name:type' fields, packed
+def fields_dtype(fields):
+  names = []
+  formats = []
+  for field in fields:
+    name, _, kind = field.partition(':')
+    name = name.strip()
+    kind = kind.strip()
+    if not name or not kind:
+      raise ValueError('a field is name:type, got %s' % (field))
+    if kind in TYPES:
+      formats.append(TYPES[kind])
+    else:
+      formats.append(struct_dtype('<' + kind).fields['f0'][0].str)
+    names.append(name)
+  return np.dtype({'names': names, 'formats': formats})
+
+
+# the schema of .pslogrc, or of ~/.pslogrc, as text
+def configured_schema():
+  opt = Options()
+  for filename in ('.pslogrc', '~/.pslogrc'):
+    if opt.read(filename):
+      return opt.get_dict_options().get('schema')
+  return None
+
+
+################# Classe Schema ########################################
+# dtype: layout of the payload for numpy
+# fmt: the same layout for struct (default=derived from the dtype)
+class Schema:
+  def __init__(self, dtype, fmt=None):
+    self.dtype = np.dtype(dtype)
+    self.size = self.dtype.itemsize
+    self.names = self.dtype.names
+    self.format = fmt if fmt is not None else dtype_format(self.dtype)
+    self.struct = struct.Struct(self.format)
+
+  # a Schema from any of the two forms, as text or as a list of fields
+  @staticmethod
+  def parse(text):
+    if isinstance(text, (list, tuple)):
+      fields = [f.strip() for f in text if f.strip()]
+    else:
+      fields = [f.strip() for f in text.split(',') if f.strip()]
+    if not fields:
+      raise ValueError('empty schema')
+    if ':' in fields[0]:
+      return Schema(fields_dtype(fields))
+    if len(fields) != 1:
+      raise ValueError('a struct format schema is "format name name ...", without commas')
+    tokens = fields[0].split()
+    return Schema(struct_dtype(tokens[0], tokens[1:] or None), tokens[0])
+
+  # structured array over buffer (bytes, mmap, ...) without copies
+  def decode(self, buffer, count=-1, offset=0):
+    return np.frombuffer(buffer, self.dtype, count, offset)
+
+  # tuples of python values of the packages in buffer, faster than numpy
+  # for the few packages of a serial read
+  def unpack(self, buffer):
+    return self.struct.iter_unpack(buffer)
+
+  def __repr__(self):
+    return 'Schema(%s)' % (', '.join('%s:%s' % (n, self.dtype.fields[n][0]) for n in self.names))
+
+################## Fim da classe Schema ################################
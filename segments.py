@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Segmented capture for long logging sessions
+#  the packages go to a sequence of files (segments) of the legacy or the
+#  indexed format, a new one is started when the current one reaches a size
+#  or an age. The finished segments are closed (flushed and synced) and
+#  compressed by a background thread, the acquisition never waits for it.
+#  A JSON manifest lists the segments:
+#    {"format": "indexed", "compression": "gzip", "segments": [
+#      {"file": "data.000000.pslx.gz", "first": 0, "count": 1000,
+#       "start_ns": ..., "end_ns": ..., "start_time": "...", "bytes": ...}, ...]}
+#  first and count are package numbers over the whole session, start_ns and
+#  end_ns the receive times (monotonic ns) of the first and last package.
+#  SegmentReader streams the packages of all the segments in order.
+########################################################
+
+import os
+import sys
+import json
+import gzip
+import time
+import queue
+import shutil
+import struct
+import threading
+from datetime import datetime
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+try:
+  import lz4.frame
+except ImportError:
+  lz4 = None
+
+from binwriter import WRITERS, HEADER_SIZE, INDEXED_MAGIC, INDEXED_HEADER_FORMAT, INDEXED_HEADER_SIZE, RECORD_FORMAT, RECORD_SIZE
+
+COMPRESSIONS = ('none', 'gzip', 'zstd', 'lz4')
+EXTENSIONS = {'none': '', 'gzip': '.gz', 'zstd': '.zst', 'lz4': '.lz4'}
+FORMAT_EXTENSIONS = {'legacy': '.bin', 'indexed': '.pslx'}
+MANIFEST_EXTENSION = '.manifest.json'
+
+
+# file object that compresses into filename
+def compressed_writer(filename, compression):
+  if compression == 'gzip':
+    return gzip.open(filename, 'wb', compresslevel=6)
+  if compression == 'zstd':
+    if zstandard is None:
+      raise ValueError('zstd compression needs the zstandard module')
+    return zstandard.ZstdCompressor(level=3, threads=0).stream_writer(open(filename, 'wb'), closefd=True)
+  if compression == 'lz4':
+    if lz4 is None:
+      raise ValueError('lz4 compression needs the lz4 module')
+    return lz4.frame.open(filename, 'wb')
+  raise ValueError('unknown compression: %s' % (compression))
+
+
+# file object that reads a segment, compressed or not (by its extension)
+def open_segment(filename):
+  if filename.endswith('.gz'):
+    return gzip.open(filename, 'rb')
+  if filename.endswith('.zst'):
+    if zstandard is None:
+      raise ValueError('%s needs the zstandard module' % (filename))
+    return zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True)
+  if filename.endswith('.lz4'):
+    if lz4 is None:
+      raise ValueError('%s needs the lz4 module' % (filename))
+    return lz4.frame.open(filename, 'rb')
+  return open(filename, 'rb')
+
+
+# write to a temporary file and rename, a reader never sees half a manifest
+def write_manifest(filename, manifest):
+  temporary = filename + '.tmp'
+  with open(temporary, 'w') as f:
+    json.dump(manifest, f, indent=1)
+  os.replace(temporary, filename)
+
+
+################# Classe Finisher ########################################
+# thread that takes the finished segments in order: closes the writer, calls
+# closed(entry), compresses the file and calls compressed(entry, filename)
+class Finisher (threading.Thread):
+  def __init__(self, compression, closed, compressed):
+    threading.Thread.__init__(self)
+    self.daemon = True
+    self.compression = compression
+    self.closed = closed
+    self.compressed = compressed
+    self.segments = queue.Queue()
+    self.error = None
+
+  def run(self):
+    while True:
+      item = self.segments.get()
+      if item is None:
+        break
+      entry, writer = item
+      writer.close()
+      if not self.closed(entry) or self.compression == 'none':
+        continue
+      source = entry['path']
+      target = source + EXTENSIONS[self.compression]
+      try:
+        with open(source, 'rb') as src, compressed_writer(target, self.compression) as dst:
+          shutil.copyfileobj(src, dst, 1 << 20)
+        os.remove(source)
+      except (OSError, ValueError) as er:
+        # the segment stays uncompressed
+        self.error = str(er)
+        print('Error compressing', source, str(er))
+        continue
+      self.compressed(entry, target)
+
+  def submit(self, entry, writer):
+    self.segments.put((entry, writer))
+
+  def stop(self):
+    self.segments.put(None)
+    self.join()
+
+################## Fim da classe Finisher ################################
+
+
+################# Classe SegmentWriter ########################################
+# same interface as BinaryWriter, filename is the manifest
+# basename: segments are basename.NNNNNN.bin (or .pslx)
+# max_bytes: start a new segment after this many bytes of data (0 disables)
+# max_seconds: start a new segment after this many seconds (0 disables)
+# compression: one of COMPRESSIONS, applied to every closed segment
+# checkpoint: index checkpoints of the indexed segments (see binwriter.py)
+class SegmentWriter:
+  def __init__(self, basename, file_format='indexed', max_bytes=0, max_seconds=0, compression='none',
+               flush_frames=0, flush_ms=1000, metrics=None, checkpoint=False):
+    if compression not in COMPRESSIONS:
+      raise ValueError('unknown compression: %s' % (compression))
+    # fail now, not when the first segment is closed
+    if compression != 'none':
+      compressed_writer(os.devnull, compression).close()
+    self.basename = basename
+    self.file_format = file_format
+    self.max_bytes = max_bytes
+    self.max_seconds = max_seconds
+    self.compression = compression
+    self.flush_frames = flush_frames
+    self.flush_ms = flush_ms
+    self.metrics = metrics
+    self.checkpoint = checkpoint
+    self.filename = basename + MANIFEST_EXTENSION
+    self.manifest = {'format': file_format, 'compression': compression, 'segments': []}
+    self.lock = threading.Lock()
+    self.count = 0
+    self.number = 0
+    self.writer = None
+    self.finisher = Finisher(compression, self.closed, self.compressed)
+    self.finisher.start()
+    self.open_segment()
+
+  def open_segment(self):
+    path = '%s.%06d%s' % (self.basename, self.number, FORMAT_EXTENSIONS[self.file_format])
+    self.number += 1
+    self.writer = WRITERS[self.file_format](path, self.flush_frames, self.flush_ms, metrics=self.metrics,
+                                            checkpoint=self.checkpoint)
+    self.segment = {'file': os.path.basename(path), 'path': path, 'first': self.count, 'count': 0,
+                    'start_ns': None, 'end_ns': None, 'start_time': datetime.now().isoformat(), 'bytes': 0}
+    # kept out of the dict while the segment is written
+    self.segment_bytes = 0
+    self.start_ns = None
+    self.end_ns = None
+
+  # the age of a segment is measured with the timestamps of its packages
+  # (monotonic ns, the receive time in pslog)
+  def write(self, frame, timestamp=None):
+    if timestamp is None:
+      timestamp = time.monotonic_ns()
+    if self.start_ns is None:
+      self.start_ns = timestamp
+    elif ((self.max_bytes and self.segment_bytes + len(frame) > self.max_bytes) or
+          (self.max_seconds and timestamp - self.start_ns >= self.max_seconds * 1000000000)):
+      self.rotate()
+      self.start_ns = timestamp
+    self.writer.write(frame, timestamp)
+    self.end_ns = timestamp
+    self.segment_bytes += len(frame)
+    self.count += 1
+
+  # hand the current segment to the finisher and open the next
+  def rotate(self):
+    self.finish_segment()
+    self.open_segment()
+
+  def finish_segment(self):
+    segment = self.segment
+    segment['count'] = self.count - segment['first']
+    segment['bytes'] = self.segment_bytes
+    segment['start_ns'] = self.start_ns
+    segment['end_ns'] = self.end_ns
+    self.finisher.submit(segment, self.writer)
+
+  # called by the finisher thread, returns False for an empty segment
+  def closed(self, entry):
+    with self.lock:
+      if not entry['count']:
+        os.remove(entry['path'])
+        return False
+      self.manifest['segments'].append(entry)
+      self.save_manifest()
+    return True
+
+  # called by the finisher thread
+  def compressed(self, entry, target):
+    with self.lock:
+      entry['file'] = os.path.basename(target)
+      entry['path'] = target
+      self.save_manifest()
+
+  def save_manifest(self):
+    manifest = dict(self.manifest)
+    manifest['segments'] = [{k: v for k, v in s.items() if k != 'path'} for s in manifest['segments']]
+    manifest['count'] = sum(s['count'] for s in manifest['segments'])
+    write_manifest(self.filename, manifest)
+
+  def flush(self):
+    self.writer.flush()
+
+  def tick(self):
+    self.writer.tick()
+
+  # closes the last segment and waits for the compression of all of them
+  def close(self):
+    if self.writer is None:
+      return
+    self.finish_segment()
+    self.writer = None
+    self.finisher.stop()
+    if not self.manifest['segments']:
+      # the manifest exists even without data, as the file of the other writers
+      self.save_manifest()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+################## Fim da classe SegmentWriter ################################
+
+
+################# Classe SegmentReader ########################################
+# streams the packages of the segments listed in a manifest, decompressing
+# them on the fly. The legacy format has no lengths, the size of a package
+# must be given in frame_size.
+class SegmentReader:
+  def __init__(self, manifest, frame_size=None):
+    self.filename = manifest
+    with open(manifest) as f:
+      self.manifest = json.load(f)
+    self.directory = os.path.dirname(os.path.abspath(manifest))
+    self.file_format = self.manifest['format']
+    self.segments = self.manifest['segments']
+    self.count = sum(s['count'] for s in self.segments)
+    if self.file_format == 'legacy' and not frame_size:
+      raise ValueError('the legacy format needs the size of the packages')
+    self.frame_size = frame_size
+
+  def __len__(self):
+    return self.count
+
+  # (timestamp, data) of the packages from start to stop, the timestamp is
+  # None in the legacy format. Only the segments in the range are opened.
+  def frames(self, start=0, stop=None):
+    stop = self.count if stop is None else min(stop, self.count)
+    for segment in self.segments:
+      first = segment['first']
+      if first + segment['count'] <= start:
+        continue
+      if first >= stop:
+        break
+      n = first
+      for stamp, data in self.segment_frames(segment):
+        if n >= stop:
+          break
+        if n >= start:
+          yield stamp, data
+        n += 1
+
+  # the packages received between t0 and t1 (monotonic ns), t1 excluded,
+  # the segments outside the window are skipped
+  def time_window(self, t0, t1):
+    for segment in self.segments:
+      if segment['end_ns'] < t0 or segment['start_ns'] >= t1:
+        continue
+      for stamp, data in self.segment_frames(segment):
+        if stamp is None or t0 <= stamp < t1:
+          yield stamp, data
+
+  def segment_frames(self, segment):
+    with open_segment(os.path.join(self.directory, segment['file'])) as f:
+      if self.file_format == 'legacy':
+        f.read(HEADER_SIZE)
+        for _ in range(segment['count']):
+          data = f.read(self.frame_size)
+          if len(data) < self.frame_size:
+            break
+          yield None, data
+        return
+      magic = struct.unpack(INDEXED_HEADER_FORMAT, f.read(INDEXED_HEADER_SIZE))[0]
+      if magic != INDEXED_MAGIC:
+        raise ValueError('%s is not an indexed pslog file' % (segment['file']))
+      for _ in range(segment['count']):
+        record = f.read(RECORD_SIZE)
+        if len(record) < RECORD_SIZE:
+          break
+        length, stamp = struct.unpack(RECORD_FORMAT, record)
+        yield stamp, f.read(length)
+
+################## Fim da classe SegmentReader ################################
+
+
+if __name__ == '__main__':
+  if len(sys.argv) < 2:
+    print('usage: segments.py file.manifest.json [frame_size]')
+    exit(1)
+  reader = SegmentReader(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None)
+  print(reader.count, 'packages in', len(reader.segments), 'segments')
+  for segment in reader.segments:
+    print('%(file)s: packages %(first)d + %(count)d, %(bytes)d bytes, started %(start_time)s' % segment)
+  for stamp, data in reader.frames(0, 10):
+    print(stamp, data)
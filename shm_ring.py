@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Shared memory ring buffer, one producer and many consumers
+#  the logger writes each message once into a slot and the server processes
+#  read it straight from the shared memory, nothing is pickled or piped.
+#    header: head(uint64) | slots(uint32) | slot size(uint32) | consumers(uint32)
+#            | pad(uint32) | consumer sequence(uint64) * consumers
+#    slot: sequence(uint64) | length(uint32) | stamp(uint64) | data
+#  Message n goes to slot n % slots. A slot is valid while its sequence
+#  matches the one the consumer expects, it is checked again after the copy,
+#  so a slot overwritten during the read is detected (seqlock). The stamp is
+#  the receive time of the message (monotonic ns), for the latency tracing.
+########################################################
+
+import time
+import struct
+from multiprocessing import shared_memory
+
+HEADER_FORMAT = '<QIIII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+SLOT_FORMAT = '<QIQ'
+SLOT_HEADER_SIZE = struct.calcsize(SLOT_FORMAT)
+# sequence of a slot being written and of a consumer not attached
+INVALID = 0xFFFFFFFFFFFFFFFF
+
+_u64 = struct.Struct('<Q')
+_slot = struct.Struct(SLOT_FORMAT)
+
+
+################# Classe ShmRing ########################################
+# slots: number of messages the ring holds, a power of two is not required
+# slot_size: largest message, bigger ones are split in pieces
+# consumers: number of readers, each one has a fixed index
+# lossless: the producer waits for the slowest attached consumer instead of
+#           overwriting messages it has not read yet
+class ShmRing:
+  def __init__(self, slots=65536, slot_size=256, consumers=2, lossless=False, name=None):
+    self.lossless = lossless
+    if name is None:
+      self.slots = slots
+      self.slot_size = slot_size
+      self.consumers = consumers
+      size = HEADER_SIZE + 8 * consumers + slots * (SLOT_HEADER_SIZE + slot_size)
+      self.shm = shared_memory.SharedMemory(create=True, size=size)
+      self.owner = True
+      struct.pack_into(HEADER_FORMAT, self.shm.buf, 0, 0, slots, slot_size, consumers, 0)
+      for i in range(consumers):
+        _u64.pack_into(self.shm.buf, HEADER_SIZE + 8 * i, INVALID)
+      for n in range(slots):
+        _slot.pack_into(self.shm.buf, self.slot_offset(n), INVALID, 0, 0)
+    else:
+      self.shm = shared_memory.SharedMemory(name=name)
+      self.owner = False
+      _, self.slots, self.slot_size, self.consumers, _ = struct.unpack_from(HEADER_FORMAT, self.shm.buf, 0)
+    self.buf = self.shm.buf
+    self.name = self.shm.name
+    self.waits = 0
+    self.known_slowest = 0
+
+  def slot_offset(self, n):
+    return HEADER_SIZE + 8 * self.consumers + (n % self.slots) * (SLOT_HEADER_SIZE + self.slot_size)
+
+  def head(self):
+    return _u64.unpack_from(self.buf, 0)[0]
+
+  def consumer_position(self, index):
+    return _u64.unpack_from(self.buf, HEADER_SIZE + 8 * index)[0]
+
+  # the oldest sequence an attached consumer still has to read
+  def slowest(self):
+    positions = [p for p in struct.unpack_from('<%dQ' % (self.consumers), self.buf, HEADER_SIZE) if p != INVALID]
+    return min(positions) if positions else None
+
+  # producer side, messages larger than a slot are split
+  def put(self, msg, stamp=0):
+    size = self.slot_size
+    if len(msg) <= size:
+      self._put(msg, stamp)
+    else:
+      view = memoryview(msg)
+      for start in range(0, len(msg), size):
+        self._put(view[start:start + size], stamp)
+
+  def _put(self, msg, stamp):
+    buf = self.buf
+    head = _u64.unpack_from(buf, 0)[0]
+    # consumers only move forward, the last position seen is checked first
+    # and the shared ones are read only when the ring looks full
+    if self.lossless and head - self.known_slowest >= self.slots:
+      slowest = self.slowest()
+      while slowest is not None and head - slowest >= self.slots:
+        self.waits += 1
+        time.sleep(0.0001)
+        slowest = self.slowest()
+      self.known_slowest = head if slowest is None else slowest
+    offset = self.slot_offset(head)
+    _slot.pack_into(buf, offset, INVALID, len(msg), stamp)
+    start = offset + SLOT_HEADER_SIZE
+    buf[start:start + len(msg)] = msg
+    _u64.pack_into(buf, offset, head)
+    _u64.pack_into(buf, 0, head + 1)
+
+  def reader(self, index):
+    return RingReader(self, index)
+
+  def close(self):
+    self.buf = None
+    self.shm.close()
+    if self.owner:
+      self.shm.unlink()
+
+################## Fim da classe ShmRing ################################
+
+
+################# Classe RingReader ########################################
+# consumer with a fixed index, it starts at the newest message when attached
+class RingReader:
+  def __init__(self, ring, index):
+    if index >= ring.consumers:
+      raise ValueError('the ring has only %d consumers' % (ring.consumers))
+    self.ring = ring
+    self.index = index
+    self.position_offset = HEADER_SIZE + 8 * index
+    self.sequence = ring.head()
+    self.lost = 0
+    _u64.pack_into(ring.buf, self.position_offset, self.sequence)
+
+  def pending(self):
+    return self.ring.head() - self.sequence
+
+  # up to limit messages as bytes, the messages overwritten before they were
+  # read are counted in lost. The stamps of the messages are appended to
+  # stamps when it is a list
+  def read(self, limit=1024, stamps=None):
+    ring = self.ring
+    buf = ring.buf
+    head = _u64.unpack_from(buf, 0)[0]
+    if head - self.sequence > ring.slots:
+      # the producer went around the ring, skip to the oldest slot left
+      self.lost += head - ring.slots - self.sequence
+      self.sequence = head - ring.slots
+    msgs = []
+    sequence = self.sequence
+    stop = min(head, sequence + limit)
+    while sequence < stop:
+      offset = ring.slot_offset(sequence)
+      seq, length, stamp = _slot.unpack_from(buf, offset)
+      if seq != sequence:
+        # overwritten (or being written) by a newer message
+        self.lost += 1
+        sequence += 1
+        continue
+      start = offset + SLOT_HEADER_SIZE
+      msg = bytes(buf[start:start + length])
+      if _u64.unpack_from(buf, offset)[0] != sequence:
+        self.lost += 1
+      else:
+        msgs.append(msg)
+        if stamps is not None:
+          stamps.append(stamp)
+      sequence += 1
+    self.sequence = sequence
+    _u64.pack_into(buf, self.position_offset, sequence)
+    return msgs
+
+  def detach(self):
+    _u64.pack_into(self.ring.buf, self.position_offset, INVALID)
+
+################## Fim da classe RingReader ################################
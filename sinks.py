@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Decode once, fan out to many sinks
+#  the packages of each serial read go to the sinks as one batch. When a
+#  sink wants typed records the batch is decoded once with the schema
+#  (struct.iter_unpack) and every such sink gets the same tuples, the other
+#  sinks get the raw packages:
+#    raw: the binary file, the TCP and UDP servers
+#    decoded: a CSV file, a JSON lines TCP stream
+#  A sink is called once per batch, so adding one costs its own output and
+#  not another pass of decoding. A sink has a decoded attribute and the
+#  methods write(stamp, frames, records), tick() (called after every read,
+#  also the empty ones) and close().
+########################################################
+
+import os
+import time
+from math import isfinite
+
+# string fields are shown as hex in the text sinks, the floats with the
+# digits that give back the same value at their size (twice as fast as repr)
+TEXT_FORMATS = {'i': '%d', 'u': '%d', 'b': '%d', 'S': '%s'}
+FLOAT_FORMATS = {2: '%.5g', 4: '%.9g', 8: '%.17g'}
+
+
+# per record format of the fields of schema for CSV or JSON lines, and
+# whether the records must have their bytes turned into text first, floats
+# replaces the format of the float fields
+def record_format(schema, json=False, floats=None):
+  fields = []
+  for name in schema.names:
+    field = schema.dtype.fields[name][0]
+    kind = field.kind
+    if kind == 'f':
+      text = floats or FLOAT_FORMATS[field.itemsize]
+    else:
+      text = TEXT_FORMATS[kind]
+    if json:
+      text = '"%s":%s' % (name, '"%s"' if kind == 'S' else text)
+    fields.append(text)
+  has_bytes = any(schema.dtype.fields[name][0].kind == 'S' for name in schema.names)
+  if json:
+    return '{"timestamp":%d,' + ','.join(fields) + '}\n', has_bytes
+  return '%d,' + ','.join(fields) + '\n', has_bytes
+
+
+def bytes_to_text(record):
+  return tuple(v.hex() if isinstance(v, bytes) else v for v in record)
+
+
+# JSON has no nan nor infinity: the float fields (their indexes and formats)
+# of a record as text, null for the values that are not finite
+def finite_floats(record, floats):
+  record = list(record)
+  for n, text in floats:
+    value = record[n]
+    record[n] = text % (value) if isfinite(value) else 'null'
+  return tuple(record)
+
+
+################# Classe Decoder ########################################
+# typed records of the packages of a batch, the packages of another size
+# than the schema are not decoded and are counted in mismatched
+class Decoder:
+  def __init__(self, schema):
+    self.schema = schema
+    self.size = schema.size
+    self.records = 0
+    self.mismatched = 0
+
+  def decode(self, frames):
+    size = self.size
+    buffer = b''.join(frames)
+    if len(buffer) != size * len(frames):
+      good = [f for f in frames if len(f) == size]
+      self.mismatched += len(frames) - len(good)
+      buffer = b''.join(good)
+    records = list(self.schema.unpack(buffer))
+    self.records += len(records)
+    return records
+
+################## Fim da classe Decoder ################################
+
+
+################# Classe BinarySink ########################################
+# raw packages to a BinaryWriter, IndexedWriter or SegmentWriter, which stays
+# owned by the caller
+class BinarySink:
+  decoded = False
+
+  def __init__(self, writer):
+    self.writer = writer
+
+  def write(self, stamp, frames, records):
+    write = self.writer.write
+    for data in frames:
+      write(data, stamp)
+
+  # the writer flushes after flush_ms also when no package arrives
+  def tick(self):
+    self.writer.tick()
+
+  def close(self):
+    pass
+
+################## Fim da classe BinarySink ################################
+
+
+################# Classe ServerSink ########################################
+# raw packages to a TCP or UDP server, one message per package
+class ServerSink:
+  decoded = False
+
+  def __init__(self, server):
+    self.server = server
+
+  def write(self, stamp, frames, records):
+    if self.server.is_alive():
+      add = self.server.add_message
+      for data in frames:
+        add(data, stamp)
+
+  def tick(self):
+    pass
+
+  def close(self):
+    pass
+
+################## Fim da classe ServerSink ################################
+
+
+################# Classe CSVSink ########################################
+# decoded packages to a CSV file, one line per package with the receive time
+# flush_ms: write the buffer to the disk every N milliseconds (0 disables)
+class CSVSink:
+  decoded = True
+
+  def __init__(self, filename, schema, flush_ms=1000, buffer_size=1 << 20):
+    self.filename = filename
+    self.flush_ms = flush_ms
+    self.format, self.has_bytes = record_format(schema)
+    self.file = open(filename, 'w', buffering=buffer_size)
+    self.file.write(','.join(('timestamp',) + schema.names) + '\n')
+    self.count = 0
+    self.last_flush = time.monotonic()
+
+  def write(self, stamp, frames, records):
+    if not records:
+      return
+    self.count += len(records)
+    if self.has_bytes:
+      records = map(bytes_to_text, records)
+    line = self.format
+    self.file.write(''.join([line % ((stamp,) + r) for r in records]))
+    self.tick()
+
+  def tick(self):
+    if self.flush_ms and (time.monotonic() - self.last_flush) * 1000 >= self.flush_ms:
+      self.flush()
+
+  def flush(self):
+    if self.file.closed:
+      return
+    self.file.flush()
+    os.fsync(self.file.fileno())
+    self.last_flush = time.monotonic()
+
+  def close(self):
+    if self.file.closed:
+      return
+    self.flush()
+    self.file.close()
+
+################## Fim da classe CSVSink ################################
+
+
+################# Classe JSONLinesSink ########################################
+# decoded packages as JSON lines to the clients of a TCP server, the lines of
+# a batch are sent as one message, a nan or an infinity is sent as null:
+#   {"timestamp":123,"time":1,"x":0.5,"y":2.0}
+class JSONLinesSink:
+  decoded = True
+
+  def __init__(self, server, schema):
+    self.server = server
+    self.format, self.has_bytes = record_format(schema, json=True)
+    fields = [schema.dtype.fields[name][0] for name in schema.names]
+    self.floats = [(n, FLOAT_FORMATS[f.itemsize]) for n, f in enumerate(fields) if f.kind == 'f']
+    # the same line with the floats given as text
+    self.null_format = self.format
+    if self.floats:
+      self.null_format, _ = record_format(schema, json=True, floats='%s')
+
+  def write(self, stamp, frames, records):
+    if not records or not self.server.is_alive():
+      return
+    if self.has_bytes:
+      records = list(map(bytes_to_text, records))
+    line = self.format
+    text = ''.join([line % ((stamp,) + r) for r in records])
+    # a value is only preceded by ':', so a nan or an infinity shows as one
+    # of these, the batch is written again with null for them
+    if self.floats and (':nan' in text or ':inf' in text or ':-inf' in text):
+      floats = self.floats
+      line = self.null_format
+      text = ''.join([line % ((stamp,) + finite_floats(r, floats)) for r in records])
+    self.server.add_message(text.encode(), stamp)
+
+  def tick(self):
+    pass
+
+  def close(self):
+    pass
+
+################## Fim da classe JSONLinesSink ################################
+
+
+################# Classe CallbackSink ########################################
+# every batch to a function of the caller, function(stamp, frames) or, with
+# decoded, function(stamp, records) with the tuples of the schema, so the
+# packages are processed in bulk
+class CallbackSink:
+  def __init__(self, function, decoded=False):
+    self.function = function
+    self.decoded = decoded
+
+  def write(self, stamp, frames, records):
+    self.function(stamp, records if self.decoded else frames)
+
+  def tick(self):
+    pass
+
+  def close(self):
+    pass
+
+################## Fim da classe CallbackSink ################################
+
+
+################# Classe Fanout ########################################
+# the sinks of the acquisition, the batch is decoded only when a sink wants
+# the records
+class Fanout:
+  def __init__(self, schema=None):
+    self.decoder = Decoder(schema) if schema else None
+    self.sinks = []
+    self.decoded = False
+
+  def add(self, sink):
+    if sink.decoded and self.decoder is None:
+      raise ValueError('%s needs a schema' % (type(sink).__name__))
+    self.sinks.append(sink)
+    self.decoded = self.decoded or sink.decoded
+    return sink
+
+  # the packages of one read, all received at stamp
+  def write(self, stamp, frames):
+    records = self.decoder.decode(frames) if self.decoded else None
+    for sink in self.sinks:
+      sink.write(stamp, frames, records)
+
+  def tick(self):
+    for sink in self.sinks:
+      sink.tick()
+
+  def close(self):
+    for sink in self.sinks:
+      sink.close()
+    self.sinks = []
+
+################## Fim da classe Fanout ################################
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Subscriptions of the clients of the TCP servers
+#  a client that only wants part of the stream sends one text line after it
+#  connects, the later lines replace it:
+#    subscribe length=8,12 type=1 offset=0 device=2 every=10 rate=10
+#  length: sizes of the packages it wants
+#  type: values of the byte at offset of the package (default offset=0)
+#  device: values of the first byte, the device number of --devices
+#  every: only 1 of every N packages that pass the filters
+#  rate: at most N packages per second, the newest of each batch
+#  A client that never subscribes (or sends 'subscribe' alone) gets every
+#  package. The filters are applied to a batch of messages at once and the
+#  clients with the same filters share the result, so a client costs its
+#  decimation and not a pass over the batch.
+########################################################
+
+import time
+
+PREFIX = b'subscribe'
+
+
+def parse_values(text):
+  return frozenset(int(v, 0) for v in text.split(',') if v)
+
+
+################# Classe Subscription ########################################
+class Subscription:
+  def __init__(self, lengths=None, types=None, offset=0, devices=None, every=1, rate=0):
+    if every < 1 or rate < 0 or offset < 0:
+      raise ValueError('every must be at least 1, rate and offset not negative')
+    self.lengths = frozenset(lengths) if lengths else None
+    self.types = frozenset(types) if types else None
+    self.offset = offset
+    self.devices = frozenset(devices) if devices else None
+    self.every = every
+    self.period = 1.0 / rate if rate else 0
+    # the clients with the same key share the packages that match
+    self.key = (self.lengths, self.types, offset if self.types else 0, self.devices)
+    self.seen = 0
+    self.next_time = 0.0
+
+  # a subscribe line, raises ValueError when it is not valid
+  @classmethod
+  def parse(cls, line):
+    if isinstance(line, bytes):
+      line = line.decode('ascii', 'replace')
+    words = line.split()
+    if not words or words[0] != PREFIX.decode():
+      raise ValueError('not a subscription: %r' % (line))
+    options = {}
+    for word in words[1:]:
+      name, _, value = word.partition('=')
+      if name in ('length', 'type', 'device'):
+        options[name + 's'] = parse_values(value)
+      elif name in ('offset', 'every'):
+        options[name] = int(value, 0)
+      elif name == 'rate':
+        options[name] = float(value)
+      else:
+        raise ValueError('unknown subscription option: %s' % (name))
+    return cls(**options)
+
+  def everything(self):
+    return self.key == (None, None, 0, None) and self.every == 1 and not self.period
+
+  def matches(self, msg):
+    if self.lengths is not None and len(msg) not in self.lengths:
+      return False
+    if self.devices is not None and (not msg or msg[0] not in self.devices):
+      return False
+    if self.types is not None and (len(msg) <= self.offset or msg[self.offset] not in self.types):
+      return False
+    return True
+
+  # the matched messages of a batch this client gets: 1 of every N, then the
+  # newest one when the rate allows it
+  def select(self, matched, now):
+    if self.every > 1:
+      start = -self.seen % self.every
+      self.seen += len(matched)
+      matched = matched[start::self.every]
+    if self.period and matched:
+      if now < self.next_time:
+        return []
+      if now - self.next_time < self.period:
+        self.next_time += self.period
+      else:
+        self.next_time = now + self.period
+      matched = matched[-1:]
+    return matched
+
+################## Fim da classe Subscription ################################
+
+
+# the messages of a batch for every client, subscriptions maps a client to
+# its Subscription (None: every message)
+def select_messages(msgs, subscriptions, now=None):
+  if now is None:
+    now = time.monotonic()
+  matched = {}
+  selected = {}
+  for client, subscription in subscriptions.items():
+    if subscription is None or subscription.everything():
+      selected[client] = msgs
+      continue
+    key = subscription.key
+    if key not in matched:
+      matched[key] = [m for m in msgs if subscription.matches(m)] if key != (None, None, 0, None) else msgs
+    selected[client] = subscription.select(matched[key], now)
+  return selected
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Batch checksum validation against pslog.check_package
+#  the list, matrix and header candidate paths must give the same answer as
+#  the per frame check on random frames, corrupted or not
+#    $ python -m pytest tests
+########################################################
+
+import os
+import sys
+import random
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pslog
+from frame import encode_frame
+from batch_check import check_frames, check_matrix, check_candidates, check_packages
+
+pslog.verbose = False
+
+
+# frames as given to check_package: header removed, some of them with a bit
+# flipped anywhere in the frame
+def random_frames(count, sizes, corruption=0.2, seed=0):
+  rnd = random.Random(seed)
+  frames = []
+  for _ in range(count):
+    frame = bytearray(encode_frame(bytes(rnd.randrange(256) for _ in range(rnd.choice(sizes))))[2:])
+    if rnd.random() < corruption:
+      frame[rnd.randrange(len(frame))] ^= 1 << rnd.randrange(8)
+    frames.append(bytes(frame))
+  return frames
+
+
+# what check_package says, frames of 2 bytes or less are never valid
+def expected(frames):
+  return np.array([len(f) > 2 and pslog.check_package(bytes(f)) for f in frames], dtype=bool)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_list_matches_check_package(seed):
+  frames = random_frames(2000, list(range(0, 40)), seed=seed)
+  mask = check_frames(frames)
+  assert mask.dtype == bool
+  assert np.array_equal(mask, expected(frames))
+  assert np.array_equal(check_packages(frames), mask)
+
+
+@pytest.mark.parametrize('size', [0, 1, 16, 250])
+def test_matrix_matches_check_package(size):
+  frames = random_frames(1000, [size], seed=size)
+  matrix = np.frombuffer(b''.join(frames), dtype=np.uint8).reshape(len(frames), -1)
+  mask = check_matrix(matrix)
+  assert np.array_equal(mask, expected(frames))
+  assert np.array_equal(check_packages(matrix), mask)
+
+
+def test_empty_list():
+  mask = check_frames([])
+  assert mask.dtype == bool and mask.shape == (0,)
+
+
+def test_short_frames():
+  frames = [b'', b'\x03', b'\x03\x02', bytes(encode_frame(b'')[2:])]
+  assert check_frames(frames).tolist() == [False, False, False, True]
+  assert check_frames(frames[:3]).tolist() == [False, False, False]
+
+
+def test_memoryview_and_bytearray():
+  frames = random_frames(500, [0, 5, 16], seed=7)
+  mask = expected(frames)
+  assert np.array_equal(check_frames([memoryview(f) for f in frames]), mask)
+  assert np.array_equal(check_frames([bytearray(f) for f in frames]), mask)
+  # slices of one buffer, as FrameParser would hand them out
+  data = b''.join(frames)
+  view = memoryview(data)
+  ends = np.cumsum([len(f) for f in frames])
+  assert np.array_equal(check_frames([view[e - len(f):e] for f, e in zip(frames, ends)]), mask)
+
+
+@pytest.mark.parametrize('width', [0, 1, 2])
+def test_narrow_matrix(width):
+  mask = check_matrix(np.zeros((5, width), dtype=np.uint8))
+  assert mask.tolist() == [False] * 5
+  assert check_matrix(np.zeros((0, width), dtype=np.uint8)).shape == (0,)
+
+
+def test_matrix_needs_two_dimensions():
+  with pytest.raises(ValueError):
+    check_matrix(np.zeros(8, dtype=np.uint8))
+
+
+# the checksum masks bit 0 of the xor, so a flipped low bit in the length
+# byte or the data goes unnoticed by every path alike
+def test_low_bit_corruption():
+  frames = []
+  for n, frame in enumerate(random_frames(200, [16], corruption=0, seed=3)):
+    frame = bytearray(frame)
+    frame[n % (len(frame) - 2)] ^= 0x01
+    frames.append(bytes(frame))
+  mask = expected(frames)
+  assert mask.all()
+  assert np.array_equal(check_frames(frames), mask)
+  matrix = np.frombuffer(b''.join(frames), dtype=np.uint8).reshape(len(frames), -1)
+  assert np.array_equal(check_matrix(matrix), mask)
+  # in the checksum bytes the low bit must stay 0
+  broken = [f[:-2] + bytes([f[-2] ^ 0x01, f[-1]]) for f in frames[:10]]
+  assert not check_frames(broken).any() and not expected(broken).any()
+
+
+# each header of a stream of frames, the last one cut, is checked as
+# check_package checks the frame it starts
+def test_candidates_match_check_package():
+  frames = random_frames(300, list(range(0, 30)), seed=11)
+  data = np.frombuffer(b''.join(b'\xff\xff' + f for f in frames)[:-5], dtype=np.uint8)
+  positions = np.flatnonzero((data[:-1] == 0xFF) & (data[1:] == 0xFF))
+  found, lengths, valid, complete = check_candidates(data, positions)
+  assert len(found) == len(lengths) == len(valid) == len(complete)
+  for p, length, ok, whole in zip(found, lengths, valid, complete):
+    buffer = data[p + 2:p + 2 + length].tobytes()
+    assert whole == (p + 2 + length <= len(data))
+    assert ok == (whole and length >= 3 and pslog.check_package(buffer))
+  assert not complete[-1]
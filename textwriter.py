@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+########################################################
+## Streaming text writer for the repeater mode
+#  the bytes are decoded as they arrive with an incremental decoder, so a
+#  character split between two reads is kept until it is complete, and the
+#  text goes to the file through a large buffer
+########################################################
+
+import os
+import time
+import codecs
+
+
+################# Classe TextWriter ########################################
+# encoding: how the received bytes are decoded (latin-1 maps each byte to
+#           one character, as the old byte2str did)
+# flush_ms: write the buffer to the disk every N milliseconds (0 disables)
+class TextWriter:
+  def __init__(self, filename, encoding='latin-1', flush_ms=1000, buffer_size=1 << 20):
+    self.filename = filename
+    self.flush_ms = flush_ms
+    self.decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    self.file = open(filename, 'w', encoding='utf-8', buffering=buffer_size)
+    self.count = 0
+    self.last_flush = time.monotonic()
+
+  # decode and save a chunk, returns the decoded text
+  def write(self, chunk):
+    text = self.decoder.decode(chunk)
+    self.file.write(text)
+    self.count += len(chunk)
+    if self.flush_ms and (time.monotonic() - self.last_flush) * 1000 >= self.flush_ms:
+      self.flush()
+    return text
+
+  def flush(self):
+    if self.file.closed:
+      return
+    self.file.flush()
+    os.fsync(self.file.fileno())
+    self.last_flush = time.monotonic()
+
+  def close(self):
+    if self.file.closed:
+      return
+    self.file.write(self.decoder.decode(b'', final=True))
+    self.flush()
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+################## Fim da classe TextWriter ################################